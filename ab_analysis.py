@@ -0,0 +1,71 @@
+"""
+A/B analyse - CRM Dashboard
+Sammenligner open rate og click rate for alle varianter af samme email
+(kampagne + email/message) parvis. Alle par beregnes samlet som arrays:
+forskel i procentpoint, 95% konfidensinterval og p-værdi (to-sidet z-test
+for to andele).
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+GROUP_KEYS = ['ID_Campaign', 'Email_Message_Base']
+Z_95 = 1.959963984540054
+# Komplementær fejlfunktion fra standardbiblioteket, elementvis over arrays
+erfc = np.vectorize(math.erfc, otypes=[float])
+
+
+def variant_totals(df):
+    """Summer pr. (kampagne, email, variant); rækker uden variant udelades"""
+    frame = df[df['Email_Message_Full'] != df['Email_Message_Base']]
+    totals = frame.groupby(GROUP_KEYS + ['Email_Message_Full'], as_index=False)[
+        ['Total_Received', 'Unique_Opens', 'Unique_Clicks']
+    ].sum()
+    # Variantnavnet er det der står efter "<Email> - <Message> - " (kun på de grupperede rækker)
+    totals['Variant'] = [
+        full[len(base) + 3:] for full, base in zip(totals['Email_Message_Full'], totals['Email_Message_Base'])
+    ]
+    return totals.drop(columns='Email_Message_Full')
+
+
+def compare_proportions(successes_a, n_a, successes_b, n_b):
+    """Forskel (B - A) i procentpoint, 95% CI og p-værdi for arrays af to andele"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p_a = successes_a / n_a
+        p_b = successes_b / n_b
+        diff = p_b - p_a
+        # Konfidensinterval med separate varianser, test med fælles andel
+        se = np.sqrt(p_a * (1 - p_a) / n_a + p_b * (1 - p_b) / n_b)
+        pooled = (successes_a + successes_b) / (n_a + n_b)
+        se_pooled = np.sqrt(pooled * (1 - pooled) * (1 / n_a + 1 / n_b))
+        z = np.where(se_pooled > 0, diff / se_pooled, 0.0)
+    p_value = np.clip(erfc(np.abs(z) / np.sqrt(2)), 0.0, 1.0)
+    return diff * 100, (diff - Z_95 * se) * 100, (diff + Z_95 * se) * 100, p_value
+
+
+def variant_pairs(df):
+    """Alle variantpar pr. email med forskel, CI og p-værdi for open rate og click rate"""
+    totals = variant_totals(df)
+    totals = totals[totals['Total_Received'] > 0]
+    if totals.empty:
+        return pd.DataFrame()
+
+    pairs = totals.merge(totals, on=GROUP_KEYS, suffixes=('_A', '_B'))
+    pairs = pairs[pairs['Variant_A'] < pairs['Variant_B']].reset_index(drop=True)
+    if pairs.empty:
+        return pd.DataFrame()
+
+    n_a = pairs['Total_Received_A'].to_numpy(dtype=float)
+    n_b = pairs['Total_Received_B'].to_numpy(dtype=float)
+    for measure, label in (('Unique_Opens', 'Open'), ('Unique_Clicks', 'Click')):
+        s_a = pairs[f'{measure}_A'].to_numpy(dtype=float)
+        s_b = pairs[f'{measure}_B'].to_numpy(dtype=float)
+        diff, low, high, p_value = compare_proportions(s_a, n_a, s_b, n_b)
+        pairs[f'{label}_Rate_A'] = s_a / n_a * 100
+        pairs[f'{label}_Rate_B'] = s_b / n_b * 100
+        pairs[f'{label}_Diff'] = diff
+        pairs[f'{label}_CI_Low'] = low
+        pairs[f'{label}_CI_High'] = high
+        pairs[f'{label}_P'] = p_value
+    return pairs
@@ -0,0 +1,147 @@
+"""
+Afvigelser i KPI'er - CRM Dashboard
+Rullende middelværdi og standardafvigelse af rater (open, click, unsubscribe,
+bounce) pr. land eller pr. flow og land. Hver udsendelse sammenlignes med de
+foregående `window` udsendelser i samme gruppe. Ved opdateringer genberegnes
+kun halen fra den tidligste ændrede udsendelse.
+
+Konfigureres i secrets:
+    [anomaly]
+    z = 3.0        # grænse for |z-score|
+    window = 20    # antal foregående udsendelser
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Rate -> (tæller, nævner, kort navn til visning)
+NEWSLETTER_RATES = {
+    'Open_Rate': ('Unique_Opens', 'Total_Received', 'open'),
+    'Click_Rate': ('Unique_Clicks', 'Total_Received', 'click'),
+    'Unsub_Rate': ('Unsubscribed', 'Total_Received', 'unsub'),
+}
+FLOW_RATES = {
+    'Open_Rate': ('Unique_Opens', 'Received_Email', 'open'),
+    'Click_Rate': ('Unique_Clicks', 'Received_Email', 'click'),
+    'Unsub_Rate': ('Unsubscribed', 'Received_Email', 'unsub'),
+    'Bounce_Rate': ('Bounced', 'Received_Email', 'bounce'),
+}
+
+
+def month_order(year_month):
+    """Sorterbar værdi for Year_Month ('2025-9' -> 2025*12+9)"""
+    parts = year_month.astype(str).str.split('-', expand=True)
+    return parts[0].astype(int) * 12 + parts[1].astype(int)
+
+
+class RollingAnomalies:
+    """Rullende statistik pr. gruppe over et materialiseret aggregat (se incremental.py)"""
+
+    def __init__(self, keys, group, order_of, rates, window=20, min_periods=5, z=3.0):
+        self.keys = list(keys)
+        self.group = list(group)
+        self.order_of = order_of
+        self.rates = rates
+        self.window = window
+        self.min_periods = min_periods
+        self.z = z
+        self.generation = None
+        self._result = None
+        self._lock = threading.Lock()
+
+    @property
+    def result(self):
+        """keys + en z-score kolonne pr. rate (NaN hvor historikken er for kort)"""
+        return self._result if self._result is not None else pd.DataFrame(columns=self.keys)
+
+    def _compute(self, frame):
+        """z-scores for alle rækker i frame (sorteret efter _order inden for grupperne)"""
+        frame = frame.sort_values(self.group + ['_order'], kind='stable')
+        result = frame[self.keys + ['_order']].copy()
+        grouped_keys = [frame[g] for g in self.group]
+        for rate, (numerator, denominator, _) in self.rates.items():
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = pd.Series(
+                    np.where(frame[denominator] > 0, frame[numerator] / frame[denominator] * 100, np.nan),
+                    index=frame.index,
+                )
+            # Statistik over de foregående udsendelser (den aktuelle indgår ikke)
+            previous = values.groupby(grouped_keys).shift(1)
+            rolling = previous.groupby(grouped_keys).rolling(self.window, min_periods=self.min_periods)
+            mean = rolling.mean().reset_index(level=list(range(len(self.group))), drop=True)
+            std = rolling.std().reset_index(level=list(range(len(self.group))), drop=True)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result[rate] = ((values - mean) / std).where(std > 0)
+        return result
+
+    def update(self, generation, frame, changes=None, previous_generation=None):
+        """
+        Opdater til aggregatets generation. Står detektoren på generationen lige
+        før (previous_generation) og kendes changes, genberegnes kun halen fra
+        den tidligste ændrede udsendelse; ellers regnes alt forfra.
+        """
+        with self._lock:
+            if generation == self.generation:
+                return self.result
+            if frame.empty:
+                self._result, self.generation = None, generation
+                return self.result
+            frame = frame.assign(_order=self.order_of(frame))
+
+            incremental = (
+                self._result is not None and changes is not None
+                and previous_generation is not None and previous_generation == self.generation
+            )
+            changed = list(changes.inserted | changes.updated | changes.deleted) if incremental else []
+            if incremental and not changed:
+                self.generation = generation
+                return self.result
+
+            if incremental:
+                changed_frame = pd.DataFrame(changed, columns=self.keys)
+                cutoff = self.order_of(changed_frame).min()
+                head = frame[frame['_order'] < cutoff]
+                # De sidste `window` udsendelser før cutoff pr. gruppe giver konteksten til halen
+                context = head.sort_values('_order', kind='stable').groupby(self.group).tail(self.window)
+                tail = self._compute(pd.concat([context, frame[frame['_order'] >= cutoff]]))
+                tail = tail[tail['_order'] >= cutoff]
+                kept = self._result[self._result['_order'] < cutoff]
+                self._result = pd.concat([kept, tail], ignore_index=True)
+            else:
+                self._result = self._compute(frame).reset_index(drop=True)
+
+            self.generation = generation
+            return self._result
+
+    def flagged(self, result):
+        """Rækker hvor mindst én rate afviger mere end z, med en tekst som 'open↓ bounce↑'"""
+        rate_columns = list(self.rates)
+        z_values = result[rate_columns]
+        mask = (z_values.abs() > self.z).any(axis=1)
+        flagged = result[mask].copy()
+        labels = pd.Series('', index=flagged.index, dtype=object)
+        for rate in rate_columns:
+            short = self.rates[rate][2]
+            z = flagged[rate]
+            label = np.select([z > self.z, z < -self.z], [f"{short}↑", f"{short}↓"], '')
+            separator = np.where((labels != '') & (label != ''), ' ', '')
+            labels = labels + separator + label
+        flagged['Afvigelse'] = labels
+        return flagged
+
+    def warning(self, flagged, rate, label):
+        """Tekst til et KPI-kort hvis nogen af de afvigende rækker afviger på denne rate"""
+        hits = flagged[flagged[rate].abs() > self.z]
+        if hits.empty:
+            return None
+        countries = ', '.join(sorted(hits['Country'].unique()))
+        return f"{len(hits)} udsendelser med afvigende {label} (|z| > {self.z:g}): {countries}"
+
+
+def summarize_flags(flagged, keys):
+    """Saml 'DK open↓'-tekster pr. række i en visningstabel (keys uden land)"""
+    if flagged.empty:
+        return pd.DataFrame(columns=keys + ['Afvigelse'])
+    labeled = flagged.assign(Afvigelse=flagged['Country'] + ' ' + flagged['Afvigelse'])
+    return labeled.groupby(keys, as_index=False)['Afvigelse'].agg(', '.join)
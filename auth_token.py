@@ -0,0 +1,54 @@
+"""
+Signerede login-tokens - CRM Dashboard
+Login-cookien er et token med udløbstid, signeret med HMAC-SHA256. Serveren
+kan verificere det direkte fra requestets cookies ved første kørsel af
+scriptet, uden en rundtur gennem en komponent i browseren.
+
+Format: v1.<udløb (unix tid)>.<nonce>.<signatur>
+
+Nøglen tages fra [auth] secret i secrets. Uden den afledes den af PASSWORD,
+så et nyt kodeord ugyldiggør alle udstedte tokens.
+"""
+import hashlib
+import hmac
+import secrets
+import time
+
+VERSION = 'v1'
+
+
+def derive_key(auth_config, password):
+    """Signeringsnøgle fra [auth] secret, ellers afledt af kodeordet"""
+    secret = auth_config.get("secret") or f"crm-dashboard:{password}"
+    return hashlib.sha256(secret.encode()).digest()
+
+
+def _signature(key, payload):
+    return hmac.new(key, payload.encode(), hashlib.sha256).hexdigest()
+
+
+def issue_token(key, ttl_seconds, now=None):
+    """Nyt token der udløber om ttl_seconds"""
+    expires = int((now if now is not None else time.time()) + ttl_seconds)
+    payload = f"{VERSION}.{expires}.{secrets.token_hex(8)}"
+    return f"{payload}.{_signature(key, payload)}"
+
+
+def verify_token(key, token, now=None):
+    """Udløbstiden hvis token er gyldigt og ikke udløbet, ellers None"""
+    if not token:
+        return None
+    parts = token.split('.')
+    if len(parts) != 4 or parts[0] != VERSION:
+        return None
+    payload, signature = '.'.join(parts[:3]), parts[3]
+    # Som bytes: cookien kommer fra klienten og kan indeholde ikke-ASCII tegn
+    if not hmac.compare_digest(signature.encode(), _signature(key, payload).encode()):
+        return None
+    try:
+        expires = int(parts[1])
+    except ValueError:
+        return None
+    if expires <= (now if now is not None else time.time()):
+        return None
+    return expires
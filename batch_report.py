@@ -0,0 +1,181 @@
+"""
+Batch KPI-rapport - CRM Dashboard
+Kører Newsletter-, Flow- og Subscriber-pipelines uden Streamlit og skriver
+månedlige KPI-pakker pr. land (plus en samlet "ALL" pakke).
+
+Eksempler:
+    python batch_report.py --source exports/ --out reports/ --formats csv,parquet,html
+    python batch_report.py --secrets .streamlit/secrets.toml --out reports/ --months 2025-11 2025-12
+
+Med --source læses CSV-eksporter fra en lokal mappe (newsletter/, flows/All_Flow.csv,
+subscribers/Full_Subscribers.csv ...), så rapporten kan køre offline fra cron.
+"""
+import argparse
+import os
+import sys
+import tomllib
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import pipeline
+from pipeline import COUNTRIES, LOCAL_FOLDERS, LocalSheetsClient, add_rates, aggregate_to_flow_level, open_client
+from sheets_governor import governor_from_config
+
+FORMATS = ('csv', 'parquet', 'html')
+
+
+def newsletter_monthly(nl_df):
+    """Newsletter KPI'er pr. måned"""
+    if nl_df.empty:
+        return pd.DataFrame()
+    monthly = nl_df.assign(Month=nl_df['Date'].dt.strftime('%Y-%m')).groupby('Month', as_index=False).agg({
+        'Total_Received': 'sum',
+        'Unique_Opens': 'sum',
+        'Unique_Clicks': 'sum',
+        'Unsubscribed': 'sum',
+    })
+    return add_rates(monthly, 'Total_Received').sort_values('Month')
+
+
+def flows_monthly(flows_df):
+    """Flow KPI'er pr. måned og Flow - Trigger"""
+    if flows_df.empty:
+        return pd.DataFrame()
+    flow_df = aggregate_to_flow_level(flows_df)
+    monthly = flow_df.groupby(['Year_Month', 'Flow_Trigger'], as_index=False).agg({
+        'Received_Email': 'sum',
+        'Unique_Opens': 'sum',
+        'Unique_Clicks': 'sum',
+        'Unsubscribed': 'sum',
+        'Bounced': 'sum',
+    })
+    monthly = add_rates(monthly, 'Received_Email')
+    # Sorter måneder kronologisk (2025-9 før 2025-10)
+    return monthly.sort_values(
+        ['Year_Month', 'Flow_Trigger'],
+        key=lambda s: pd.to_datetime(s, format='%Y-%m') if s.name == 'Year_Month' else s,
+    )
+
+
+def subscribers_monthly(full_df, light_df, country_col):
+    """Full/Light subscribers pr. måned for én landekolonne (eller 'Total')"""
+    frames = {}
+    for name, df in (('Full', full_df), ('Light', light_df)):
+        if not df.empty and country_col in df.columns:
+            frames[name] = df.set_index(df['Month'].dt.strftime('%Y-%m'))[country_col]
+    if not frames:
+        return pd.DataFrame()
+    monthly = pd.DataFrame(frames).fillna(0).astype(int)
+    monthly['Total'] = monthly.sum(axis=1)
+    return monthly.rename_axis('Month').reset_index().sort_values('Month')
+
+
+def build_country_pack(country, nl_df, flows_df, full_df, light_df, out_dir, formats):
+    """Beregn og skriv én KPI-pakke (kører i en worker-proces)"""
+    tables = {
+        'newsletters_monthly': newsletter_monthly(nl_df),
+        'flows_monthly': flows_monthly(flows_df),
+        'subscribers_monthly': subscribers_monthly(full_df, light_df, 'Total' if country == 'ALL' else country),
+    }
+
+    pack_dir = os.path.join(out_dir, country)
+    os.makedirs(pack_dir, exist_ok=True)
+    written = []
+    for name, table in tables.items():
+        if 'csv' in formats:
+            path = os.path.join(pack_dir, f"{name}.csv")
+            table.to_csv(path, index=False)
+            written.append(path)
+        if 'parquet' in formats:
+            path = os.path.join(pack_dir, f"{name}.parquet")
+            table.to_parquet(path, index=False)
+            written.append(path)
+
+    if 'html' in formats:
+        path = os.path.join(pack_dir, 'report.html')
+        sections = ''.join(
+            f"<h2>{name.replace('_', ' ').title()}</h2>{table.to_html(index=False, float_format='%.2f')}"
+            for name, table in tables.items()
+        )
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"<html><head><meta charset='utf-8'><title>CRM KPI - {country}</title></head>"
+                    f"<body><h1>CRM KPI - {country}</h1>{sections}</body></html>")
+        written.append(path)
+    return written
+
+
+def report_client(args):
+    """Returnerer (client, urls) for enten lokal kilde eller Google Sheets"""
+    if args.source:
+        return LocalSheetsClient(args.source), dict(LOCAL_FOLDERS)
+
+    with open(args.secrets, 'rb') as f:
+        config = tomllib.load(f)
+    gsheets_config = config['connections']['gsheets']
+    return open_client(gsheets_config, governor_from_config(config.get('sheets', {}))), gsheets_config
+
+
+def load_all(args):
+    """Kør de tre pipelines og returner (newsletter, flows, full, light)"""
+    gc, urls = report_client(args)
+    nl_df = pipeline.fetch_newsletter_data(gc, urls['spreadsheet'])
+    flows_df = pipeline.fetch_flows_data(gc, urls['flows_spreadsheet']) if 'flows_spreadsheet' in urls else pd.DataFrame()
+    if 'subscribers_spreadsheet' in urls:
+        full_df, light_df, _ = pipeline.fetch_subscribers_data(gc, urls['subscribers_spreadsheet'])
+    else:
+        full_df, light_df = pd.DataFrame(), pd.DataFrame()
+
+    if args.months:
+        if not nl_df.empty:
+            nl_df = nl_df[nl_df['Date'].dt.strftime('%Y-%m').isin(args.months)]
+        if not flows_df.empty:
+            flows_df = flows_df[pd.to_datetime(flows_df['Year_Month'], format='%Y-%m').dt.strftime('%Y-%m').isin(args.months)]
+        full_df = full_df[full_df['Month'].dt.strftime('%Y-%m').isin(args.months)] if not full_df.empty else full_df
+        light_df = light_df[light_df['Month'].dt.strftime('%Y-%m').isin(args.months)] if not light_df.empty else light_df
+    return nl_df, flows_df, full_df, light_df
+
+
+def country_slice(df, country):
+    if df.empty or country == 'ALL':
+        return df
+    return df[df['Country'] == country]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Skriv månedlige KPI-pakker pr. land")
+    parser.add_argument('--source', help="Mappe med lokale CSV-eksporter (offline kørsel)")
+    parser.add_argument('--secrets', default=os.path.join('.streamlit', 'secrets.toml'),
+                        help="secrets.toml med Google Sheets adgang (bruges uden --source)")
+    parser.add_argument('--out', default='reports', help="Output mappe")
+    parser.add_argument('--formats', default='csv,html', help="Kommasepareret: csv, parquet, html")
+    parser.add_argument('--months', nargs='*', help="Begræns til måneder (YYYY-MM)")
+    parser.add_argument('--countries', nargs='*', default=COUNTRIES + ['ALL'], help="Lande (ALL = samlet)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Antal worker-processer")
+    args = parser.parse_args(argv)
+
+    formats = {f.strip() for f in args.formats.split(',') if f.strip()}
+    unknown = formats - set(FORMATS)
+    if unknown:
+        parser.error(f"Ukendte formater: {', '.join(sorted(unknown))}")
+
+    nl_df, flows_df, full_df, light_df = load_all(args)
+    os.makedirs(args.out, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(
+                build_country_pack, country,
+                country_slice(nl_df, country), country_slice(flows_df, country),
+                full_df, light_df, args.out, formats,
+            )
+            for country in args.countries
+        ]
+        written = [path for future in futures for path in future.result()]
+
+    print(f"Skrev {len(written)} filer til {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Benchmark af parse af All_Flow arket på et syntetisk ark: seriel parse mod
+ParallelIngest med forskelligt antal processer, og get_all_values() mod
+sidevis hentning (StreamingIngest) med simuleret netværksforsinkelse.
+
+    python benchmarks/bench_ingest.py --rows 1000000 --workers 2,4,8
+    python benchmarks/bench_ingest.py --rows 100000 --workers 4 --check   # sammenlign med seriel
+    python benchmarks/bench_ingest.py --rows 200000 --workers 0 --page-rows 20000 --latency 0.5
+
+Peak RSS måles via /proc/self (kun Linux) og nulstilles før hver måling.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pandas as pd  # noqa: E402
+
+from fake_sheets import FakeSheetsClient, synthetic_flow_values  # noqa: E402
+from parallel_ingest import ParallelIngest, StreamingIngest  # noqa: E402
+from pipeline import parse_flows_values  # noqa: E402
+
+
+class SlowWorksheet:
+    """Worksheet med fast forsinkelse pr. kald plus tid pr. række, som et netværkskald"""
+
+    def __init__(self, worksheet, latency, per_row):
+        self._worksheet = worksheet
+        self._latency = latency
+        self._per_row = per_row
+        self.row_count = worksheet.row_count
+
+    def _wait(self, rows):
+        time.sleep(self._latency + self._per_row * len(rows))
+        return rows
+
+    def get_all_values(self):
+        return self._wait(self._worksheet.get_all_values())
+
+    def get_values(self, range_name):
+        return self._wait(self._worksheet.get_values(range_name))
+
+
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float('nan')
+
+
+def timed(func):
+    reset_peak_rss()
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start, peak_rss_mb() - before
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark af parallel og sidevis indlæsning af All_Flow")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--workers', default='2,4,8', help="kommasepareret liste af antal processer (0 = ingen)")
+    parser.add_argument('--chunk-rows', type=int, default=50_000)
+    parser.add_argument('--page-rows', type=int, default=0, help="sammenlign også med sidevis hentning")
+    parser.add_argument('--latency', type=float, default=0.0, help="simuleret sekunder pr. Sheets kald")
+    parser.add_argument('--per-row', type=float, default=0.0, help="simuleret sekunder pr. hentet række")
+    parser.add_argument('--check', action='store_true', help="sammenlign resultatet med seriel parse")
+    args = parser.parse_args(argv)
+
+    values = synthetic_flow_values(args.rows)
+    client = FakeSheetsClient({'flows': {'All_Flow': values}})
+    worksheet = SlowWorksheet(client.open_by_url('flows').worksheet('All_Flow'), args.latency, args.per_row)
+    print(f"Syntetisk ark: {args.rows:,} rækker, {os.cpu_count()} CPU'er")
+
+    serial, serial_time, serial_rss = timed(lambda: parse_flows_values(worksheet.get_all_values()))
+    print(f"{'seriel':>12}: {serial_time:8.2f}s  +{serial_rss:7.0f} MB  {len(serial):,} rækker")
+
+    def report(label, func):
+        result, elapsed, rss = timed(func)
+        print(f"{label:>12}: {elapsed:8.2f}s  +{rss:7.0f} MB  speedup {serial_time / elapsed:5.2f}x")
+        if args.check:
+            pd.testing.assert_frame_equal(serial, result)
+
+    for workers in (int(w) for w in args.workers.split(',') if int(w) >= 2):
+        ingest = ParallelIngest(workers, chunk_rows=args.chunk_rows, min_rows=0)
+        # Start poolen før måling, så det er parse og ikke opstart der tælles
+        ingest.parse(values[:2 + args.chunk_rows * workers], parse_flows_values)
+        report(f"{workers} proc.", lambda: ingest.load(worksheet, parse_flows_values))
+        if args.page_rows:
+            streaming = StreamingIngest(args.page_rows, parallel=ingest)
+            report(f"sider+{workers} p.", lambda: streaming.load(worksheet, parse_flows_values))
+        ingest.shutdown()
+
+    if args.page_rows:
+        streaming = StreamingIngest(args.page_rows)
+        report("sider", lambda: streaming.load(worksheet, parse_flows_values))
+    if args.check:
+        print("Resultaterne er identiske med seriel parse")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark af kold opstart af dashboardet: tid til login-siden og til første
+tegnede tab efter login. Hver måling køres i en frisk Python-proces med
+Streamlit's AppTest (Streamlit selv er importeret før målingen, som i en
+kørende server).
+
+    python benchmarks/bench_startup.py --secrets .streamlit/secrets.toml --runs 5
+
+Brug gerne en secrets-fil med local_source under [connections.gsheets], så
+tiden til første tab ikke afhænger af Google Sheets.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'plotly.graph_objects', 'plotly.subplots', 'gspread', 'google.auth']
+
+# Køres i en ny proces pr. måling
+PROBE = '''
+import json, os, sys, time, tomllib
+os.chdir({root!r})
+sys.path.insert(0, {root!r})
+from streamlit.testing.v1 import AppTest
+
+with open({secrets!r}, 'rb') as f:
+    secrets = tomllib.load(f)
+at = AppTest.from_file('crm_dashboard.py', default_timeout=300)
+for key, value in secrets.items():
+    at.secrets[key] = value
+
+preloaded = set(sys.modules)
+start = time.perf_counter()
+at.run()
+login = time.perf_counter() - start
+loaded = [m for m in {heavy!r} if m in sys.modules and m not in preloaded]
+
+at.session_state['authenticated'] = True
+start = time.perf_counter()
+at.run()
+first_tab = time.perf_counter() - start
+print(json.dumps({{'login': login, 'first_tab': first_tab, 'loaded_at_login': loaded,
+                  'exception': [str(e.value) for e in at.exception]}}))
+'''
+
+
+def measure(secrets):
+    probe = PROBE.format(root=os.path.abspath(ROOT), secrets=os.path.abspath(secrets), heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark af kold opstart (login-side og første tab)")
+    parser.add_argument('--secrets', default=os.path.join(ROOT, '.streamlit', 'secrets.toml'))
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = [measure(args.secrets) for _ in range(args.runs)]
+    for result in results:
+        if result['exception']:
+            print("Fejl i appen:", result['exception'])
+    login = [r['login'] for r in results]
+    first_tab = [r['first_tab'] for r in results]
+    print(f"Login-side:   median {statistics.median(login) * 1000:7.0f} ms  (min {min(login) * 1000:.0f} ms)")
+    print(f"Første tab:   median {statistics.median(first_tab) * 1000:7.0f} ms  (min {min(first_tab) * 1000:.0f} ms)")
+    print("Tunge moduler importeret af appen ved login:", ', '.join(results[-1]['loaded_at_login']) or 'ingen')
+
+
+if __name__ == '__main__':
+    main()
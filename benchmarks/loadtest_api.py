@@ -0,0 +1,100 @@
+"""
+Load-test af KPI API'et.
+Sender requests fra N tråde med keep-alive i et fast tidsrum og rapporterer
+requests/sekund og latency-percentiler.
+
+    python benchmarks/loadtest_api.py --url http://127.0.0.1:8502 --threads 16 --duration 10
+    python benchmarks/loadtest_api.py --url http://127.0.0.1:8502 --etag   # test 304-stien
+"""
+import argparse
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = [
+    '/newsletters',
+    '/newsletters?country=DK,SE',
+    '/flows',
+    '/flows?country=DK',
+    '/subscribers',
+]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def worker(host, port, paths, stop_at, use_etag, latencies, errors, offset):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    etags = {}
+    i = offset
+    while time.perf_counter() < stop_at:
+        path = paths[i % len(paths)]
+        i += 1
+        headers = {'If-None-Match': etags[path]} if use_etag and path in etags else {}
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors.append(path)
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+        if response.status not in (200, 304):
+            errors.append(path)
+        elif response.getheader('ETag'):
+            etags[path] = response.getheader('ETag')
+    conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test af KPI API")
+    parser.add_argument('--url', default='http://127.0.0.1:8502')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--etag', action='store_true', help="Send If-None-Match med seneste ETag")
+    parser.add_argument('--path', action='append', dest='paths', help="Sti der skal testes (kan gentages)")
+    args = parser.parse_args(argv)
+
+    url = urlsplit(args.url)
+    paths = args.paths or DEFAULT_PATHS
+
+    # Varm cachen op, så første hentning fra Sheets ikke tæller med
+    for path in paths:
+        conn = http.client.HTTPConnection(url.hostname, url.port, timeout=300)
+        conn.request('GET', path)
+        conn.getresponse().read()
+        conn.close()
+
+    latencies, errors = [], []
+    stop_at = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(url.hostname, url.port, paths, stop_at, args.etag, latencies, errors, n))
+        for n in range(args.threads)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    total = len(latencies)
+    print(f"Requests:   {total} ({len(errors)} fejl)")
+    print(f"Throughput: {total / args.duration:.0f} req/s med {args.threads} tråde")
+    if latencies:
+        print(f"Latency ms: p50={percentile(latencies, 50) * 1000:.1f} "
+              f"p95={percentile(latencies, 95) * 1000:.1f} "
+              f"p99={percentile(latencies, 99) * 1000:.1f} "
+              f"mean={statistics.mean(latencies) * 1000:.1f}")
+
+
+if __name__ == '__main__':
+    main()
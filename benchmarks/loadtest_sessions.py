@@ -0,0 +1,234 @@
+"""
+Load-test af dashboardet med mange samtidige sessioner.
+N sessioner kører i hver sin tråd i én proces (som i streamlit-serveren, hvor
+sessionerne deler cache_resource og den delte datasæt-cache) via Streamlit's
+AppTest. Hver session klikker et fast script af filtre igennem på tværs af
+Newsletters, Flows og Subscribers. Data kommer fra en falsk gspread backend
+(fake_sheets.py) med lokale CSV-eksporter og en fast forsinkelse pr. kald.
+
+    python benchmarks/loadtest_sessions.py --source exports/ --sessions 50 --iterations 3 --latency 0.3
+    python benchmarks/loadtest_sessions.py --secrets .streamlit/secrets.toml --sessions 20 --think 0.5
+
+Rapporterer latency (p50/p95/p99) pr. kørsel af scriptet - samlet og pr.
+interaktion - peak RSS (kun Linux) og antal kald til den falske backend.
+Secrets (fx [result_cache], [ingest], [engine]) læses fra --secrets; den delte
+cache er altid i hukommelsen og tom fra start, så alle hentninger tælles med.
+"""
+import argparse
+import collections
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tomllib
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import streamlit as st  # noqa: E402
+from streamlit.runtime import Runtime  # noqa: E402
+from streamlit.runtime.secrets import Secrets  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+from streamlit.testing.v1 import app_test  # noqa: E402
+
+import shared  # noqa: E402
+from fake_sheets import FakeSheetsClient, load_csv_source  # noqa: E402
+from pipeline import LOCAL_FOLDERS, local_folders  # noqa: E402
+from sheets_governor import GovernedClient  # noqa: E402
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float('nan')
+
+
+# --- Interaktioner ---
+def widget(elements, key_prefix):
+    """Widget hvis key starter med key_prefix (checkbox-keys har et suffiks der skifter ved nulstilling)"""
+    for element in elements:
+        if element.key and element.key.startswith(key_prefix):
+            return element
+    raise LookupError(f"Ingen widget med key {key_prefix}*")
+
+
+def next_option(element):
+    if hasattr(element, 'select_index'):
+        element.select_index((element.index + 1) % len(element.options))
+    else:
+        element.set_value(element.options[(element.index + 1) % len(element.options)])
+
+
+def toggle(element):
+    element.set_value(not element.value)
+
+
+def toggle_nth(elements, key_prefix, n):
+    matching = [element for element in elements if element.key and element.key.startswith(key_prefix)]
+    toggle(matching[n % len(matching)])
+
+
+# (tab, interaktion, funktion der ændrer widgets før næste kørsel)
+SCRIPT = [
+    ('newsletters', 'periode', lambda at: next_option(widget(at.selectbox, 'nl_preset'))),
+    ('newsletters', 'land', lambda at: toggle(widget(at.checkbox, 'nl_cb_land_DK_'))),
+    ('newsletters', 'visning', lambda at: next_option(widget(at.radio, 'nl_chart_view'))),
+    ('flows', 'måned', lambda at: toggle_nth(at.checkbox, 'fl_cb_month_', 1)),
+    ('flows', 'land', lambda at: toggle(widget(at.checkbox, 'fl_cb_land_SE_'))),
+    ('flows', 'drill-down', lambda at: next_option(widget(at.selectbox, 'fl_drill_flow'))),
+    ('subscribers', 'master source', lambda at: next_option(widget(at.selectbox, 'sub_master_source'))),
+    ('subscribers', 'mål', lambda at: next_option(widget(at.selectbox, 'sub_growth_metric'))),
+    ('subscribers', 'type', lambda at: next_option(widget(at.radio, 'sub_growth_tier'))),
+]
+
+
+# --- Sessioner ---
+class _KeepFirstInstance(type):
+    """Runtime._instance sættes kun første gang og nulstilles aldrig"""
+
+    def __setattr__(cls, name, value):
+        if name == '_instance':
+            if value is not None and Runtime._instance is None:
+                Runtime._instance = value
+            return
+        super().__setattr__(name, value)
+
+
+class SharedRuntime(Runtime, metaclass=_KeepFirstInstance):
+    pass
+
+
+def install_globals(secrets):
+    """
+    AppTest sætter st.secrets og Runtime-instansen ved start af hver kørsel og
+    nulstiller dem bagefter - det holder ikke med samtidige kørsler. Secrets
+    sættes i stedet én gang for processen, og alle kørsler deler den første
+    runtime (som sessionerne i en rigtig server).
+    """
+    st.secrets = Secrets()
+    st.secrets._secrets = secrets
+    app_test.Runtime = SharedRuntime
+    # Sessionstrådene sætter session_state uden for en scriptkørsel
+    logging.getLogger('streamlit.runtime.scriptrunner_utils.script_run_context').setLevel(logging.ERROR)
+
+
+def run_session(number, args, results, errors, start_barrier):
+    rng = random.Random(args.seed + number)
+    at = AppTest.from_file(os.path.join(os.path.abspath(ROOT), 'crm_dashboard.py'), default_timeout=args.timeout)
+    at.session_state['authenticated'] = True
+    start_barrier.wait()
+    time.sleep(rng.uniform(0, args.ramp))
+
+    def timed_run(tab, interaction):
+        start = time.perf_counter()
+        at.run()
+        elapsed = time.perf_counter() - start
+        if at.exception:
+            errors.append((number, tab, interaction, at.exception[0].value))
+        results.append((tab, interaction, elapsed))
+
+    timed_run('alle', 'første visning')
+    steps = SCRIPT * args.iterations
+    offset = number % len(SCRIPT)
+    for tab, interaction, apply in steps[offset:] + steps[:offset]:
+        if args.think:
+            time.sleep(rng.uniform(0, 2 * args.think))
+        try:
+            apply(at)
+        except (LookupError, IndexError) as e:
+            errors.append((number, tab, interaction, str(e)))
+            continue
+        timed_run(tab, interaction)
+
+
+def load_secrets(args):
+    secrets = {}
+    if args.secrets:
+        with open(args.secrets, 'rb') as f:
+            secrets = tomllib.load(f)
+    gsheets = dict(secrets.get('connections', {}).get('gsheets', {}))
+    source = args.source or gsheets.get('local_source')
+    if not source:
+        raise SystemExit("Angiv --source eller local_source under [connections.gsheets]")
+    # Uden URLs i secrets er spreadsheet "URL'erne" undermapperne i source
+    for key, folder in LOCAL_FOLDERS.items():
+        gsheets.setdefault(key, folder)
+    secrets['connections'] = {**secrets.get('connections', {}), 'gsheets': gsheets}
+    secrets['cache'] = {'backend': 'memory', 'ttl': args.ttl}
+    secrets.setdefault('PASSWORD', 'loadtest')
+    return secrets, source
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test af dashboardet med samtidige sessioner")
+    parser.add_argument('--source', help="Mappe med lokale CSV-eksporter (som local_source)")
+    parser.add_argument('--secrets', help="secrets.toml med øvrig konfiguration")
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=2, help="Gennemløb af interaktions-scriptet pr. session")
+    parser.add_argument('--latency', type=float, default=0.2, help="Sekunder pr. kald til den falske backend")
+    parser.add_argument('--think', type=float, default=0.0, help="Gennemsnitlig pause mellem interaktioner (sekunder)")
+    parser.add_argument('--ramp', type=float, default=1.0, help="Sessionerne starter spredt over så mange sekunder")
+    parser.add_argument('--ttl', type=float, default=300, help="TTL for den delte datasæt-cache")
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    secrets, source = load_secrets(args)
+    sheets = load_csv_source(source)
+    fake = FakeSheetsClient({url: sheets[folder] for url, folder in local_folders(secrets['connections']['gsheets']).items()
+                             if folder in sheets}, latency=args.latency)
+    shared.open_client = lambda gsheets_config, governor=None: GovernedClient(fake, governor)
+    install_globals(secrets)
+
+    results, errors = [], []
+    start_barrier = threading.Barrier(args.sessions + 1)
+    threads = [
+        threading.Thread(target=run_session, args=(n, args, results, errors, start_barrier), name=f'session-{n}')
+        for n in range(args.sessions)
+    ]
+    for t in threads:
+        t.start()
+    rss_before = peak_rss_mb()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    duration = time.perf_counter() - start
+
+    latencies = sorted(elapsed for _, _, elapsed in results)
+    print(f"Sessioner:  {args.sessions} x {args.iterations} gennemløb, {len(results)} kørsler på {duration:.1f} s "
+          f"({len(errors)} fejl)")
+    print(f"Latency ms: p50={percentile(latencies, 50) * 1000:.0f} p95={percentile(latencies, 95) * 1000:.0f} "
+          f"p99={percentile(latencies, 99) * 1000:.0f} max={latencies[-1] * 1000 if latencies else 0:.0f}")
+    by_step = collections.defaultdict(list)
+    for tab, interaction, elapsed in results:
+        by_step[(tab, interaction)].append(elapsed)
+    for tab, interaction in [('alle', 'første visning')] + [(tab, interaction) for tab, interaction, _ in SCRIPT]:
+        values = sorted(by_step.get((tab, interaction), []))
+        if not values:
+            continue
+        print(f"  {tab:12} {interaction:15} n={len(values):4} p50={percentile(values, 50) * 1000:6.0f} "
+              f"p95={percentile(values, 95) * 1000:6.0f} p99={percentile(values, 99) * 1000:6.0f}")
+    print(f"Peak RSS:   {peak_rss_mb():.0f} MB (før sessionerne: {rss_before:.0f} MB)")
+    calls = collections.Counter(method for method, _ in fake.calls)
+    print("Kald til backend:", ', '.join(f"{method}={count}" for method, count in sorted(calls.items())) or 'ingen')
+    for number, tab, interaction, message in errors[:10]:
+        print(f"  Fejl i session {number} ({tab}/{interaction}): {message}")
+
+
+if __name__ == '__main__':
+    main()
@@ -10,19 +10,50 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Nu kan vi importere resten
-import extra_streamlit_components as stx
+# Nu kan vi importere resten (tabs, pandas og plotly importeres først efter login)
 import datetime
 import time
 import os
-from tab_newsletters import render_newsletters_tab
-from tab_subscribers import render_subscribers_tab
-from tab_flows import render_flows_tab
+import uuid
+from auth_token import derive_key, issue_token, verify_token
+from metrics import REGISTRY, ActiveSessions, exporter_from_config, log_event, timer
+
+RUN_STARTED = time.perf_counter()
+
+AUTH_COOKIE = "sinful_auth"
+AUTH_CHECK_SECONDS = REGISTRY.histogram('auth_check_seconds', "Tid brugt på login-tjek pr. kørsel af scriptet")
+AUTH_CHECKS = REGISTRY.counter('auth_checks_total', "Login-tjek fordelt på udfald", ['result'])
+TAB_SECONDS = REGISTRY.histogram('tab_render_seconds', "Tid for at tegne en tab pr. kørsel af scriptet", ['tab'])
+RERUN_SECONDS = REGISTRY.histogram('rerun_seconds', "Samlet tid for en kørsel af scriptet efter login")
+
+
+# --- METRICS ---
+@st.cache_resource
+def start_metrics():
+    """Exporter og JSON-logs startes én gang pr. proces (konfigureres under [metrics] i secrets)"""
+    metrics_config = st.secrets.get("metrics", {})
+    sessions = ActiveSessions(metrics_config.get("session_window", 300))
+    REGISTRY.gauge('active_sessions', "Sessioner med en kørsel inden for session_window sekunder",
+                   function=lambda: [({}, sessions.count())])
+    exporter_from_config(metrics_config)
+    return sessions
+
+
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+start_metrics().touch(session_id)
+
 
 # --- CSS TEMA ---
-css_path = os.path.join(os.path.dirname(__file__), 'style.css')
-with open(css_path) as f:
-    st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+@st.cache_resource
+def load_css():
+    """style.css læses én gang pr. proces"""
+    css_path = os.path.join(os.path.dirname(__file__), 'style.css')
+    with open(css_path) as f:
+        return f'<style>{f.read()}</style>'
+
+
+# Markup skal sendes ved hver kørsel (Streamlit fjerner elementer der ikke gentegnes)
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # JavaScript til checkbox styling
 st.markdown("""
@@ -65,20 +96,29 @@ st.markdown("""
 
 
 # --- LOGIN ---
-def check_password():
-    cookie_manager = stx.CookieManager(key="main_cookie_manager")
-    cookie_val = cookie_manager.get("sinful_auth")
+def auth_key():
+    return derive_key(st.secrets.get("auth", {}), st.secrets["PASSWORD"])
+
 
-    if st.session_state.get("authenticated", False):
+def check_password():
+    # Verificeret token gemmes i sessionen; kun udløbstiden tjekkes ved de følgende kørsler
+    expires = st.session_state.get("auth_expires")
+    if st.session_state.get("authenticated", False) and (expires is None or expires > time.time()):
+        AUTH_CHECKS.inc(result='session')
         return True
 
-    if cookie_val == "true":
+    # Signeret token fra requestets cookies - ingen rundtur gennem en komponent
+    expires = verify_token(auth_key(), st.context.cookies.get(AUTH_COOKIE))
+    if expires is not None:
         st.session_state["authenticated"] = True
+        st.session_state["auth_expires"] = expires
+        AUTH_CHECKS.inc(result='token')
         return True
 
     st.title("CRM Dashboard")
     st.markdown("Log ind")
     
+    login_ok = False
     col1, col2 = st.columns([1, 1])
     with col1:
         with st.form("login_form"):
@@ -87,35 +127,58 @@ def check_password():
 
             if submit_button:
                 if password_input == st.secrets["PASSWORD"]:
-                    st.session_state["authenticated"] = True
-                    try:
-                        expires = datetime.datetime.now() + datetime.timedelta(days=7)
-                        cookie_manager.set("sinful_auth", "true", expires_at=expires)
-                    except Exception:
-                        pass
-                    
+                    login_ok = True
                     st.success("Login godkendt!")
-                    time.sleep(1)
-                    st.rerun()
+                else:
+                    AUTH_CHECKS.inc(result='denied')
+
+    if login_ok:
+        import extra_streamlit_components as stx
+        ttl = datetime.timedelta(days=st.secrets.get("auth", {}).get("token_days", 7))
+        token = issue_token(auth_key(), ttl.total_seconds())
+        st.session_state["authenticated"] = True
+        st.session_state["auth_expires"] = verify_token(auth_key(), token)
+        AUTH_CHECKS.inc(result='login')
+        try:
+            # Cookien kan kun sættes fra browseren; komponenten bruges kun her
+            cookie_manager = stx.CookieManager(key="main_cookie_manager")
+            cookie_manager.set(AUTH_COOKIE, token, expires_at=datetime.datetime.now() + ttl)
+        except Exception:
+            pass
+        time.sleep(1)
+        st.rerun()
+    if not submit_button:
+        # Afviste forsøg er allerede talt som 'denied'
+        AUTH_CHECKS.inc(result='login_page')
     return False
 
 
-if not check_password():
+with timer(AUTH_CHECK_SECONDS):
+    authenticated = check_password()
+if not authenticated:
     st.stop()
 
 
 # --- DASHBOARD ---
+from tab_newsletters import render_newsletters_tab
+from tab_subscribers import render_subscribers_tab
+from tab_flows import render_flows_tab
+
 st.title("CRM Dashboard")
 
 # Tabs
 tab_newsletters, tab_flows, tab_subscribers = st.tabs(["Newsletters", "Flows", "Subscribers"])
 
-with tab_newsletters:
+with tab_newsletters, timer(TAB_SECONDS, tab='newsletters'):
     render_newsletters_tab()
 
-with tab_flows:
+with tab_flows, timer(TAB_SECONDS, tab='flows'):
     render_flows_tab()
 
-with tab_subscribers:
+with tab_subscribers, timer(TAB_SECONDS, tab='subscribers'):
     render_subscribers_tab()
 
+run_seconds = time.perf_counter() - RUN_STARTED
+RERUN_SECONDS.observe(run_seconds)
+log_event('rerun', session=session_id, seconds=round(run_seconds, 3))
+
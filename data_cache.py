@@ -0,0 +1,399 @@
+"""
+Delt datasæt-cache på tværs af processer - CRM Dashboard
+Én proces henter fra Google Sheets, de øvrige replikaer læser resultatet.
+
+Nøgler:
+    meta:<dataset>                 -> JSON med epoch, revision, format og tidspunkt for hentning
+    data:<dataset>:<revision>      -> Arrow IPC fil (DataFrame) eller pickled værdi
+    data:<dataset>:<revision>:<i>  -> Arrow IPC fil nr. i, når værdien er en tuple af DataFrames
+
+Epoch er TTL-vinduet (time // ttl). Revision er en hash af indholdet, så
+uændrede data beholder samme revision på tværs af vinduer.
+
+Hentning sker under en lås pr. datasæt (flock på <dataset>.lock med fil-backend).
+Venter man forgæves på låsen, serveres seneste gode data; findes der ingen,
+ventes der videre, så kun én replika ad gangen henter fra Sheets.
+
+Hver hentning tælles (hit/miss/stale), og rækker og bytes pr. datasæt måles
+(se metrics.py); ages() giver alderen på de data hvert datasæt serveres med.
+
+DataFrames gemmes som ukomprimerede Arrow filer. Med fil-backend memory-mappes
+de read-only, så alle server-processer deler de samme sider i stedet for hver
+at have sin egen kopi; hver proces åbner en revision én gang.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+from metrics import REGISTRY, log_event
+
+logger = logging.getLogger(__name__)
+
+DATASET_REQUESTS = REGISTRY.counter(
+    'dataset_cache_requests_total', "Opslag i datasæt-cachen (hit, miss eller stale)", ['dataset', 'result'])
+DATASET_LOAD_SECONDS = REGISTRY.histogram('dataset_load_seconds', "Tid for hentning og parse af et datasæt", ['dataset'])
+INGESTED_ROWS = REGISTRY.counter('dataset_ingested_rows_total', "Rækker hentet pr. datasæt", ['dataset'])
+INGESTED_BYTES = REGISTRY.counter('dataset_ingested_bytes_total', "Bytes (Arrow) hentet pr. datasæt", ['dataset'])
+
+
+def frames_of(value):
+    """Listen af DataFrames hvis værdien er en DataFrame eller en tuple af DataFrames, ellers None"""
+    if isinstance(value, pd.DataFrame):
+        return [value]
+    if isinstance(value, tuple) and value and all(isinstance(v, pd.DataFrame) for v in value):
+        return list(value)
+    return None
+
+
+def arrow_bytes(df):
+    """DataFrame -> Arrow IPC fil (ukomprimeret, så den kan memory-mappes)"""
+    table = pa.Table.from_pandas(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def arrow_frame(source):
+    """Arrow IPC fil (memory map eller buffer) -> DataFrame uden at kopiere talkolonner"""
+    return pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+
+
+class MemoryCacheBackend:
+    """In-process backend - til tests og til kørsel med én enkelt proces"""
+
+    def __init__(self):
+        self._data = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def path(self, key):
+        return None  # Ingen fil at memory-mappe
+
+    def set(self, key, payload):
+        self._data[key] = payload
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def acquire(self, name, timeout):
+        with self._guard:
+            lock = self._locks.setdefault(name, threading.Lock())
+        return lock.acquire(timeout=timeout)
+
+    def release(self, name):
+        self._locks[name].release()
+
+
+class FileCacheBackend:
+    """Lokalt fil-lager delt mellem processer på samme maskine (eller delt volume)"""
+
+    def __init__(self, directory, poll_interval=0.1):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        # Åbne låsefiler pr. navn (flock holdes så længe filen er åben)
+        self._held = {}
+        self._held_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, suffix='.bin'):
+        safe_key = re.sub(r'[^A-Za-z0-9_.-]', '_', key)
+        return os.path.join(self.directory, safe_key + suffix)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def path(self, key):
+        """Filen bag en nøgle (til memory-mapping), eller None"""
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+    def set(self, key, payload):
+        # Skriv til midlertidig fil og omdøb, så læsere aldrig ser en halv fil
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def acquire(self, name, timeout):
+        """
+        Eksklusiv flock på <name>.lock. Låsen følger den åbne fil, så den holdes
+        uanset hvor lang tid hentningen tager, og slippes af kernen hvis
+        processen dør; låsefilen slettes aldrig (så ville to kunne låse hver sin fil).
+        """
+        deadline = time.monotonic() + timeout
+        fd = os.open(self._path(name, suffix='.lock'), os.O_CREAT | os.O_RDWR)
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    return False
+                time.sleep(self.poll_interval)
+        with self._held_lock:
+            self._held[(name, threading.get_ident())] = fd
+        return True
+
+    def release(self, name):
+        with self._held_lock:
+            fd = self._held.pop((name, threading.get_ident()), None)
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+class SingleFlight:
+    """Højst ét kald i gang pr. nøgle; samtidige kaldere venter og får samme resultat"""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class SharedDatasetCache:
+    """Cache-lag over en backend: kun én replika opdaterer et datasæt ad gangen"""
+
+    def __init__(self, backend, ttl=300, lock_timeout=60, clock=time.time, fallback_errors=()):
+        self.backend = backend
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self._clock = clock
+        # Fejl hvor vi hellere viser seneste gode data end ingen data (fx kvote-deadline)
+        self.fallback_errors = tuple(fallback_errors)
+        self._flight = SingleFlight()
+        # Åbnede Arrow værdier pr. datasæt: (revision, værdi), deles af alle sessioner i processen
+        self._mapped = {}
+        self._mapped_lock = threading.Lock()
+        # Datasæt denne proces har serveret (til ages())
+        self._served = set()
+
+    def epoch(self):
+        """Nuværende TTL-vindue"""
+        return int(self._clock() // self.ttl)
+
+    def _read_meta(self, dataset):
+        raw = self.backend.get(f"meta:{dataset}")
+        return json.loads(raw) if raw is not None else None
+
+    def _part_keys(self, dataset, meta):
+        base = f"data:{dataset}:{meta['revision']}"
+        parts = meta.get('parts')
+        return [base] if parts is None else [f"{base}:{i}" for i in range(parts)]
+
+    def _read_arrow_part(self, key):
+        path = self.backend.path(key)
+        if path is not None:
+            return arrow_frame(pa.memory_map(path, 'r'))
+        payload = self.backend.get(key)
+        return arrow_frame(pa.BufferReader(payload)) if payload is not None else None
+
+    def _read_value(self, dataset, meta):
+        if meta.get('format') != 'arrow':
+            payload = self.backend.get(f"data:{dataset}:{meta['revision']}")
+            return pickle.loads(payload) if payload is not None else None
+
+        with self._mapped_lock:
+            mapped = self._mapped.get(dataset)
+            if mapped is not None and mapped[0] == meta['revision']:
+                return mapped[1]
+            try:
+                frames = [self._read_arrow_part(key) for key in self._part_keys(dataset, meta)]
+            except FileNotFoundError:
+                return None  # Revisionen er lige blevet erstattet af en anden replika
+            if any(frame is None for frame in frames):
+                return None
+            value = frames[0] if meta.get('parts') is None else tuple(frames)
+            self._mapped[dataset] = (meta['revision'], value)
+            return value
+
+    def _read_fresh(self, dataset, epoch):
+        """(revision, værdi) hvis datasættet er hentet i dette vindue, ellers None"""
+        meta = self._read_meta(dataset)
+        if meta is None or meta['epoch'] != epoch:
+            return None
+        value = self._read_value(dataset, meta)
+        return (meta['revision'], value) if value is not None else None
+
+    def _store(self, dataset, epoch, value):
+        frames = frames_of(value)
+        if frames is not None:
+            payloads = [arrow_bytes(frame) for frame in frames]
+            fmt, parts = 'arrow', (None if isinstance(value, pd.DataFrame) else len(payloads))
+        else:
+            payloads = [pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)]
+            fmt, parts = 'pickle', None
+        digest = hashlib.sha1()
+        for payload in payloads:
+            digest.update(payload)
+        revision = digest.hexdigest()[:16]
+        previous = self._read_meta(dataset)
+
+        meta = {'epoch': epoch, 'revision': revision, 'format': fmt, 'parts': parts, 'fetched_at': self._clock(),
+                'rows': sum(len(frame) for frame in frames) if frames is not None else None,
+                'bytes': sum(len(payload) for payload in payloads)}
+        if previous is None or previous['revision'] != revision:
+            for key, payload in zip(self._part_keys(dataset, meta), payloads):
+                self.backend.set(key, payload)
+        self.backend.set(f"meta:{dataset}", json.dumps(meta).encode())
+
+        if previous is not None and previous['revision'] != revision:
+            for key in self._part_keys(dataset, previous):
+                self.backend.delete(key)
+        return meta
+
+    def revision(self, dataset):
+        """
+        Revision (indholds-hash) for det senest gemte datasæt, eller None. Kan
+        være nyere end en værdi man allerede har - brug revisionen fra fetch().
+        """
+        meta = self._read_meta(dataset)
+        return meta['revision'] if meta else None
+
+    def latest(self, dataset):
+        """(revision, værdi) for seneste gode data uanset alder, eller None"""
+        meta = self._read_meta(dataset)
+        value = self._read_value(dataset, meta) if meta else None
+        return (meta['revision'], value) if value is not None else None
+
+    def ages(self):
+        """[({'dataset': navn}, sekunder siden hentning)] for de datasæt processen har serveret"""
+        result = []
+        for dataset in sorted(self._served):
+            meta = self._read_meta(dataset)
+            if meta is not None and 'fetched_at' in meta:
+                result.append(({'dataset': dataset}, max(self._clock() - meta['fetched_at'], 0.0)))
+        return result
+
+    def _load(self, dataset, epoch, loader):
+        start = time.perf_counter()
+        try:
+            value = loader()
+        except self.fallback_errors as e:
+            meta = self._read_meta(dataset)
+            value = self._read_value(dataset, meta) if meta else None
+            if value is None:
+                raise
+            # Forlæng seneste gode data til dette vindue, så andre replikaer ikke også prøver
+            logger.warning("Henting af %s fejlede (%s); bruger data fra revision %s", dataset, e, meta['revision'])
+            meta['epoch'] = epoch
+            self.backend.set(f"meta:{dataset}", json.dumps(meta).encode())
+            log_event('dataset_fallback', logging.WARNING, dataset=dataset, revision=meta['revision'], error=str(e))
+            return meta['revision'], value
+        meta = self._store(dataset, epoch, value)
+        elapsed = time.perf_counter() - start
+        DATASET_LOAD_SECONDS.observe(elapsed, dataset=dataset)
+        INGESTED_ROWS.inc(meta['rows'] or 0, dataset=dataset)
+        INGESTED_BYTES.inc(meta['bytes'], dataset=dataset)
+        log_event('dataset_loaded', dataset=dataset, revision=meta['revision'], rows=meta['rows'],
+                  bytes=meta['bytes'], seconds=round(elapsed, 3))
+        if meta['format'] == 'arrow':
+            # Returner den delte, memory-mappede udgave og slip den private kopi
+            value = self._read_value(dataset, meta)
+        return meta['revision'], value
+
+    def fetch(self, dataset, loader):
+        """
+        Returner (revision, værdi) for nuværende TTL-vindue; kald loader() hvis
+        ingen har hentet det. Revisionen er den værdien er gemt under - alt der
+        afledes af værdien skal nøgles på den, ikke på et nyt opslag i meta.
+        """
+        # Samtidige sessioner i samme proces deler ét opslag/én hentning pr. datasæt
+        return self._flight.do(dataset, lambda: self._fetch(dataset, loader))
+
+    def _fetch(self, dataset, loader):
+        self._served.add(dataset)
+        epoch = self.epoch()
+        fresh = self._read_fresh(dataset, epoch)
+        if fresh is not None:
+            DATASET_REQUESTS.inc(dataset=dataset, result='hit')
+            return fresh
+
+        while not self.backend.acquire(dataset, self.lock_timeout):
+            # Ingen lås inden for timeout: brug seneste gode data frem for at hente selv
+            latest = self.latest(dataset)
+            if latest is not None:
+                DATASET_REQUESTS.inc(dataset=dataset, result='stale')
+                return latest
+            # Kold cache: vent videre på replikaen der henter - aldrig en hentning uden lås
+            log_event('dataset_lock_wait', logging.WARNING, dataset=dataset, seconds=self.lock_timeout)
+
+        try:
+            # En anden replika kan have hentet data mens vi ventede på låsen
+            fresh = self._read_fresh(dataset, epoch)
+            if fresh is None:
+                DATASET_REQUESTS.inc(dataset=dataset, result='miss')
+                return self._load(dataset, epoch, loader)
+            DATASET_REQUESTS.inc(dataset=dataset, result='hit')
+            return fresh
+        finally:
+            self.backend.release(dataset)
+
+
+def cache_from_config(cache_config, fallback_errors=()):
+    """Byg den delte cache ud fra [cache] konfigurationen (samme for dashboard, API og batch)"""
+    if cache_config.get("backend", "file") == "memory":
+        backend = MemoryCacheBackend()
+    else:
+        directory = cache_config.get("directory") or os.path.join(tempfile.gettempdir(), "crm_dashboard_cache")
+        backend = FileCacheBackend(directory)
+
+    return SharedDatasetCache(
+        backend, ttl=cache_config.get("ttl", 300), lock_timeout=cache_config.get("lock_timeout", 60),
+        fallback_errors=fallback_errors,
+    )
@@ -0,0 +1,135 @@
+"""
+Falsk gspread backend - CRM Dashboard
+Efterligner open_by_url / worksheet / get_all_values uden netværk, og kan
+injicere throttling (429), serverfejl og netværksforsinkelse for at teste
+governor, cache og belastning.
+"""
+import csv
+import os
+import random
+import threading
+import time
+
+
+class FakeAPIError(Exception):
+    """Efterligner gspread.exceptions.APIError med en HTTP statuskode"""
+
+    def __init__(self, code, message=""):
+        super().__init__(message or f"HTTP {code}")
+        self.code = code
+
+
+class FakeWorksheet:
+    def __init__(self, client, title, values):
+        self._client = client
+        self.title = title
+        self._values = values
+
+    def get_all_values(self):
+        self._client._record('get_all_values', self.title)
+        return [list(row) for row in self._values]
+
+    @property
+    def row_count(self):
+        return len(self._values)
+
+    def get_values(self, range_name):
+        """Understøtter rækkeintervaller i A1-notation, fx '3:100'"""
+        self._client._record('get_values', self.title)
+        first, last = (int(part) for part in range_name.split(':'))
+        return [list(row) for row in self._values[first - 1:last]]
+
+
+class FakeSpreadsheet:
+    def __init__(self, client, url, worksheets):
+        self._client = client
+        self.url = url
+        self._worksheets = worksheets
+
+    @property
+    def sheet1(self):
+        title = next(iter(self._worksheets))
+        return self.worksheet(title)
+
+    def worksheet(self, title):
+        self._client._record('worksheet', title)
+        return FakeWorksheet(self._client, title, self._worksheets[title])
+
+
+class FakeSheetsClient:
+    """
+    spreadsheets: {url: {worksheet_titel: [[celle, ...], ...]}}
+    failures: liste af statuskoder der kastes (én pr. kald) før kald lykkes
+    latency: sekunder hvert kald venter, som en rundtur til Google
+    """
+
+    def __init__(self, spreadsheets, failures=None, latency=0.0):
+        self._spreadsheets = spreadsheets
+        self._failures = list(failures or [])
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.calls = []
+
+    def inject_failures(self, *codes):
+        with self._lock:
+            self._failures.extend(codes)
+
+    def _record(self, method, target):
+        with self._lock:
+            self.calls.append((method, target))
+            failure = self._failures.pop(0) if self._failures else None
+        if self.latency:
+            time.sleep(self.latency)
+        if failure is not None:
+            raise FakeAPIError(failure)
+
+    def call_count(self, method=None):
+        with self._lock:
+            return sum(1 for m, _ in self.calls if method is None or m == method)
+
+    def open_by_url(self, url):
+        self._record('open_by_url', url)
+        return FakeSpreadsheet(self, url, self._spreadsheets[url])
+
+
+def load_csv_source(directory):
+    """
+    Spreadsheets til FakeSheetsClient fra en mappe med lokale CSV-eksporter
+    (samme layout som local_source: én undermappe pr. spreadsheet, én CSV-fil
+    pr. worksheet). sheet1 er den første fil i alfabetisk rækkefølge.
+    """
+    spreadsheets = {}
+    for url in sorted(os.listdir(directory)):
+        path = os.path.join(directory, url)
+        if not os.path.isdir(path):
+            continue
+        worksheets = {}
+        for name in sorted(n for n in os.listdir(path) if n.endswith('.csv')):
+            with open(os.path.join(path, name), newline='', encoding='utf-8') as f:
+                worksheets[os.path.splitext(name)[0]] = [row for row in csv.reader(f)]
+        spreadsheets[url] = worksheets
+    return spreadsheets
+
+
+def synthetic_flow_values(rows, flows=40, months=24, seed=0):
+    """
+    Et All_Flow ark (2 header-rækker + rows datarækker) med tilfældige tal,
+    formateret som Sheets returnerer dem (tekst, tusindtalsseparator).
+    """
+    rng = random.Random(seed)
+    width = 85 + 7  # Info A-O + 11 lande x 7 mål (CH starter i kolonne CH)
+    values = [['Header'] * width, ['Header'] * width]
+    for i in range(rows):
+        month = f"{2023 + (i // 7) % months // 12}-{(i // 7) % 12 + 1}"
+        flow = i % flows
+        if i % 1000 == 999:
+            month = 'Total'  # Sumrækker afvises af Year_Month valideringen
+        row = [month, 'tag', f"Flow {flow}", f"Trigger {flow % 3}", 'G', f"Mail {i % 5}", 'Msg', ''] + [''] * 7
+        for _ in range(11):
+            received = rng.randint(0, 20000)
+            opens = received * rng.randint(20, 60) // 100
+            clicks = opens * rng.randint(2, 20) // 100
+            row += [f"{received:,}", f"{opens * 2:,}", f"{opens:,}", f"{clicks * 2:,}", f"{clicks:,}",
+                    str(rng.randint(0, 40)), str(rng.randint(0, 80))]
+        values.append(row)
+    return values
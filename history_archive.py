@@ -0,0 +1,181 @@
+"""
+Månedsopdelt historik-arkiv - CRM Dashboard
+Lukkede måneder i Newsletter- og All_Flow-arkene ændrer sig ikke. De skrives
+én gang som Arrow-filer (én pr. måned) og memory-mappes ved læsning; kun de
+åbne måneder hentes og parses igen ved hver opdatering. En læsning åbner kun
+de måneder den spørges om, og rækkerne beskæres i Arrow før de bliver til
+pandas.
+
+Forudsætter at arkene er kronologiske (nye rækker tilføjes nederst). For en
+sikkerheds skyld laves en fuld gen-synkronisering med faste mellemrum.
+
+Manifestet har en hash pr. partition; revision() er en hash af dem, så alt
+der afledes af arkivet genberegnes, når en lukket måned skrives om.
+"""
+import datetime
+import hashlib
+import json
+import os
+import re
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# Tælles op når parse-funktionerne får nye kolonner (eller manifestet nye felter);
+# ældre arkiver synkroniseres forfra
+SCHEMA_VERSION = 3
+
+
+def normalize_month(label):
+    """'2025-9' -> '2025-09' (til sammenligning og sortering)"""
+    year, month = str(label).split('-')[:2]
+    return f"{int(year):04d}-{int(month):02d}"
+
+
+def month_range(start, end):
+    """Månedslabels ('2025-09') fra start til og med end (tom hvis end er før start)"""
+    return list(pd.period_range(pd.Timestamp(start), pd.Timestamp(end), freq='M').strftime('%Y-%m'))
+
+
+def first_open_month(today, open_months):
+    """Første måned der stadig kan ændre sig (nuværende + open_months-1 foregående)"""
+    month_index = today.year * 12 + today.month - 1 - (open_months - 1)
+    return f"{month_index // 12:04d}-{month_index % 12 + 1:02d}"
+
+
+class MonthArchive:
+    """Arkiv med én Arrow-fil pr. (datasæt, måned) og et manifest pr. datasæt"""
+
+    def __init__(self, directory, open_months=2, full_resync_hours=24, clock=time.time):
+        self.directory = directory
+        self.open_months = open_months
+        self.full_resync_hours = full_resync_hours
+        self._clock = clock
+        os.makedirs(directory, exist_ok=True)
+
+    def _dataset_dir(self, dataset):
+        path = os.path.join(self.directory, dataset)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _partition_path(self, dataset, label):
+        safe_label = re.sub(r'[^0-9-]', '_', label)
+        return os.path.join(self._dataset_dir(dataset), f"{safe_label}.arrow")
+
+    def _manifest_path(self, dataset):
+        return os.path.join(self._dataset_dir(dataset), 'manifest.json')
+
+    def manifest(self, dataset):
+        try:
+            with open(self._manifest_path(dataset)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, dataset, manifest):
+        path = self._manifest_path(dataset)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(path + '.tmp', path)
+
+    def months(self, dataset, manifest=None):
+        """Arkiverede (lukkede) måneder for datasættet"""
+        manifest = manifest or self.manifest(dataset)
+        return list(manifest['months']) if manifest else []
+
+    def revision(self, dataset, manifest=None):
+        """Hash af de arkiverede partitioner (ændres når en lukket måned skrives om), eller None"""
+        manifest = manifest or self.manifest(dataset)
+        if not manifest:
+            return None
+        digest = hashlib.sha1(json.dumps(
+            [manifest['schema'], sorted(manifest.get('partitions', {}).items())]
+        ).encode())
+        return digest.hexdigest()[:16]
+
+    def is_sealed(self, label, today=None):
+        today = today or datetime.date.fromtimestamp(self._clock())
+        return normalize_month(label) < first_open_month(today, self.open_months)
+
+    def read_table(self, dataset, months=None, manifest=None):
+        """De arkiverede måneder (alle hvis months er None) som memory-mappet Arrow-tabel, eller None"""
+        archived = self.months(dataset, manifest)
+        if months is not None:
+            wanted = {normalize_month(m) for m in months}
+            archived = [m for m in archived if normalize_month(m) in wanted]
+        tables = [feather.read_table(self._partition_path(dataset, m), memory_map=True) for m in archived]
+        # concat_tables samler kun chunks; intet kopieres
+        return pa.concat_tables(tables) if tables else None
+
+    def read(self, dataset, months=None, manifest=None, where=None):
+        """
+        Læs de arkiverede måneder (alle hvis months er None) som DataFrame.
+        where (et pyarrow.compute udtryk) beskærer rækkerne i Arrow, så kun
+        de udvalgte rækker kopieres til pandas.
+        """
+        table = self.read_table(dataset, months, manifest)
+        if table is None:
+            return pd.DataFrame()
+        if where is not None:
+            table = table.filter(where)
+        return table.to_pandas()
+
+    def _write_partitions(self, dataset, df, month_of, archived):
+        """Skriv partitionerne og returner {måned: hash af filen}"""
+        digests = {}
+        for label, part in df.groupby(month_of(df), sort=False):
+            path = self._partition_path(dataset, label)
+            if label in archived:
+                # Rækker fra en allerede lukket måned (arket var ikke helt kronologisk)
+                part = pd.concat([feather.read_table(path).to_pandas(), part], ignore_index=True)
+            # Ukomprimeret, så filen kan memory-mappes direkte
+            feather.write_feather(part.reset_index(drop=True), path + '.tmp', compression='uncompressed')
+            with open(path + '.tmp', 'rb') as f:
+                digests[label] = hashlib.file_digest(f, 'sha1').hexdigest()[:16]
+            os.replace(path + '.tmp', path)
+        return digests
+
+    def sync(self, dataset, worksheet, header_rows, row_month, parse, month_of):
+        """
+        Synkroniser arkivet mod et worksheet og returner en DataFrame med de åbne måneder.
+
+        row_month(raw_row) -> månedslabel eller None, parse(all_values) -> DataFrame,
+        month_of(df) -> Series med månedslabel pr. række i den parsede frame.
+        Skal kaldes under datasættets lås i den delte cache.
+        """
+        manifest = self.manifest(dataset)
+        now = self._clock()
+        full = (
+            manifest is None or manifest.get('schema') != SCHEMA_VERSION
+            or now - manifest['synced_at'] > self.full_resync_hours * 3600
+        )
+
+        if full:
+            rows = worksheet.get_all_values()[header_rows:]
+            manifest = {'sealed_rows': 0, 'months': [], 'partitions': {}, 'synced_at': now, 'schema': SCHEMA_VERSION}
+        else:
+            # Kun rækkerne efter de lukkede måneder hentes
+            first_row = header_rows + manifest['sealed_rows'] + 1
+            rows = worksheet.get_values(f"{first_row}:{max(first_row, worksheet.row_count)}")
+
+        # Rækker i starten af udsnittet, der hører til måneder som nu er lukkede
+        sealed = 0
+        while sealed < len(rows):
+            label = row_month(rows[sealed])
+            if label is None or not self.is_sealed(label):
+                break
+            sealed += 1
+
+        header = [[] for _ in range(header_rows)]
+        if sealed:
+            sealed_df = parse(header + rows[:sealed])
+            if not sealed_df.empty:
+                digests = self._write_partitions(dataset, sealed_df, month_of, set(manifest['months']))
+                manifest['months'] = sorted(set(manifest['months']) | set(digests), key=normalize_month)
+                manifest['partitions'].update(digests)
+            manifest['sealed_rows'] += sealed
+        self._write_manifest(dataset, manifest)
+
+        return parse(header + rows[sealed:])
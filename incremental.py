@@ -0,0 +1,139 @@
+"""
+Inkrementel vedligeholdelse af aggregater - CRM Dashboard
+Efter hver opdatering sammenlignes det nye snapshot med det forrige række for
+række (via hash). Kun de grupper (fx måned, flow, land), hvor mindst én række
+er tilføjet, ændret eller slettet, genberegnes i det materialiserede aggregat.
+
+Med verify=True sammenlignes resultatet med en fuld genberegning efter hver
+opdatering; ved afvigelse logges en advarsel, den fulde genberegning bruges og
+change set er None (ukendt - brugerne regner alt forfra).
+"""
+import logging
+import threading
+from collections import namedtuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Nøgler (tupler) for grupper der er kommet til, ændret eller forsvundet
+ChangeSet = namedtuple('ChangeSet', ['inserted', 'updated', 'deleted'])
+# Aggregatet som det så ud ved én generation (changes går fra generation - 1)
+AggregateState = namedtuple('AggregateState', ['generation', 'frame', 'changes'])
+
+
+def hash_rows(df, columns):
+    """Et uint64 hash pr. række over de angivne kolonner"""
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+class MaterializedAggregate:
+    """Sum af measures pr. keys, som holdes opdateret ud fra ændrede rækker"""
+
+    def __init__(self, keys, measures, finalize=None, verify=False):
+        self.keys = list(keys)
+        self.measures = list(measures)
+        self.finalize = finalize
+        self.verify = verify
+        self.revision = None
+        self.generation = 0     # Tælles op ved hver ny revision (last_changes går fra generation - 1)
+        self.last_changes = None
+        self._frame = None      # Aggregatet, indekseret på nøgle-hash
+        self._snapshot = None   # Forrige snapshot: nøgle-hash og række-hash
+        self._lock = threading.Lock()
+
+    @property
+    def frame(self):
+        """Det materialiserede aggregat (sorteret på keys som en groupby)"""
+        if self._frame is None:
+            return pd.DataFrame(columns=self.keys + self.measures)
+        return self._frame.reset_index(drop=True)
+
+    def state(self):
+        """generation, frame og last_changes taget samlet under låsen"""
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        return AggregateState(self.generation, self.frame, self.last_changes)
+
+    def _aggregate(self, df):
+        agg_df = df.groupby(self.keys, as_index=False)[self.measures].sum()
+        if self.finalize is not None:
+            agg_df = self.finalize(agg_df)
+        agg_df.index = hash_rows(agg_df, self.keys)
+        return agg_df
+
+    def rebuild(self, df):
+        """Fuld genberegning (bruges første gang og i verify)"""
+        return self._aggregate(df)
+
+    def refresh(self, revision, df):
+        """Opdater aggregatet til en ny revision af datasættet og returner dets AggregateState"""
+        with self._lock:
+            if revision is not None and revision == self.revision:
+                return self._state()
+            self.generation += 1
+            if df.empty:
+                self._frame, self._snapshot = None, None
+                self.revision, self.last_changes = revision, None
+                return self._state()
+
+            snapshot = pd.DataFrame({
+                'key': hash_rows(df, self.keys),
+                'row': hash_rows(df, self.keys + self.measures),
+            })
+
+            if self._frame is None:
+                self._frame = self._aggregate(df)
+                changes = ChangeSet(set(self._frame[self.keys].itertuples(index=False, name=None)), set(), set())
+            else:
+                changes = self._apply(df, snapshot)
+
+            if self.verify and not self._verify(df):
+                changes = None
+
+            self._snapshot = snapshot
+            self.revision, self.last_changes = revision, changes
+            return self._state()
+
+    def _apply(self, df, snapshot):
+        old = self._snapshot
+        # Rækker hvis antal forekomster er ændret (multiset-forskel på række-hash)
+        counts = snapshot['row'].value_counts().sub(old['row'].value_counts(), fill_value=0)
+        changed_rows = counts.index[counts != 0]
+
+        affected = pd.Index(pd.concat([
+            snapshot.loc[snapshot['row'].isin(changed_rows), 'key'],
+            old.loc[old['row'].isin(changed_rows), 'key'],
+        ]).unique())
+        if affected.empty:
+            return ChangeSet(set(), set(), set())
+
+        recomputed = self._aggregate(df[snapshot['key'].isin(affected).to_numpy()])
+        kept = self._frame[~self._frame.index.isin(affected)]
+
+        def key_tuples(frame):
+            return set(frame[self.keys].itertuples(index=False, name=None))
+
+        before = self._frame[self._frame.index.isin(affected)]
+        inserted = key_tuples(recomputed[~recomputed.index.isin(before.index)])
+        deleted = key_tuples(before[~before.index.isin(recomputed.index)])
+        updated = key_tuples(recomputed[recomputed.index.isin(before.index)])
+
+        self._frame = pd.concat([kept, recomputed]).sort_values(self.keys, kind='stable')
+        return ChangeSet(inserted, updated, deleted)
+
+    def _verify(self, df):
+        """True hvis aggregatet svarer til en fuld genberegning; ellers erstattes det af den"""
+        expected = self.rebuild(df)
+        actual = self._frame.sort_values(self.keys, kind='stable')
+        try:
+            pd.testing.assert_frame_equal(
+                actual.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False
+            )
+        except AssertionError as e:
+            logger.warning("Inkrementelt aggregat %s afviger fra fuld genberegning: %s", self.keys, e)
+            self._frame = expected
+            return False
+        return True
@@ -0,0 +1,253 @@
+"""
+KPI API (read-only) - CRM Dashboard
+Lille JSON API der deler datalag (pipeline.py) og delt cache (data_cache.py)
+med dashboardet, så andre interne værktøjer ikke bruger af Sheets-kvoten.
+
+Endpoints:
+    GET /newsletters?start=2025-11-01&end=2025-11-30&country=DK,SE&campaign=<ID_Campaign>
+    GET /flows?month=2025-11&flow=<Flow_Trigger>&country=DK
+    GET /subscribers?month=2025-11
+    GET /health
+
+Svar har ETag bundet til datasættets revision; If-None-Match giver 304.
+
+    python kpi_api.py --secrets .streamlit/secrets.toml --port 8502
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import tomllib
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+import pipeline
+from data_cache import cache_from_config
+from metrics import log_event
+from pipeline import add_rates, aggregate_to_flow_level
+from sheets_governor import DeadlineExceeded, governor_from_config
+
+NEWSLETTER_MEASURES = ['Total_Received', 'Unique_Opens', 'Unique_Clicks', 'Unsubscribed']
+FLOW_MEASURES = ['Received_Email', 'Unique_Opens', 'Unique_Clicks', 'Unsubscribed', 'Bounced']
+
+
+class BadRequest(Exception):
+    """Ugyldige query parametre (400)"""
+
+
+def query_list(query, name):
+    """Værdier for en parameter; gentagne parametre og kommaseparerede lister understøttes"""
+    values = []
+    for raw in query.get(name, []):
+        values.extend(v.strip() for v in raw.split(',') if v.strip())
+    return values
+
+
+def totals_with_rates(df, received):
+    """Summer målene og beregn rater på totalerne"""
+    if df.empty:
+        return {}
+    totals = {col: int(value) for col, value in df.sum().items()}
+    sent, opens, clicks = totals[received], totals['Unique_Opens'], totals['Unique_Clicks']
+    totals['Open_Rate'] = opens / sent * 100 if sent > 0 else 0.0
+    totals['Click_Rate'] = clicks / sent * 100 if sent > 0 else 0.0
+    totals['CTR'] = clicks / opens * 100 if opens > 0 else 0.0
+    return totals
+
+
+class KpiStore:
+    """Datasæt i hukommelsen + cache af færdige svar pr. (endpoint, query, revision)"""
+
+    def __init__(self, cache, gc, urls, max_responses=1024):
+        self.cache = cache
+        self.gc = gc
+        self.urls = urls
+        self.max_responses = max_responses
+        self._datasets = {}
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaders = {
+            'newsletter': lambda: pipeline.fetch_newsletter_data(self.gc, self.urls['spreadsheet']),
+            'flows': lambda: pipeline.fetch_flows_data(self.gc, self.urls['flows_spreadsheet']),
+            'subscribers': lambda: pipeline.fetch_subscribers_data(self.gc, self.urls['subscribers_spreadsheet']),
+        }
+
+    def dataset(self, name):
+        """Returner (revision, værdi); henter kun igen når TTL-vinduet er skiftet"""
+        epoch = self.cache.epoch()
+        current = self._datasets.get(name)
+        if current is not None and current[0] == epoch:
+            return current[1], current[2]
+
+        revision, value = self.cache.fetch(name, self._loaders[name])
+        with self._lock:
+            self._datasets[name] = (epoch, revision, value)
+        return revision, value
+
+    def response(self, endpoint, query, dataset_name, build):
+        """Returner (etag, body) fra svar-cachen, eller byg svaret"""
+        revision, value = self.dataset(dataset_name)
+        key = (endpoint, tuple(sorted((k, tuple(v)) for k, v in query.items())), revision)
+        with self._lock:
+            cached = self._responses.get(key)
+            if cached is not None:
+                self._responses.move_to_end(key)
+                return cached
+
+        payload = build(value, query)
+        payload['revision'] = revision
+        body = json.dumps(payload, default=str, ensure_ascii=False).encode('utf-8')
+        entry = (f'"{dataset_name}-{revision}"', body)
+        with self._lock:
+            self._responses[key] = entry
+            while len(self._responses) > self.max_responses:
+                self._responses.popitem(last=False)
+        return entry
+
+
+def build_newsletters(df, query):
+    if df.empty:
+        return {'totals': {}, 'rows': []}
+    try:
+        start = pd.to_datetime(query['start'][0]) if 'start' in query else df['Date'].min()
+        end = pd.to_datetime(query['end'][0]) if 'end' in query else df['Date'].max()
+    except ValueError as e:
+        raise BadRequest(f"Ugyldig dato: {e}")
+
+    mask = (df['Date'] >= start) & (df['Date'] <= end)
+    countries = query_list(query, 'country')
+    if countries:
+        mask &= df['Country'].isin(countries)
+    campaigns = query.get('campaign', [])
+    if campaigns:
+        mask &= df['ID_Campaign'].isin(campaigns)
+
+    rows = df.loc[mask].groupby(['Date', 'ID_Campaign'], as_index=False)[NEWSLETTER_MEASURES].sum()
+    rows = add_rates(rows, 'Total_Received')
+    rows['Date'] = rows['Date'].dt.strftime('%Y-%m-%d')
+    return {
+        'totals': totals_with_rates(rows[NEWSLETTER_MEASURES], 'Total_Received'),
+        'rows': rows.to_dict(orient='records'),
+    }
+
+
+def build_flows(df, query):
+    if df.empty:
+        return {'totals': {}, 'rows': []}
+    mask = pd.Series(True, index=df.index)
+    months = query_list(query, 'month')
+    if months:
+        normalized = pd.to_datetime(df['Year_Month'], format='%Y-%m').dt.strftime('%Y-%m')
+        mask &= normalized.isin(months) | df['Year_Month'].isin(months)
+    flows = query.get('flow', [])
+    if flows:
+        mask &= df['Flow_Trigger'].isin(flows)
+    countries = query_list(query, 'country')
+    if countries:
+        mask &= df['Country'].isin(countries)
+
+    flow_df = aggregate_to_flow_level(df.loc[mask])
+    rows = flow_df.groupby(['Year_Month', 'Flow_Trigger'], as_index=False)[FLOW_MEASURES].sum()
+    rows = add_rates(rows, 'Received_Email')
+    return {
+        'totals': totals_with_rates(rows[FLOW_MEASURES], 'Received_Email'),
+        'rows': rows.to_dict(orient='records'),
+    }
+
+
+def build_subscribers(value, query):
+    full_df, light_df, _ = value
+    months = query_list(query, 'month')
+    rows = {}
+    for name, df in (('Full', full_df), ('Light', light_df)):
+        if df.empty or 'Total' not in df.columns:
+            continue
+        for month, total in zip(df['Month'].dt.strftime('%Y-%m'), df['Total']):
+            if not months or month in months:
+                rows.setdefault(month, {'Month': month, 'Full': 0, 'Light': 0})[name] = int(total)
+    ordered = [dict(r, Total=r['Full'] + r['Light']) for _, r in sorted(rows.items(), reverse=True)]
+    return {'rows': ordered}
+
+
+ENDPOINTS = {
+    '/newsletters': ('newsletter', build_newsletters),
+    '/flows': ('flows', build_flows),
+    '/subscribers': ('subscribers', build_subscribers),
+}
+
+
+class KpiRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True  # headers og body sendes i separate writes
+    store = None
+
+    def _send(self, status, body=b'', etag=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send(status, json.dumps({'error': message}, ensure_ascii=False).encode('utf-8'))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/health':
+            return self._send(200, b'{"status": "ok"}')
+        if url.path not in ENDPOINTS:
+            return self._send_error(404, f"Ukendt endpoint: {url.path}")
+
+        dataset_name, build = ENDPOINTS[url.path]
+        try:
+            etag, body = self.store.response(url.path, parse_qs(url.query), dataset_name, build)
+        except BadRequest as e:
+            return self._send_error(400, str(e))
+        except DeadlineExceeded as e:
+            return self._send_error(503, str(e))
+        except Exception as e:
+            # Fx APIError 403/404 fra Sheets eller uventede data: svar altid med JSON
+            log_event('kpi_api_error', logging.ERROR, path=url.path, query=url.query, error=f"{type(e).__name__}: {e}")
+            return self._send_error(500, f"Intern fejl: {type(e).__name__}")
+
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, etag=etag)
+        self._send(200, body, etag=etag)
+
+    def log_message(self, format, *args):
+        pass  # Ingen adgangslog pr. request ved høj belastning
+
+
+def create_server(config, host='127.0.0.1', port=8502):
+    """Byg HTTP serveren ud fra samme konfiguration som dashboardets secrets.toml"""
+    gsheets_config = config['connections']['gsheets']
+    gc = pipeline.open_client(gsheets_config, governor_from_config(config.get('sheets', {})))
+    cache = cache_from_config(config.get('cache', {}), fallback_errors=(DeadlineExceeded,))
+    handler = type('Handler', (KpiRequestHandler,), {'store': KpiStore(cache, gc, gsheets_config)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read-only KPI API")
+    parser.add_argument('--secrets', default=os.path.join('.streamlit', 'secrets.toml'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    args = parser.parse_args(argv)
+
+    with open(args.secrets, 'rb') as f:
+        config = tomllib.load(f)
+    server = create_server(config, args.host, args.port)
+    print(f"KPI API lytter på http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
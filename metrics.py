@@ -0,0 +1,277 @@
+"""
+Instrumentering - CRM Dashboard
+Et lille register af tællere, gauges og histogrammer (tider) i processen, uden
+afhængigheder, så det også kan bruges før login. Hver metrik kan have labels;
+collect() giver et øjebliksbillede af alle værdier.
+
+    AUTH_SECONDS = REGISTRY.histogram('auth_check_seconds', "Tid brugt på login-tjek pr. kørsel")
+    with timer(AUTH_SECONDS):
+        ...
+
+Registret kan eksporteres i Prometheus' tekstformat på en lokal port, og
+hændelser (hentninger, fejl, kørsler) kan logges som JSON-linjer.
+
+Konfigureres i secrets:
+    [metrics]
+    port = 9108                 # /metrics i Prometheus-format (0 = ingen exporter)
+    host = "127.0.0.1"
+    json_logs = true            # hændelser som JSON-linjer
+    log_file = ""               # ellers stderr
+    session_window = 300        # sessioner med en kørsel inden for så mange sekunder er aktive
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+EVENT_LOGGER = logging.getLogger('crm_dashboard.events')
+EVENT_LOGGER.addHandler(logging.NullHandler())  # Intet output før configure_json_logs()
+
+# Sekunder; dækker alt fra et login-tjek til en fuld hentning fra Sheets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Counter:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        self.value += amount
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+class Metric:
+    """En metrik med et navn, en hjælpetekst og en værdi pr. kombination af labels"""
+
+    def __init__(self, kind, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS, function=None):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # Beregnes ved collect: funktion der returnerer [(labels dict, værdi)]
+        self.function = function
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _child(self, labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        child = self._children.get(key)
+        if child is None:
+            child = _Histogram(self.buckets) if self.kind == 'histogram' else _Counter()
+            self._children[key] = child
+        return child
+
+    def inc(self, amount=1.0, **labels):
+        with self._lock:
+            self._child(labels).inc(amount)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._child(labels).value = value
+
+    def observe(self, value, **labels):
+        with self._lock:
+            self._child(labels).observe(value)
+
+    def samples(self):
+        """[(labels dict, værdi)] hvor værdi er et tal (counter/gauge) eller (bucket-antal, count, sum)"""
+        if self.function is not None:
+            return list(self.function())
+        with self._lock:
+            result = []
+            for key, child in self._children.items():
+                labels = dict(zip(self.label_names, key))
+                if self.kind != 'histogram':
+                    result.append((labels, child.value))
+                else:
+                    result.append((labels, (list(child.counts), child.count, child.sum)))
+            return result
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, kind, name, help_text, label_names, buckets=DEFAULT_BUCKETS, function=None):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = Metric(kind, name, help_text, label_names, buckets, function)
+                self._metrics[name] = metric
+            elif function is not None:
+                # Ny instans af det der måles (fx en genskabt cache)
+                metric.function = function
+            return metric
+
+    def counter(self, name, help_text, label_names=(), function=None):
+        return self._register('counter', name, help_text, label_names, function=function)
+
+    def gauge(self, name, help_text, label_names=(), function=None):
+        return self._register('gauge', name, help_text, label_names, function=function)
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register('histogram', name, help_text, label_names, buckets)
+
+    def collect(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+
+# Processens fælles register (Streamlit genkører scripts, men moduler importeres én gang)
+REGISTRY = Registry()
+
+
+@contextmanager
+def timer(histogram, **labels):
+    """Mål tiden for with-blokken i histogrammet"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+class ActiveSessions:
+    """Sessioner med en kørsel af scriptet inden for window sekunder"""
+
+    def __init__(self, window=300, clock=time.time):
+        self.window = window
+        self._clock = clock
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def touch(self, session_id):
+        with self._lock:
+            self._seen[session_id] = self._clock()
+
+    def count(self):
+        cutoff = self._clock() - self.window
+        with self._lock:
+            for session_id in [s for s, seen in self._seen.items() if seen < cutoff]:
+                del self._seen[session_id]
+            return len(self._seen)
+
+
+# --- Prometheus ---
+def _escape(value, quotes=True):
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quotes else value
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_text(registry=None):
+    """Registret i Prometheus' tekstformat (version 0.0.4)"""
+    lines = []
+    for metric in (registry or REGISTRY).collect():
+        lines.append(f"# HELP {metric.name} {_escape(metric.help, quotes=False)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, value in metric.samples():
+            if metric.kind != 'histogram':
+                lines.append(f"{metric.name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            counts, count, total = value
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{metric.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{metric.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+            lines.append(f"{metric.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{metric.name}_count{_format_labels(labels)} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+def start_exporter(host='127.0.0.1', port=9108, registry=None):
+    """Start en HTTP server i en baggrundstråd med /metrics; returnerer serveren"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render_text(registry).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-exporter', daemon=True).start()
+    return server
+
+
+# --- JSON-logs ---
+class JsonFormatter(logging.Formatter):
+    """Én JSON-linje pr. hændelse: tidspunkt, niveau, hændelse og felterne fra log_event"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """Log en hændelse med felter (skrives kun hvis JSON-logs er slået til)"""
+    if EVENT_LOGGER.isEnabledFor(level):
+        EVENT_LOGGER.log(level, event, extra={'fields': fields})
+
+
+def configure_json_logs(log_file=None):
+    handler = logging.FileHandler(log_file, encoding='utf-8') if log_file else logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    EVENT_LOGGER.addHandler(handler)
+    EVENT_LOGGER.setLevel(logging.INFO)
+    EVENT_LOGGER.propagate = False
+
+
+def exporter_from_config(metrics_config):
+    """Start exporter og JSON-logs ud fra [metrics] konfigurationen; returnerer serveren eller None"""
+    if metrics_config.get("json_logs", False):
+        configure_json_logs(metrics_config.get("log_file") or None)
+    port = metrics_config.get("port", 0)
+    if not port:
+        return None
+    try:
+        return start_exporter(metrics_config.get("host", "127.0.0.1"), port)
+    except OSError as e:
+        # Fx flere replikaer på samme maskine: dashboardet kører videre uden exporter
+        log_event('metrics_exporter_failed', logging.WARNING, port=port, error=str(e))
+        return None
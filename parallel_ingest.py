@@ -0,0 +1,199 @@
+"""
+Indlæsning af store ark - CRM Dashboard
+get_all_values() giver en liste af rækker. For store ark (fx All_Flow) deles
+datarækkerne op i bidder, og hver bid omformes og parses (tal, Year_Month
+regex, datoer) med den almindelige parse-funktion:
+
+- ParallelIngest parser bidderne i en proces-pool.
+- StreamingIngest henter arket side for side (get_values) i en baggrundstråd
+  og parser hver side, mens den næste hentes. Kun de typede frames gemmes, så
+  hele listen af rå tekster er aldrig i hukommelsen på én gang.
+
+Resultatet er samme frame - også samme rækkefølge og index - som en seriel
+parse af hele arket.
+
+Konfigureres i secrets:
+    [ingest]
+    workers = 0            # 0 = seriel parse (standard, skalering er ikke målt)
+    chunk_rows = 50000     # datarækker pr. bid
+    min_rows = 200000      # mindre ark parses serielt
+    page_rows = 20000      # hent arket i sider (0 = get_all_values)
+"""
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+
+def split_rows(data, chunk_rows):
+    """[(offset, rækker), ...] med højst chunk_rows rækker pr. bid"""
+    return [(offset, data[offset:offset + chunk_rows]) for offset in range(0, len(data), chunk_rows)]
+
+
+def parse_chunk(parse, header, rows, offset, total, width):
+    """
+    Parser én bid og flytter index til det den serielle parse ville give.
+    Parserne lægger landene efter hinanden (index = land * rækker + række),
+    så index omregnes fra bidden til hele arket.
+    """
+    if rows and len(rows[0]) < width:
+        # Ujævne rækker fyldes op til arkets bredde, ligesom når hele arket læses
+        rows = [list(rows[0]) + [None] * (width - len(rows[0]))] + rows[1:]
+    df = parse(header + rows)
+    if df.empty:
+        return df
+    position = df.index.to_numpy()
+    country, row = position // len(rows), position % len(rows)
+    df.index = country * total + offset + row
+    return df
+
+
+def merge_chunks(frames):
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames).sort_index(kind='stable')
+
+
+class ParallelIngest:
+    """Proces-pool der parser store ark i bidder"""
+
+    def __init__(self, workers=None, chunk_rows=50_000, min_rows=200_000):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_rows = chunk_rows
+        self.min_rows = min_rows
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: fork fra en proces med Streamlit-tråde kan hænge
+                context = multiprocessing.get_context('spawn')
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=context)
+            return self._pool
+
+    def submit(self, *args):
+        """parse_chunk(*args) i poolen; returnerer en future"""
+        return self._executor().submit(parse_chunk, *args)
+
+    def parse(self, all_values, parse, header_rows=2):
+        """Som parse(all_values), men fordelt over proces-poolen for store ark"""
+        data = all_values[header_rows:]
+        if len(data) < max(self.min_rows, 1) or self.workers < 2:
+            return parse(all_values)
+
+        header = all_values[:header_rows]
+        width = max(len(row) for row in data)
+        futures = [
+            self.submit(parse, header, rows, offset, len(data), width)
+            for offset, rows in split_rows(data, self.chunk_rows)
+        ]
+        return merge_chunks([future.result() for future in futures])
+
+    def load(self, worksheet, parse, header_rows=2):
+        """Hent hele arket og parse det"""
+        return self.parse(worksheet.get_all_values(), parse, header_rows)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+def iter_pages(worksheet, first_row, last_row, page_rows, prefetch=1):
+    """
+    (første række, rækker) for rækkeintervaller af page_rows fra first_row til
+    last_row (1-baseret, inklusiv). Siderne hentes i en baggrundstråd, højst
+    prefetch sider forud for den der behandles.
+    """
+    pages = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def fetch():
+        try:
+            for start in range(first_row, last_row + 1, page_rows):
+                if stop.is_set():
+                    return
+                pages.put((start, worksheet.get_values(f"{start}:{min(start + page_rows - 1, last_row)}")))
+            pages.put(None)
+        except Exception as e:
+            pages.put(e)
+
+    thread = threading.Thread(target=fetch, name='sheet-pages', daemon=True)
+    thread.start()
+    try:
+        while True:
+            page = pages.get()
+            if page is None:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+    finally:
+        stop.set()
+        # Tøm køen, så en blokeret put i tråden kan afslutte
+        while thread.is_alive():
+            try:
+                pages.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+class StreamingIngest:
+    """Henter arket side for side og parser hver side, mens den næste hentes"""
+
+    def __init__(self, page_rows=20_000, prefetch=1, parallel=None):
+        self.page_rows = page_rows
+        self.prefetch = prefetch
+        self.parallel = parallel  # ParallelIngest: siderne parses i dens proces-pool
+
+    def load(self, worksheet, parse, header_rows=2):
+        # row_count er arkets størrelse og dermed en øvre grænse for antal datarækker
+        last_row = worksheet.row_count
+        bound = max(last_row - header_rows, 1)
+
+        header, width = [], 0
+        frames, futures, rows_seen = [], [], 0
+        for start, rows in iter_pages(worksheet, 1, last_row, self.page_rows, self.prefetch):
+            offset = start - 1 - header_rows
+            if start == 1:
+                # Header-rækkerne kommer med i første side
+                header, rows, offset = rows[:header_rows], rows[header_rows:], 0
+                width = max((len(row) for row in header), default=0)
+            if not rows:
+                continue
+            # Tomme rækker sidst i arket er ikke med i get_all_values (og giver ingen output)
+            rows_seen = offset + len(rows)
+            if self.parallel is not None:
+                futures.append(self.parallel.submit(parse, header, rows, offset, bound, width))
+            else:
+                frames.append(parse_chunk(parse, header, rows, offset, bound, width))
+        frames += [future.result() for future in futures]
+
+        df = merge_chunks(frames)
+        if not df.empty:
+            # Index som ved én parse af hele arket: land * antal datarækker + række
+            position = df.index.to_numpy()
+            df.index = position // bound * rows_seen + position % bound
+        return df
+
+
+def ingest_from_config(ingest_config):
+    """Byg ingest ud fra [ingest] konfigurationen, eller None for seriel parse af get_all_values()"""
+    workers = ingest_config.get("workers", 0)
+    parallel = None
+    if workers and workers >= 2:
+        parallel = ParallelIngest(
+            workers,
+            chunk_rows=ingest_config.get("chunk_rows", 50_000),
+            min_rows=ingest_config.get("min_rows", 200_000),
+        )
+    page_rows = ingest_config.get("page_rows", 0)
+    if page_rows:
+        return StreamingIngest(page_rows, prefetch=ingest_config.get("prefetch", 1), parallel=parallel)
+    return parallel
@@ -0,0 +1,482 @@
+"""
+Data pipeline - CRM Dashboard
+Henter og parser Newsletter, Flows og Subscribers data uden Streamlit, så samme
+kode bruges af dashboardet, batch-rapporter og andre processer.
+"""
+import csv
+import itertools
+import os
+import re
+import pandas as pd
+
+
+COUNTRIES = ['DK', 'SE', 'NO', 'FI', 'FR', 'UK', 'DE', 'AT', 'NL', 'BE', 'CH']
+
+# Grupper og mål for de materialiserede aggregater (se incremental.py)
+NEWSLETTER_KEYS = ['Date', 'ID_Campaign', 'Email_Message_Base', 'Email_Message_Full', 'Country']
+NEWSLETTER_MEASURES = ['Total_Received', 'Unique_Opens', 'Unique_Clicks', 'Unsubscribed']
+FLOW_LEVEL_KEYS = ['Year_Month', 'Flow_Trigger', 'Country']
+FLOW_LEVEL_MEASURES = ['Received_Email', 'Total_Opens', 'Unique_Opens', 'Total_Clicks', 'Unique_Clicks', 'Unsubscribed', 'Bounced']
+
+# Navnene på raterne (add_rates) i Newsletter frames
+NEWSLETTER_RATE_COLUMNS = ('Open Rate %', 'Click Rate %', 'Click Through Rate %')
+
+
+def col_letter_to_index(col_str):
+    """Konverter kolonnebogstav til 0-baseret indeks (A=0, B=1, ..., Z=25, AA=26, ...)"""
+    result = 0
+    for char in col_str.upper():
+        result = result * 26 + (ord(char) - ord('A') + 1)
+    return result - 1
+
+
+
+# Undermappe i en lokal kilde for hvert spreadsheet i [connections.gsheets]
+LOCAL_FOLDERS = {'spreadsheet': 'newsletter', 'flows_spreadsheet': 'flows', 'subscribers_spreadsheet': 'subscribers'}
+
+
+class LocalSheetsClient:
+    """
+    Lokal datakilde med samme interface som gspread (open_by_url/worksheet/get_all_values).
+    "URL" er en mappe med én CSV-fil pr. worksheet, fx flows/All_Flow.csv.
+    sheet1 er den første CSV-fil i alfabetisk rækkefølge. folders oversætter
+    rigtige spreadsheet URLs til mapper, så secrets kan beholde deres URLs.
+    """
+
+    class _Worksheet:
+        def __init__(self, path):
+            self.path = path
+            self.title = os.path.splitext(os.path.basename(path))[0]
+
+        def get_all_values(self):
+            with open(self.path, newline='', encoding='utf-8') as f:
+                return [row for row in csv.reader(f)]
+
+        @property
+        def row_count(self):
+            with open(self.path, newline='', encoding='utf-8') as f:
+                return sum(1 for _ in csv.reader(f))
+
+        def get_values(self, range_name):
+            """Understøtter kun rækkeintervaller i A1-notation, fx '3:100'"""
+            first, last = (int(part) for part in range_name.split(':'))
+            with open(self.path, newline='', encoding='utf-8') as f:
+                return list(itertools.islice(csv.reader(f), first - 1, last))
+
+    class _Spreadsheet:
+        def __init__(self, directory):
+            self.directory = directory
+
+        @property
+        def sheet1(self):
+            names = sorted(n for n in os.listdir(self.directory) if n.endswith('.csv'))
+            return LocalSheetsClient._Worksheet(os.path.join(self.directory, names[0]))
+
+        def worksheet(self, title):
+            return LocalSheetsClient._Worksheet(os.path.join(self.directory, f"{title}.csv"))
+
+    def __init__(self, root='.', folders=None):
+        self.root = root
+        self.folders = folders or {}
+
+    def open_by_url(self, url):
+        return self._Spreadsheet(os.path.join(self.root, self.folders.get(url, url)))
+
+
+def local_folders(gsheets_config):
+    """{spreadsheet URL fra secrets: undermappe} for en lokal kilde"""
+    return {gsheets_config[key]: folder for key, folder in LOCAL_FOLDERS.items() if key in gsheets_config}
+
+
+def authorize_client(gsheets_config):
+    """Returnerer en autoriseret gspread client ud fra [connections.gsheets] konfigurationen"""
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    credentials_dict = {
+        "type": gsheets_config.get("type", "service_account"),
+        "project_id": gsheets_config["project_id"],
+        "private_key_id": gsheets_config["private_key_id"],
+        "private_key": gsheets_config["private_key"],
+        "client_email": gsheets_config["client_email"],
+        "client_id": gsheets_config["client_id"],
+        "auth_uri": gsheets_config.get("auth_uri", "https://accounts.google.com/o/oauth2/auth"),
+        "token_uri": gsheets_config.get("token_uri", "https://oauth2.googleapis.com/token"),
+        "auth_provider_x509_cert_url": gsheets_config.get("auth_provider_x509_cert_url", "https://www.googleapis.com/oauth2/v1/certs"),
+        "client_x509_cert_url": gsheets_config.get("client_x509_cert_url", "")
+    }
+    
+    scopes = [
+        "https://www.googleapis.com/auth/spreadsheets.readonly",
+        "https://www.googleapis.com/auth/drive.readonly"
+    ]
+    credentials = Credentials.from_service_account_info(credentials_dict, scopes=scopes)
+    return gspread.authorize(credentials)
+
+
+def open_client(gsheets_config, governor=None):
+    """
+    Returnerer en client ud fra [connections.gsheets]: LocalSheetsClient hvis
+    local_source er sat (offline udvikling), ellers gspread bag governor.
+    """
+    if "local_source" in gsheets_config:
+        return LocalSheetsClient(gsheets_config["local_source"], local_folders(gsheets_config))
+
+    from sheets_governor import GovernedClient, governor_from_config
+    return GovernedClient(authorize_client(gsheets_config), governor or governor_from_config({}))
+
+
+def fetch_newsletter_data(gc, spreadsheet_url, ingest=None):
+    """Henter Newsletter data fra Google Sheet (parset i bidder/sider hvis ingest er sat, se parallel_ingest.py)"""
+    spreadsheet = gc.open_by_url(spreadsheet_url)
+    worksheet = spreadsheet.sheet1
+    return load_values(worksheet, parse_newsletter_values, ingest)
+
+
+def load_values(worksheet, parse, ingest=None):
+    """Hent og parse arket - med get_all_values(), eller via ingest (proces-pool / sidevis hentning)"""
+    if ingest is None:
+        return parse(worksheet.get_all_values())
+    return ingest.load(worksheet, parse)
+
+
+def parse_newsletter_values(all_values):
+    """Parser Newsletter arket (liste af rækker) til langt format med én række pr. land"""
+    if len(all_values) > 2:
+        data = all_values[2:]
+        raw_df = pd.DataFrame(data)
+    else:
+        return pd.DataFrame()
+    
+    # Landekonfiguration
+    country_configs = [
+        ('DK', 15), ('SE', 21), ('NO', 27), ('FI', 33), ('FR', 39),
+        ('UK', 45), ('DE', 51), ('AT', 57), ('NL', 63), ('BE', 69), ('CH', 75),
+    ]
+    
+    all_country_data = []
+    
+    for country_code, start_col in country_configs:
+        try:
+            country_df = pd.DataFrame()
+            country_df['Send Year'] = raw_df.iloc[:, 0]
+            country_df['Send Month'] = raw_df.iloc[:, 1]
+            country_df['Send Day'] = raw_df.iloc[:, 2]
+            country_df['Send Time'] = raw_df.iloc[:, 3]
+            country_df['Number'] = raw_df.iloc[:, 4]
+            country_df['Campaign Name'] = raw_df.iloc[:, 5]
+            country_df['Email'] = raw_df.iloc[:, 6]
+            country_df['Message'] = raw_df.iloc[:, 7]
+            country_df['Variant'] = raw_df.iloc[:, 8]
+            
+            country_df['Total_Received'] = raw_df.iloc[:, start_col + 0]
+            country_df['Total_Opens_Raw'] = raw_df.iloc[:, start_col + 1]
+            country_df['Unique_Opens'] = raw_df.iloc[:, start_col + 2]
+            country_df['Total_Clicks_Raw'] = raw_df.iloc[:, start_col + 3]
+            country_df['Unique_Clicks'] = raw_df.iloc[:, start_col + 4]
+            country_df['Unsubscribed'] = raw_df.iloc[:, start_col + 5]
+            country_df['Country'] = country_code
+            
+            all_country_data.append(country_df)
+        except Exception:
+            continue
+    
+    if not all_country_data:
+        return pd.DataFrame()
+
+    df = pd.concat(all_country_data, ignore_index=True)
+    
+    df['Date'] = pd.to_datetime(
+        df['Send Year'].astype(str) + '-' + 
+        df['Send Month'].astype(str) + '-' + 
+        df['Send Day'].astype(str), 
+        errors='coerce'
+    )
+    df = df.dropna(subset=['Date'])
+
+    numeric_cols = ['Total_Received', 'Unique_Opens', 'Unique_Clicks', 'Unsubscribed']
+    for col in numeric_cols:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.replace(',', '').str.replace('"', '')
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+    
+    df = add_rates(df, 'Total_Received', names=NEWSLETTER_RATE_COLUMNS)
+    
+    df['ID_Campaign'] = df['Number'].astype(str) + ' - ' + df['Campaign Name'].astype(str)
+    df['Email_Message_Base'] = df['Email'].astype(str) + ' - ' + df['Message'].astype(str)
+    variant = df['Variant'].astype(str)
+    has_variant = df['Variant'].notna() & ~variant.str.strip().isin(['', 'nan', 'None'])
+    df['Email_Message_Full'] = df['Email_Message_Base'].where(~has_variant, df['Email_Message_Base'] + ' - ' + variant)
+    
+    return df
+
+
+
+def newsletter_row_month(row):
+    """Månedslabel ('2025-09') for en rå række i Newsletter arket, eller None"""
+    try:
+        return f"{int(row[0]):04d}-{int(row[1]):02d}"
+    except (ValueError, IndexError):
+        return None
+
+
+def newsletter_month(df):
+    """Månedslabel pr. række i den parsede Newsletter frame"""
+    return df['Date'].dt.strftime('%Y-%m')
+
+
+def sync_newsletter_archive(gc, spreadsheet_url, archive):
+    """Synkroniserer lukkede måneder til arkivet og returnerer de åbne måneder"""
+    worksheet = gc.open_by_url(spreadsheet_url).sheet1
+    return archive.sync('newsletter', worksheet, 2, newsletter_row_month, parse_newsletter_values, newsletter_month)
+
+
+def fetch_flows_data(gc, flows_url, ingest=None):
+    """Henter Flows data fra Google Sheet (parset i bidder/sider hvis ingest er sat, se parallel_ingest.py)"""
+    spreadsheet = gc.open_by_url(flows_url)
+    worksheet = spreadsheet.worksheet("All_Flow")
+    return load_values(worksheet, parse_flows_values, ingest)
+
+
+def parse_flows_values(all_values):
+    """Parser All_Flow arket (liste af rækker) til langt format med én række pr. land"""
+    if len(all_values) > 2:
+        # Skip header rows (row 1-2 contains headers)
+        data = all_values[2:]
+        raw_df = pd.DataFrame(data)
+    else:
+        return pd.DataFrame()
+    
+    # Landekonfiguration med startkolonner (0-indexed)
+    # P=15, W=22, AD=29, AK=36, AR=43, AY=50, BF=57, BM=64, BT=71, CA=78, CH=85
+    country_configs = [
+        ('DK', col_letter_to_index('P')),   # 15
+        ('SE', col_letter_to_index('W')),   # 22
+        ('NO', col_letter_to_index('AD')),  # 29
+        ('FI', col_letter_to_index('AK')),  # 36
+        ('FR', col_letter_to_index('AR')),  # 43
+        ('UK', col_letter_to_index('AY')),  # 50
+        ('DE', col_letter_to_index('BF')),  # 57
+        ('AT', col_letter_to_index('BM')),  # 64
+        ('NL', col_letter_to_index('BT')),  # 71
+        ('BE', col_letter_to_index('CA')),  # 78
+        ('CH', col_letter_to_index('CH')),  # 85
+    ]
+    
+    # Metrics offset fra startkolonne
+    METRIC_OFFSETS = {
+        'Received_Email': 0,
+        'Total_Opens': 1,
+        'Unique_Opens': 2,
+        'Total_Clicks': 3,
+        'Unique_Clicks': 4,
+        'Unsubscribed': 5,
+        'Bounced': 6,
+    }
+    
+    all_country_data = []
+    
+    for country_code, start_col in country_configs:
+        try:
+            country_df = pd.DataFrame()
+            
+            # Info kolonner (A-H, index 0-7)
+            country_df['Send_Date'] = raw_df.iloc[:, 0]      # A: Send Date (2025-12)
+            country_df['Tags'] = raw_df.iloc[:, 1]           # B: Tags
+            country_df['Flow'] = raw_df.iloc[:, 2]           # C: Flow
+            country_df['Trigger'] = raw_df.iloc[:, 3]        # D: Trigger
+            country_df['Group'] = raw_df.iloc[:, 4]          # E: Group
+            country_df['Mail'] = raw_df.iloc[:, 5]           # F: Mail
+            country_df['Message'] = raw_df.iloc[:, 6]        # G: Message
+            country_df['AB'] = raw_df.iloc[:, 7]             # H: A/B
+            
+            # Metrics med offset
+            for metric_name, offset in METRIC_OFFSETS.items():
+                col_idx = start_col + offset
+                if col_idx < len(raw_df.columns):
+                    country_df[metric_name] = raw_df.iloc[:, col_idx]
+                else:
+                    country_df[metric_name] = 0
+            
+            country_df['Country'] = country_code
+            all_country_data.append(country_df)
+            
+        except Exception as e:
+            continue
+    
+    if not all_country_data:
+        return pd.DataFrame()
+
+    df = pd.concat(all_country_data, ignore_index=True)
+    
+    # Parse Send_Date (format: 2025-12 = År-Måned)
+    df['Year_Month'] = df['Send_Date'].astype(str).str.strip()
+    df = df[df['Year_Month'].str.match(r'^\d{4}-\d{1,2}$', na=False)]
+    
+    # Konverter numeriske kolonner
+    numeric_cols = ['Received_Email', 'Total_Opens', 'Unique_Opens', 'Total_Clicks', 'Unique_Clicks', 'Unsubscribed', 'Bounced']
+    for col in numeric_cols:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.replace(',', '').str.replace('"', '').str.strip()
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+    
+    # Beregn rater
+    df = add_rates(df, 'Received_Email')
+    
+    # Opret Flow-Trigger identifier
+    df['Flow_Trigger'] = df['Flow'].astype(str).str.strip() + ' - ' + df['Trigger'].astype(str).str.strip()
+
+    # Sorteringsnøgler beregnes én gang her i stedet for ved hver visning
+    df['Flow_Num'] = flow_number(df['Flow_Trigger'])
+    df['Month_Key'] = month_key(df['Year_Month'])
+    
+    return df
+
+
+def _per_unique(series, func):
+    """Anvend func på de unikke værdier og fordel resultatet på rækkerne"""
+    codes, uniques = pd.factorize(series)
+    if not len(uniques):
+        return pd.Series(index=series.index, dtype=int)
+    return pd.Series(func(pd.Series(uniques)).to_numpy()[codes], index=series.index)
+
+
+def flow_number(flow_trigger):
+    """Flow nummer ('Flow 12 - Trigger' -> 12), 999 for flows uden nummer"""
+    return _per_unique(flow_trigger, lambda values: pd.to_numeric(
+        values.astype(str).str.extract(r'Flow\s*(\d+)', expand=False), errors='coerce'
+    ).fillna(999).astype(int))
+
+
+def month_key(year_month):
+    """Sorterbar måned som heltal ('2025-9' -> 202509)"""
+    def convert(values):
+        parts = values.astype(str).str.split('-', expand=True)
+        return parts[0].astype(int) * 100 + parts[1].astype(int)
+    return _per_unique(year_month, convert)
+
+
+
+def flows_row_month(row):
+    """Månedslabel (som i Year_Month, fx '2025-9') for en rå række i All_Flow arket, eller None"""
+    label = str(row[0]).strip() if row else ''
+    return label if re.match(r'^\d{4}-\d{1,2}$', label) else None
+
+
+def flows_month(df):
+    """Månedslabel pr. række i den parsede Flows frame"""
+    return df['Year_Month']
+
+
+def sync_flows_archive(gc, flows_url, archive):
+    """Synkroniserer lukkede måneder til arkivet og returnerer de åbne måneder"""
+    worksheet = gc.open_by_url(flows_url).worksheet("All_Flow")
+    return archive.sync('flows', worksheet, 2, flows_row_month, parse_flows_values, flows_month)
+
+
+def aggregate_to_flow_level(df):
+    """Aggreger data til flow niveau (summer alle mails under samme flow)"""
+    agg_df = df.groupby(['Year_Month', 'Flow_Trigger', 'Country'], as_index=False).agg({
+        'Received_Email': 'sum',
+        'Total_Opens': 'sum',
+        'Unique_Opens': 'sum',
+        'Total_Clicks': 'sum',
+        'Unique_Clicks': 'sum',
+        'Unsubscribed': 'sum',
+        'Bounced': 'sum',
+    })
+    
+    # Genberegn rater efter aggregering
+    return add_rates(agg_df, 'Received_Email')
+
+
+
+class FlowSortKeys:
+    """Opslag fra Year_Month og Flow_Trigger til Month_Key og Flow_Num, bygget én gang pr. revision"""
+
+    def __init__(self, df):
+        if 'Flow_Num' not in df.columns:
+            # Data parset før kolonnerne fandtes (fx stadig i den delte cache)
+            df = df.assign(Flow_Num=flow_number(df['Flow_Trigger']), Month_Key=month_key(df['Year_Month']))
+        months = df.drop_duplicates('Year_Month')[['Year_Month', 'Month_Key']]
+        self.month_key = months.set_index('Year_Month')['Month_Key']
+        self.flow_num = df.drop_duplicates('Flow_Trigger').set_index('Flow_Trigger')['Flow_Num']
+        # Nyeste måned først
+        self.months = months.sort_values('Month_Key', ascending=False, kind='stable')['Year_Month'].tolist()
+
+    def sort_flows(self, flows):
+        """Flows sorteret efter flow nummer (Flow 1, Flow 2, ...), ellers i den givne rækkefølge"""
+        flows = pd.Series(flows)
+        return flows.iloc[flows.map(self.flow_num).argsort(kind='stable')].tolist()
+
+
+def build_flow_index(df):
+    """Rækkepositioner pr. Flow_Trigger, så et enkelt flow kan foldes ud uden at scanne hele arket"""
+    return df.groupby('Flow_Trigger', sort=False).indices
+
+
+def flow_drilldown(df, flow_index, flow_trigger, months, countries, archived=None):
+    """
+    KPI'er pr. Mail/Message/AB for ét flow i de valgte måneder og lande.
+    archived: flowets rækker fra arkivets lukkede måneder (df er da kun de åbne)
+    """
+    positions = flow_index.get(flow_trigger)
+    has_archived = archived is not None and not archived.empty
+    if positions is None and not has_archived:
+        return pd.DataFrame()
+    rows = df.iloc[positions] if positions is not None else df.iloc[:0]
+    if has_archived:
+        rows = pd.concat([archived, rows], ignore_index=True)
+    rows = rows[rows['Year_Month'].isin(months) & rows['Country'].isin(countries)]
+    detail = rows.groupby(['Group', 'Mail', 'Message', 'AB'], as_index=False, sort=False)[FLOW_LEVEL_MEASURES].sum()
+    return add_rates(detail, 'Received_Email')
+
+
+def add_rates(df, received, opens='Unique_Opens', clicks='Unique_Clicks', names=('Open_Rate', 'Click_Rate', 'CTR')):
+    """Tilføj open rate, click rate og CTR (i procent) som kolonnerne i names"""
+    open_rate, click_rate, ctr = names
+    df[open_rate] = (df[opens] / df[received] * 100).where(df[received] > 0, 0.0)
+    df[click_rate] = (df[clicks] / df[received] * 100).where(df[received] > 0, 0.0)
+    df[ctr] = (df[clicks] / df[opens] * 100).where(df[opens] > 0, 0.0)
+    return df
+
+
+def fetch_subscribers_data(gc, subscribers_url):
+    """Henter Subscribers data fra Google Sheet"""
+    spreadsheet = gc.open_by_url(subscribers_url)
+    
+    # Hent worksheets
+    full_subs = spreadsheet.worksheet("Full_Subscribers").get_all_values()
+    light_subs = spreadsheet.worksheet("Light_Subscribers").get_all_values()
+    sub_events = spreadsheet.worksheet("Full_Sub_Events").get_all_values()
+    return parse_subscribers_values(full_subs, light_subs, sub_events)
+
+
+def parse_subscribers_values(full_subs, light_subs, sub_events):
+    """Parser de tre Subscribers worksheets til (full_df, light_df, events_df)"""
+    # Konverter til DataFrames
+    full_df = pd.DataFrame(full_subs[1:], columns=full_subs[0]) if len(full_subs) > 1 else pd.DataFrame()
+    light_df = pd.DataFrame(light_subs[1:], columns=light_subs[0]) if len(light_subs) > 1 else pd.DataFrame()
+    events_df = pd.DataFrame(sub_events[1:], columns=sub_events[0]) if len(sub_events) > 1 else pd.DataFrame()
+    
+    # Konverter numeriske kolonner
+    country_cols = ['DK', 'SE', 'NO', 'FI', 'FR', 'UK', 'DE', 'AT', 'NL', 'BE', 'CH', 'Total']
+    
+    for df in [full_df, light_df]:
+        if not df.empty:
+            for col in country_cols:
+                if col in df.columns:
+                    df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', '').str.replace('"', ''), errors='coerce').fillna(0).astype(int)
+            if 'Month' in df.columns:
+                df['Month'] = pd.to_datetime(df['Month'], format='%Y-%m', errors='coerce')
+    
+    # Events har flere kolonner
+    if not events_df.empty:
+        for col in country_cols:
+            if col in events_df.columns:
+                events_df[col] = pd.to_numeric(events_df[col].astype(str).str.replace(',', '').str.replace('"', ''), errors='coerce').fillna(0).astype(int)
+        if 'Month' in events_df.columns:
+            events_df['Month'] = pd.to_datetime(events_df['Month'], format='%Y-%m', errors='coerce')
+    
+    return full_df, light_df, events_df
+
@@ -0,0 +1,136 @@
+"""
+Cache til afledte resultater - CRM Dashboard
+Filtrerede udsnit, aggregeringer og grafdata pr. filterkombination gemmes i
+en LRU med et samlet budget i bytes (målt med DataFrame.memory_usage). Nøglen
+er datasættets revision plus den normaliserede filtertilstand, så skift frem
+og tilbage mellem filtre ikke regner det samme igen, og en ny revision aldrig
+giver gamle resultater. Værdierne deles mellem sessioner og må ikke ændres
+in-place.
+
+Konfigureres i secrets:
+    [result_cache]
+    max_mb = 256     # 0 slår cachen fra
+"""
+import datetime
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def normalize(value):
+    """Gør filtertilstand hashbar og uafhængig af rækkefølge (lister -> sorterede tupler)"""
+    if isinstance(value, (list, set, frozenset)):
+        return tuple(sorted((normalize(v) for v in value), key=repr))
+    if isinstance(value, tuple):
+        return tuple(normalize(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, normalize(v)) for k, v in value.items()))
+    if isinstance(value, (pd.Timestamp, datetime.date)):
+        return pd.Timestamp(value).isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def measure(value):
+    """Omtrentlig hukommelse i bytes for en DataFrame/Series/Index (deep), et array eller en beholder af dem"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        # getsizeof tæller kun data arrayet selv ejer (ikke et views), og ikke objekterne i et object-array
+        items = sum(measure(v) for v in value.ravel()) if value.dtype == object else 0
+        return sys.getsizeof(value) + (0 if value.base is None else value.nbytes) + items
+    if isinstance(value, (tuple, list, set, frozenset)):
+        return sys.getsizeof(value) + sum(measure(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(measure(k) + measure(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """LRU med budget i bytes og tællere for hits, misses og evictions"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # nøgle -> (værdi, bytes)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """(True, værdi) ved hit, ellers (False, None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, value):
+        size = measure(value)
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                # Større end hele budgettet: gemmes ikke
+                return
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """Værdien for key; compute() køres ved miss og resultatet gemmes"""
+        found, value = self.get(key)
+        if found:
+            return value
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def register_result_cache_metrics(cache, registry):
+    """Eksporter cachens tællere og størrelse i metrics-registret (læses ved hver scrape)"""
+    def stat(key):
+        return lambda: [({}, cache.stats()[key])]
+
+    registry.counter('result_cache_hits_total', "Hits i cachen til filterresultater", function=stat('hits'))
+    registry.counter('result_cache_misses_total', "Misses i cachen til filterresultater", function=stat('misses'))
+    registry.counter('result_cache_evictions_total', "Resultater smidt ud af LRU'en", function=stat('evictions'))
+    registry.gauge('result_cache_bytes', "Bytes brugt af cachen til filterresultater", function=stat('bytes'))
+    registry.gauge('result_cache_entries', "Antal resultater i cachen", function=stat('entries'))
+
+
+def result_cache_from_config(result_cache_config):
+    """Byg ResultCache ud fra [result_cache] konfigurationen, eller None hvis den er slået fra"""
+    max_mb = result_cache_config.get("max_mb", 256)
+    if not max_mb:
+        return None
+    return ResultCache(int(max_mb * 1024 * 1024))
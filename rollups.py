@@ -0,0 +1,100 @@
+"""
+Tidshierarki for Newsletter data - CRM Dashboard
+Summer pr. dag, ISO-uge, måned og kvartal (pr. land og kampagne) bygges én
+gang pr. revision. Et datointerval besvares med hele kvartaler/måneder plus
+de enkelte dage i kanterne, så "I ar" og "Dette kvartal" ikke kræver en sum
+over alle dagsrækker.
+"""
+import pandas as pd
+
+from pipeline import NEWSLETTER_MEASURES, add_rates
+
+ROLLUP_KEYS = ['Country', 'ID_Campaign']
+LEVELS = ['day', 'week', 'month', 'quarter']
+
+
+def bucket_start(dates, level):
+    """Første dag i den uge/måned/kvartal datoerne ligger i"""
+    if level == 'day':
+        return dates
+    if level == 'week':
+        return dates - pd.to_timedelta(dates.dt.dayofweek, unit='D')
+    return dates.dt.to_period('M' if level == 'month' else 'Q').dt.start_time
+
+
+def decompose(start, end):
+    """
+    Del [start, end] op i hele kvartaler og måneder samt dagsintervaller i kanterne.
+    Returnerer ([(level, bucket_start), ...], [(første_dag, sidste_dag), ...]).
+    """
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    buckets, days = [], []
+    cursor = start
+    one_day = pd.Timedelta(days=1)
+    while cursor <= end:
+        quarter = pd.Period(cursor, 'Q')
+        month = pd.Period(cursor, 'M')
+        if cursor == quarter.start_time and quarter.end_time.normalize() <= end:
+            buckets.append(('quarter', cursor))
+            cursor = quarter.end_time.normalize() + one_day
+        elif cursor == month.start_time and month.end_time.normalize() <= end:
+            buckets.append(('month', cursor))
+            cursor = month.end_time.normalize() + one_day
+        else:
+            stop = min(month.end_time.normalize(), end)
+            if days and days[-1][1] + one_day == cursor:
+                days[-1] = (days[-1][0], stop)
+            else:
+                days.append((cursor, stop))
+            cursor = stop + one_day
+    return buckets, days
+
+
+class NewsletterRollups:
+    """Summer af Newsletter målene pr. (bucket, land, kampagne) på fire niveauer"""
+
+    def __init__(self, df):
+        daily = df.groupby(['Date'] + ROLLUP_KEYS, as_index=False)[NEWSLETTER_MEASURES].sum()
+        daily = daily.rename(columns={'Date': 'Bucket'})
+        self.levels = {'day': daily}
+        for level in LEVELS[1:]:
+            coarse = daily.assign(Bucket=bucket_start(daily['Bucket'], level))
+            self.levels[level] = coarse.groupby(['Bucket'] + ROLLUP_KEYS, as_index=False)[NEWSLETTER_MEASURES].sum()
+
+    @staticmethod
+    def _filter(frame, countries, campaigns):
+        mask = pd.Series(True, index=frame.index)
+        if countries is not None:
+            mask &= frame['Country'].isin(countries)
+        if campaigns is not None:
+            mask &= frame['ID_Campaign'].isin(campaigns)
+        return frame[mask]
+
+    def select(self, start, end, countries=None, campaigns=None):
+        """Rækker fra de grove buckets og kantdage der tilsammen dækker [start, end]"""
+        buckets, days = decompose(start, end)
+        parts = []
+        for level in ('quarter', 'month'):
+            starts = [b for lvl, b in buckets if lvl == level]
+            if starts:
+                frame = self.levels[level]
+                parts.append(frame[frame['Bucket'].isin(starts)])
+        daily = self.levels['day']
+        for first, last in days:
+            parts.append(daily[(daily['Bucket'] >= first) & (daily['Bucket'] <= last)])
+        if not parts:
+            return pd.DataFrame(columns=['Bucket'] + ROLLUP_KEYS + NEWSLETTER_MEASURES)
+        return self._filter(pd.concat(parts, ignore_index=True), countries, campaigns)
+
+    def totals(self, start, end, countries=None, campaigns=None):
+        """Summen af målene for [start, end]"""
+        return self.select(start, end, countries, campaigns)[NEWSLETTER_MEASURES].sum()
+
+    def series(self, level, start, end, countries=None, campaigns=None):
+        """Én række pr. uge/måned der overlapper [start, end], med rater (hele buckets)"""
+        frame = self.levels[level]
+        first = bucket_start(pd.Series([pd.Timestamp(start)]), level).iloc[0]
+        frame = frame[(frame['Bucket'] >= first) & (frame['Bucket'] <= pd.Timestamp(end))]
+        frame = self._filter(frame, countries, campaigns)
+        result = frame.groupby('Bucket', as_index=False)[NEWSLETTER_MEASURES].sum()
+        return add_rates(result, 'Total_Received')
@@ -0,0 +1,103 @@
+"""
+Gemte visninger - CRM Dashboard
+Navngivne filterkombinationer for Newsletters og Flows, gemt som normaliseret
+filtertilstand i én JSON-fil, der deles af alle sessioner (og replikaer med
+samme fil). Lister er sorterede, og None betyder "alle", så en visning også
+dækker nye kampagner, lande og flows. Gem og slet læser, ændrer og skriver
+filen under en flock på <path>.lock, så samtidige replikaer ikke mister
+hinandens visninger.
+
+    Newsletters: preset (eller start/end), countries, campaigns, emails, ignore_ab, chart_view
+    Flows:       months (None = nyeste måned), countries, flows
+
+Konfigureres i secrets:
+    [saved_views]
+    path = "data/saved_views.json"   # standard; relative stier regnes fra app-mappen
+"""
+import contextlib
+import datetime
+import fcntl
+import json
+import os
+import threading
+
+TABS = ('newsletters', 'flows')
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.path.join('data', 'saved_views.json')
+
+
+def normalize_state(state):
+    """Filtertilstand som JSON-venlige værdier: sorterede lister uden dubletter, datoer som ISO"""
+    result = {}
+    for key, value in state.items():
+        if isinstance(value, (list, tuple, set)):
+            value = sorted({str(v) for v in value})
+        elif isinstance(value, datetime.date):
+            value = value.isoformat()
+        result[key] = value
+    return result
+
+
+class SavedViews:
+    """Gemte visninger pr. tab i en JSON-fil: {tab: {navn: tilstand}}"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _read(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        Eksklusiv flock på <path>.lock på tværs af tråde og processer. Låsefilen
+        slettes aldrig (så ville to kunne låse hver sin fil).
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(f"{self.path}.lock", os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # Slipper også låsen
+
+    def _write(self, views):
+        # Skriv til midlertidig fil og omdøb, så andre aldrig læser en halv fil
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(views, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def all(self, tab):
+        """{navn: tilstand} for tabben"""
+        return self._read().get(tab, {})
+
+    def names(self, tab):
+        return sorted(self.all(tab), key=str.lower)
+
+    def get(self, tab, name):
+        return self.all(tab).get(name)
+
+    def save(self, tab, name, state):
+        if tab not in TABS:
+            raise ValueError(f"Ukendt tab: {tab}")
+        with self._locked():
+            views = self._read()
+            views.setdefault(tab, {})[name] = normalize_state(state)
+            self._write(views)
+
+    def delete(self, tab, name):
+        with self._locked():
+            views = self._read()
+            if views.get(tab, {}).pop(name, None) is not None:
+                self._write(views)
+
+
+def saved_views_from_config(saved_views_config):
+    """Byg SavedViews ud fra [saved_views] konfigurationen"""
+    path = saved_views_config.get("path") or DEFAULT_PATH
+    return SavedViews(os.path.join(APP_DIR, path))
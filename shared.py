@@ -1,35 +1,180 @@
 """
 Delte funktioner til CRM Dashboard
 """
+import datetime
+import os
+import tempfile
+import pandas as pd
+import pyarrow as pa
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
+from anomaly import FLOW_RATES, NEWSLETTER_RATES, RollingAnomalies, month_order
+from data_cache import cache_from_config, frames_of
+from history_archive import MonthArchive
+from incremental import MaterializedAggregate
+from pipeline import (
+    FLOW_LEVEL_KEYS, FLOW_LEVEL_MEASURES, NEWSLETTER_KEYS, NEWSLETTER_MEASURES, FlowSortKeys, add_rates, build_flow_index,
+    open_client,
+)
+from metrics import REGISTRY
+from result_cache import normalize, register_result_cache_metrics, result_cache_from_config
+from rollups import NewsletterRollups
+from saved_views import saved_views_from_config
+from sheets_governor import DeadlineExceeded, governor_from_config
+from parallel_ingest import ingest_from_config
+from subscriber_analytics import SourceIndex, SubscriberAnalytics
+from sql_engine import SqlEngine
 
 # Spreadsheet URLs hentes fra secrets
 
+# Datasæt hvor lukkede måneder kan arkiveres (se history_archive.py)
+ARCHIVED_DATASETS = ('newsletter', 'flows')
+
+@st.cache_resource
+def get_sheets_governor():
+    """Returnerer processens fælles governor for Sheets kald (konfigureres under [sheets] i secrets)"""
+    return governor_from_config(st.secrets.get("sheets", {}))
+
+
 def get_gspread_client():
-    """Returnerer en autoriseret gspread client"""
-    gsheets_config = st.secrets["connections"]["gsheets"]
-    
-    credentials_dict = {
-        "type": gsheets_config.get("type", "service_account"),
-        "project_id": gsheets_config["project_id"],
-        "private_key_id": gsheets_config["private_key_id"],
-        "private_key": gsheets_config["private_key"],
-        "client_email": gsheets_config["client_email"],
-        "client_id": gsheets_config["client_id"],
-        "auth_uri": gsheets_config.get("auth_uri", "https://accounts.google.com/o/oauth2/auth"),
-        "token_uri": gsheets_config.get("token_uri", "https://oauth2.googleapis.com/token"),
-        "auth_provider_x509_cert_url": gsheets_config.get("auth_provider_x509_cert_url", "https://www.googleapis.com/oauth2/v1/certs"),
-        "client_x509_cert_url": gsheets_config.get("client_x509_cert_url", "")
-    }
-    
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets.readonly",
-        "https://www.googleapis.com/auth/drive.readonly"
-    ]
-    credentials = Credentials.from_service_account_info(credentials_dict, scopes=scopes)
-    return gspread.authorize(credentials)
+    """Returnerer en autoriseret gspread client hvor alle kald går gennem governor"""
+    return open_client(st.secrets["connections"]["gsheets"], get_sheets_governor())
+
+
+@st.cache_resource
+def get_dataset_cache():
+    """Returnerer den delte datasæt-cache (konfigureres under [cache] i secrets)"""
+    cache = cache_from_config(st.secrets.get("cache", {}), fallback_errors=(DeadlineExceeded,))
+    REGISTRY.gauge('dataset_age_seconds', "Sekunder siden de serverede data blev hentet", ['dataset'], function=cache.ages)
+    return cache
+
+
+@st.cache_resource
+def get_ingest():
+    """Returnerer indlæsning af store ark (proces-pool/sidevis hentning), eller None (konfigureres under [ingest] i secrets)"""
+    return ingest_from_config(st.secrets.get("ingest", {}))
+
+
+@st.cache_resource
+def _create_sql_engine(kind):
+    return SqlEngine(kind)
+
+
+def get_sql_engine(table, df):
+    """Returnerer SQL-motoren med df indlæst (én gang pr. revision), eller None hvis den ikke er slået til"""
+    kind = st.secrets.get("engine", {}).get("sql")
+    if not kind or not has_data(df):
+        return None
+    engine = _create_sql_engine(kind)
+    engine.ensure(table, revision_of(df), lambda: arrow_table(df))
+    return engine
+
+
+@st.cache_resource
+def get_history_archive():
+    """Returnerer månedsarkivet, eller None hvis det ikke er slået til under [archive] i secrets"""
+    archive_config = st.secrets.get("archive", {})
+    if not archive_config.get("enabled", False):
+        return None
+    directory = archive_config.get("directory") or os.path.join(tempfile.gettempdir(), "crm_dashboard_archive")
+    return MonthArchive(
+        directory,
+        open_months=archive_config.get("open_months", 2),
+        full_resync_hours=archive_config.get("full_resync_hours", 24),
+    )
+
+
+def cached_dataset_name(dataset):
+    """Navnet datasættet har i den delte cache (kun de åbne måneder når arkivet er slået til)"""
+    if dataset in ARCHIVED_DATASETS and get_history_archive() is not None:
+        return f"{dataset}_open"
+    return dataset
+
+
+def with_revision(value, revision):
+    """Mærk datasættets frame(s) med den revision de er hentet under (df.attrs['revision'])"""
+    for frame in frames_of(value) or []:
+        frame.attrs['revision'] = revision
+    return value
+
+
+def revision_of(source):
+    """
+    Revisionen en frame (eller tuple af frames) fra en loader er hentet under,
+    eller None. Afledte resultater nøgles på den - aldrig på et nyt opslag i
+    den delte cache, som en anden replika kan have flyttet videre imens.
+    """
+    frames = frames_of(source)
+    return frames[0].attrs.get('revision') if frames else None
+
+
+def load_dataset(dataset, fetch):
+    """Henter et datasæt via den delte cache, mærket med sin revision"""
+    revision, value = get_dataset_cache().fetch(dataset, fetch)
+    return with_revision(value, revision)
+
+
+def load_archived_dataset(dataset, fetch, fetch_open):
+    """
+    Henter et månedsopdelt datasæt; med arkivet hentes kun de åbne måneder fra
+    Sheets, og frame'en indeholder kun dem (df.attrs['archive']). De lukkede
+    måneder læses fra arkivet med history(df, months) der hvor de bruges.
+    """
+    archive = get_history_archive()
+    if archive is None:
+        return load_dataset(dataset, fetch)
+    open_revision, open_df = get_dataset_cache().fetch(cached_dataset_name(dataset), lambda: fetch_open(archive))
+    # En fuld gen-synkronisering kan skrive lukkede måneder om uden at de åbne ændres.
+    # Revisionen tages før partitionerne læses: data kan være nyere end den, aldrig ældre
+    df = open_df.copy(deep=False)
+    df.attrs['archive'] = dataset
+    return with_revision(df, f"{open_revision}-{archive.revision(dataset)}")
+
+
+def archived_rows(df, months=None, where=None):
+    """
+    Arkivets rækker for months (alle hvis None), hvis df er indlæst med arkivet,
+    ellers en tom frame. Kun de berørte partitioner læses, og where (et
+    pyarrow.compute udtryk) beskærer dem i Arrow før de bliver til pandas.
+    """
+    dataset = df.attrs.get('archive')
+    if dataset is None:
+        return pd.DataFrame()
+    return get_history_archive().read(dataset, months, where=where)
+
+
+def history(df, months=None, where=None):
+    """
+    df plus arkivets rækker for months (alle hvis None) - uden arkivet df selv.
+    Rækkerne er ikke filtreret præcist (de åbne måneder er med uanset months);
+    det gør kalderen selv.
+    """
+    if 'archive' not in df.attrs:
+        return df
+    frames = [frame for frame in (archived_rows(df, months, where), df) if not frame.empty]
+    rows = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    rows.attrs = {'revision': revision_of(df)}
+    return rows
+
+
+def arrow_table(df):
+    """
+    Datasættet som Arrow-tabel uden kopi: frames fra den delte cache er
+    memory-mappet Arrow, og from_pandas genbruger deres buffere. Med arkivet
+    lægges de memory-mappede partitioner foran de åbne måneder.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    dataset = df.attrs.get('archive')
+    archived = get_history_archive().read_table(dataset) if dataset is not None else None
+    tables = [t for t in (archived, table) if t is not None and t.num_rows]
+    if len(tables) < 2:
+        return tables[0] if tables else table
+    return pa.concat_tables(tables, promote_options='permissive')
+
+
+def has_data(df):
+    """Om datasættet har rækker (med arkivet kan de åbne måneder være tomme)"""
+    dataset = df.attrs.get('archive')
+    return not df.empty or (dataset is not None and bool(get_history_archive().months(dataset)))
 
 
 def format_number(value):
@@ -42,8 +187,10 @@ def format_number(value):
         return f"{value:.0f}"
 
 
-def show_metric(col, label, current_val, prev_val=None, is_percent=False):
-    """Vis en metric med optional delta"""
+def show_metric(col, label, current_val, prev_val=None, is_percent=False, warning=None):
+    """Vis en metric med optional delta (og markering hvis warning er sat)"""
+    if warning:
+        label = f"{label} ⚠"
     if is_percent:
         val_fmt = f"{current_val:.1f}%"
     else:
@@ -52,7 +199,136 @@ def show_metric(col, label, current_val, prev_val=None, is_percent=False):
     if prev_val is not None and prev_val != 0:
         pct_change = ((current_val - prev_val) / prev_val) * 100
         delta_str = f"{pct_change:+.1f}%"
-        col.metric(label, val_fmt, delta=delta_str)
+        col.metric(label, val_fmt, delta=delta_str, help=warning)
     else:
-        col.metric(label, val_fmt)
+        col.metric(label, val_fmt, help=warning)
+
+
+
+@st.cache_resource
+def _create_materialized_aggregate(name):
+    verify = st.secrets.get("incremental", {}).get("verify", False)
+    if name == 'flow_level':
+        return MaterializedAggregate(
+            FLOW_LEVEL_KEYS, FLOW_LEVEL_MEASURES, lambda agg_df: add_rates(agg_df, 'Received_Email'), verify=verify
+        )
+    return MaterializedAggregate(NEWSLETTER_KEYS, NEWSLETTER_MEASURES, verify=verify)
+
+
+@st.cache_resource
+def _create_anomaly_detector(name):
+    anomaly_config = st.secrets.get("anomaly", {})
+    z = anomaly_config.get("z", 3.0)
+    if name == 'flow_level':
+        # Månedlige tal pr. flow og land: kortere vindue end for newsletters
+        return RollingAnomalies(
+            FLOW_LEVEL_KEYS, ['Flow_Trigger', 'Country'], lambda f: month_order(f['Year_Month']), FLOW_RATES,
+            window=anomaly_config.get("flow_window", 6), min_periods=3, z=z,
+        )
+    return RollingAnomalies(
+        NEWSLETTER_KEYS, ['Country'], lambda f: f['Date'], NEWSLETTER_RATES,
+        window=anomaly_config.get("window", 20), z=z,
+    )
+
+
+def _refreshed_aggregate(name, df):
+    """Aggregatets AggregateState (generation, frame, changes) for df's revision, taget samlet under låsen"""
+    aggregate = _create_materialized_aggregate(name)
+    revision = revision_of(df)
+    if revision is None or aggregate.revision != revision:
+        # Hele historikken læses kun ved en ny revision
+        return aggregate.refresh(revision, history(df))
+    return aggregate.state()
+
+
+def get_anomalies(name, df):
+    """Returnerer (detektor, afvigende rækker) for aggregatet, opdateret inkrementelt pr. revision"""
+    state = _refreshed_aggregate(name, df)
+    detector = _create_anomaly_detector(name)
+    result = detector.update(state.generation, state.frame, state.changes, state.generation - 1)
+    if result.empty:
+        return detector, result.assign(Afvigelse=pd.Series(dtype=str))
+    return detector, detector.flagged(result)
+
+
+def get_materialized_aggregate(name, df):
+    """Returnerer aggregatet ('flow_level' eller 'newsletter') opdateret til df's revision"""
+    return _refreshed_aggregate(name, df).frame
+
+
+@st.cache_resource
+def _revision_holder(name):
+    return {}
+
+
+def per_revision(name, df, build, extra=None):
+    """Returnerer build(df), bygget én gang pr. revision af df og extra (delt mellem sessioner)"""
+    revision = revision_of(df)
+    key = revision if extra is None else (revision, extra)
+    holder = _revision_holder(name)
+    if revision is None or holder.get('revision') != key:
+        holder['value'] = build(df)
+        holder['revision'] = key
+    return holder['value']
+
+
+@st.cache_resource
+def get_result_cache():
+    """Returnerer processens LRU til afledte resultater, eller None (konfigureres under [result_cache] i secrets)"""
+    cache = result_cache_from_config(st.secrets.get("result_cache", {}))
+    if cache is not None:
+        register_result_cache_metrics(cache, REGISTRY)
+    return cache
+
+
+def cached_result(name, df, filters, compute):
+    """compute() for filtertilstanden, genbrugt fra LRU'en så længe revisionen af df (datasættet) er den samme"""
+    cache = get_result_cache()
+    revision = revision_of(df)
+    if cache is None or revision is None:
+        return compute()
+    return cache.get_or_compute((name, revision, normalize(filters)), compute)
+
+
+@st.cache_resource
+def get_saved_views():
+    """Returnerer de gemte visninger (konfigureres under [saved_views] i secrets)"""
+    return saved_views_from_config(st.secrets.get("saved_views", {}))
+
+
+def precompute_saved_views(name, df, precompute):
+    """
+    Kører precompute(df) én gang pr. revision (og dag - relative perioder flytter
+    sig), så de gemte visningers resultater ligger klar i LRU'en
+    """
+    if get_result_cache() is None:
+        return None
+    return per_revision(name, df, precompute, extra=datetime.date.today())
+
+
+def get_flow_index(df):
+    """
+    Returnerer indekset til flow drill-down, bygget én gang pr. revision af Flows
+    data (med arkivet over de åbne måneder; de lukkede læses fra arkivet)
+    """
+    return per_revision('flow_index', df, build_flow_index)
+
+
+def get_flow_sort_keys(df):
+    """Returnerer måneder og sorteringsnøgler for Flows data, bygget én gang pr. revision"""
+    return per_revision('flow_sort_keys', df, lambda source: FlowSortKeys(history(source)))
+
+
+def get_newsletter_rollups(df):
+    """Returnerer dag/uge/måned/kvartal summer for Newsletter data, bygget én gang pr. revision"""
+    return per_revision('newsletter_rollups', df, lambda source: NewsletterRollups(history(source)))
+
+
+def get_subscriber_analytics(full_df, light_df):
+    """Returnerer vækst-tidsserierne for Full og Light, bygget én gang pr. revision"""
+    return per_revision('subscriber_analytics', (full_df, light_df), SubscriberAnalytics)
+
 
+def get_source_index(events_df):
+    """Returnerer kildeindekset til Nye Subscribers per Kilde, bygget én gang pr. revision"""
+    return per_revision('source_index', events_df, SourceIndex)
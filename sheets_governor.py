@@ -0,0 +1,186 @@
+"""
+Kvote-styring af Google Sheets kald - CRM Dashboard
+Token bucket dimensioneret efter læsekvoten, eksponentiel backoff med jitter
+ved 429/5xx og en samlet deadline pr. kald. Hvert forsøg måles pr. worksheet
+(sheets_call_seconds, sheets_call_errors_total i metrics.py).
+"""
+import logging
+import random
+import threading
+import time
+
+from metrics import REGISTRY, log_event
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+SHEETS_CALL_SECONDS = REGISTRY.histogram(
+    'sheets_call_seconds', "Varighed af kald til Google Sheets pr. forsøg", ['worksheet', 'method'])
+SHEETS_CALL_ERRORS = REGISTRY.counter(
+    'sheets_call_errors_total', "Fejlede forsøg på kald til Google Sheets", ['worksheet', 'method', 'status'])
+
+
+class DeadlineExceeded(Exception):
+    """Kaldet kunne ikke gennemføres inden for deadline"""
+
+
+def status_code_of(exc):
+    """Find HTTP statuskode på en gspread APIError (eller tilsvarende fejl)"""
+    code = getattr(exc, 'code', None)
+    if isinstance(code, int):
+        return code
+    response = getattr(exc, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+class TokenBucket:
+    """Trådsikker token bucket: `rate_per_minute` tokens fyldes jævnt på"""
+
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = float(self.capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    def acquire(self, deadline=None):
+        """Tag ét token; vent om nødvendigt. Returnerer False hvis deadline ville overskrides"""
+        while True:
+            with self._lock:
+                now = self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            self._sleep(wait)
+
+
+class SheetsGovernor:
+    """Central styring af alle Sheets kald"""
+
+    def __init__(self, bucket, max_retries=5, base_delay=1.0, max_delay=32.0, deadline=60.0,
+                 clock=time.monotonic, sleep=time.sleep, rng=random.random):
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self._clock = clock
+        self._sleep = sleep
+        self._rng = rng
+
+    def call(self, fn, *args, **kwargs):
+        """Kald fn under kvote; genforsøg ved 429/5xx indtil deadline"""
+        deadline_at = self._clock() + self.deadline
+        attempt = 0
+        while True:
+            if not self.bucket.acquire(deadline_at):
+                raise DeadlineExceeded(f"Ingen kvote inden for {self.deadline:.0f}s")
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if status_code_of(e) not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                    raise
+                # "Full jitter": tilfældig ventetid op til den eksponentielle grænse
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * self._rng()
+                if self._clock() + delay > deadline_at:
+                    raise DeadlineExceeded(f"Deadline på {self.deadline:.0f}s overskredet") from e
+                self._sleep(delay)
+                attempt += 1
+
+
+def governor_from_config(sheets_config):
+    """Byg governor ud fra [sheets] konfigurationen"""
+    # Kvoten gælder hele projektet - del den mellem replikaer via reads_per_minute
+    bucket = TokenBucket(sheets_config.get("reads_per_minute", 60))
+    return SheetsGovernor(
+        bucket,
+        max_retries=sheets_config.get("max_retries", 5),
+        base_delay=sheets_config.get("backoff_base", 1.0),
+        max_delay=sheets_config.get("backoff_max", 32.0),
+        deadline=sheets_config.get("deadline", 60.0),
+    )
+
+
+def instrumented(fn, worksheet, method):
+    """fn hvor hvert forsøg måles, og fejl tælles med HTTP status, pr. worksheet"""
+    def call(*args, **kwargs):
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            status = str(status_code_of(e) or type(e).__name__)
+            SHEETS_CALL_ERRORS.inc(worksheet=worksheet, method=method, status=status)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            SHEETS_CALL_SECONDS.observe(elapsed, worksheet=worksheet, method=method)
+            log_event('sheets_call', logging.INFO if status == 'ok' else logging.WARNING,
+                      worksheet=worksheet, method=method, status=status, seconds=round(elapsed, 4))
+    return call
+
+
+class GovernedWorksheet:
+    """Worksheet hvor datakald går gennem governor"""
+
+    def __init__(self, worksheet, governor):
+        self._worksheet = worksheet
+        self._governor = governor
+
+    def _call(self, method, *args, **kwargs):
+        fn = instrumented(getattr(self._worksheet, method), getattr(self._worksheet, 'title', ''), method)
+        return self._governor.call(fn, *args, **kwargs)
+
+    def get_all_values(self, *args, **kwargs):
+        return self._call('get_all_values', *args, **kwargs)
+
+    def get_values(self, *args, **kwargs):
+        return self._call('get_values', *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._worksheet, name)
+
+
+class GovernedSpreadsheet:
+    """Spreadsheet hvor opslag af worksheets går gennem governor"""
+
+    def __init__(self, spreadsheet, governor):
+        self._spreadsheet = spreadsheet
+        self._governor = governor
+
+    @property
+    def sheet1(self):
+        sheet1 = instrumented(lambda: self._spreadsheet.sheet1, 'sheet1', 'sheet1')
+        return GovernedWorksheet(self._governor.call(sheet1), self._governor)
+
+    def worksheet(self, title):
+        lookup = instrumented(self._spreadsheet.worksheet, title, 'worksheet')
+        return GovernedWorksheet(self._governor.call(lookup, title), self._governor)
+
+    def __getattr__(self, name):
+        return getattr(self._spreadsheet, name)
+
+
+class GovernedClient:
+    """gspread client hvor open_by_url går gennem governor"""
+
+    def __init__(self, client, governor):
+        self._client = client
+        self._governor = governor
+
+    def open_by_url(self, url):
+        open_by_url = instrumented(self._client.open_by_url, '', 'open_by_url')
+        return GovernedSpreadsheet(self._governor.call(open_by_url, url), self._governor)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
@@ -0,0 +1,141 @@
+"""
+Indlejret SQL-motor - CRM Dashboard
+Valgfri: filtre og aggregeringer fra Newsletters og Flows oversættes til
+parametriserede queries i DuckDB (kolonnebaseret, flertrådet) eller SQLite
+(standardbibliotek, fallback). Subscribers bruger de forudberegnede
+tidsserier i subscriber_analytics.py og har ingen SQL-sti.
+
+DuckDB scanner datasættets Arrow-tabel direkte (de memory-mappede filer fra
+den delte cache og arkivet), så processen ikke får sin egen kopi. SQLite
+indlæser en kopi én gang pr. revision. Lister af filterværdier sendes som én
+parameter (UNNEST / json_each), så store valg ikke rammer SQLites grænse for
+antal parametre.
+
+Aktiveres i secrets:
+    [engine]
+    sql = "duckdb"   # eller "sqlite"; udelad for ren pandas
+"""
+import json
+import sqlite3
+import threading
+
+import pandas as pd
+
+from pipeline import add_rates
+
+try:
+    import duckdb
+except ImportError:  # DuckDB er valgfri
+    duckdb = None
+
+COUNTRY_MEASURES = ['Total_Received', 'Unique_Opens', 'Unique_Clicks', 'Unsubscribed']
+FLOW_MEASURES = ['Received_Email', 'Total_Opens', 'Unique_Opens', 'Total_Clicks', 'Unique_Clicks', 'Unsubscribed', 'Bounced']
+
+
+def quote(identifier):
+    """Citer et kolonnenavn (navne som 'Open Rate %' og 'Master Source')"""
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def sum_columns(columns):
+    # DuckDB summerer BIGINT til HUGEINT, som pandas ellers læser som float
+    return ', '.join(f"CAST(SUM({quote(c)}) AS BIGINT) AS {quote(c)}" for c in columns)
+
+
+class SqlEngine:
+    """Tynd wrapper om en DuckDB eller SQLite forbindelse"""
+
+    def __init__(self, kind='duckdb'):
+        if kind == 'duckdb' and duckdb is None:
+            kind = 'sqlite'
+        self.kind = kind
+        self._revisions = {}
+        self._tables = {}  # DuckDB: tabelnavn -> Arrow-tabel der scannes ved hver query
+        self._lock = threading.RLock()
+        if kind == 'duckdb':
+            self._con = duckdb.connect(':memory:')
+        else:
+            self._con = sqlite3.connect(':memory:', check_same_thread=False)
+
+    # --- Indlæsning ---
+
+    def ensure(self, table, revision, load):
+        """Gør load() (en Arrow-tabel) til tabellen hvis revisionen er ny (load kaldes kun da)"""
+        if self._revisions.get(table) == revision:
+            return
+        with self._lock:
+            if self._revisions.get(table) == revision:
+                return
+            arrow_table = load()
+            if self.kind == 'duckdb':
+                # Ingen kopi: tabellen registreres på hver cursor og scannes derfra
+                self._tables[table] = arrow_table
+            else:
+                arrow_table.to_pandas().to_sql(table, self._con, if_exists='replace', index=False)
+            self._revisions[table] = revision
+
+    # --- Queries ---
+
+    def query(self, sql, params=()):
+        """Kør en parametriseret query og returner en DataFrame"""
+        if self.kind == 'duckdb':
+            # En cursor pr. kald gør forbindelsen sikker at dele mellem sessioner
+            cursor = self._con.cursor()
+            for name, arrow_table in list(self._tables.items()):
+                cursor.register(name, arrow_table)
+            return cursor.execute(sql, list(params)).df()
+        with self._lock:
+            return pd.read_sql_query(sql, self._con, params=list(params))
+
+    def _in(self, column):
+        """'column IN (...)' hvor hele listen er én parameter (se _values)"""
+        if self.kind == 'duckdb':
+            return f"{quote(column)} IN (SELECT UNNEST(?))"
+        return f"{quote(column)} IN (SELECT value FROM json_each(?))"
+
+    def _values(self, values):
+        return list(values) if self.kind == 'duckdb' else json.dumps(list(values))
+
+    def _timestamp(self, value):
+        ts = pd.Timestamp(value)
+        # SQLite gemmer datoer som tekst i ISO-format
+        return ts.to_pydatetime() if self.kind == 'duckdb' else ts.strftime('%Y-%m-%d %H:%M:%S')
+
+    def newsletter_by_country(self, start, end, countries, campaigns, emails, email_col):
+        """Summer pr. (Date, ID_Campaign, email, Country) for de valgte filtre"""
+        if not countries or not campaigns or not emails:
+            return pd.DataFrame()
+        sums = sum_columns(COUNTRY_MEASURES)
+        sql = (
+            f"SELECT Date, ID_Campaign, {quote(email_col)}, Country, {sums} "
+            f"FROM newsletter WHERE Date >= ? AND Date <= ? "
+            f"AND {self._in('Country')} AND {self._in('ID_Campaign')} AND {self._in(email_col)} "
+            f"GROUP BY Date, ID_Campaign, {quote(email_col)}, Country"
+        )
+        params = [self._timestamp(start), self._timestamp(end),
+                  self._values(countries), self._values(campaigns), self._values(emails)]
+        result = self.query(sql, params)
+        result['Date'] = pd.to_datetime(result['Date'])
+        return result
+
+    def newsletter_totals(self, start, end, countries, email_col):
+        """Summer pr. (Date, ID_Campaign, email) for en periode (bruges til forrige periode)"""
+        if not countries:
+            return pd.DataFrame()
+        sums = sum_columns(COUNTRY_MEASURES)
+        sql = (
+            f"SELECT Date, ID_Campaign, {quote(email_col)}, {sums} "
+            f"FROM newsletter WHERE Date >= ? AND Date <= ? AND {self._in('Country')} "
+            f"GROUP BY Date, ID_Campaign, {quote(email_col)}"
+        )
+        return self.query(sql, [self._timestamp(start), self._timestamp(end), self._values(countries)])
+
+    def flow_level(self, months):
+        """Svarer til aggregate_to_flow_level for de valgte måneder"""
+        sums = sum_columns(FLOW_MEASURES)
+        sql = (
+            f"SELECT Year_Month, Flow_Trigger, Country, {sums} FROM flows "
+            f"WHERE {self._in('Year_Month')} "
+            f"GROUP BY Year_Month, Flow_Trigger, Country"
+        )
+        return add_rates(self.query(sql, [self._values(months)]), 'Received_Email')
@@ -0,0 +1,159 @@
+"""
+Subscriber tidsserier - CRM Dashboard
+Vækst måned-over-måned og år-over-år, vækstrater og rullende gennemsnit pr.
+land for Full og Light. Alt beregnes som hele array-operationer én gang pr.
+opdatering; tabben viser derefter de færdige frames direkte.
+"""
+import numpy as np
+import pandas as pd
+
+from pipeline import COUNTRIES
+
+SERIES_COLUMNS = COUNTRIES + ['Total']
+
+# Nøgle -> (visningsnavn, er procent)
+METRICS = {
+    'mom': ("Netto vækst (MoM)", False),
+    'mom_pct': ("Vækst % (MoM)", True),
+    'yoy': ("Netto vækst (YoY)", False),
+    'yoy_pct': ("Vækst % (YoY)", True),
+    'mom_avg3': ("Netto vækst, rullende 3 mdr", False),
+}
+
+
+def growth_rate(change, base):
+    """change / base i procent; 0 hvor basen ikke er positiv"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(base > 0, change / base * 100, 0.0)
+
+
+class SubscriberTier:
+    """Én tidsserie (Full eller Light): måneder x lande"""
+
+    def __init__(self, df):
+        columns = [c for c in SERIES_COLUMNS if c in df.columns]
+        chrono = df.dropna(subset=['Month']).sort_values('Month', kind='stable')
+        self.months = pd.DatetimeIndex(chrono['Month'])
+        self.columns = columns
+        self.counts = chrono[columns].to_numpy()
+        self.values = self.counts.astype(float)
+
+        # Forrige måned og samme måned sidste år slås op på kalendermåned (huller giver NaN)
+        month_number = self.months.year * 12 + self.months.month
+        position = pd.Series(np.arange(len(month_number)), index=month_number)
+        # Står en måned flere gange i arket, bruges den nederste række
+        position = position[~position.index.duplicated(keep='last')]
+        prev_values = self._lookup(position, month_number - 1)
+        last_year = self._lookup(position, month_number - 12)
+
+        mom = self.values - prev_values
+        yoy = self.values - last_year
+        self.metrics = {
+            'mom': mom,
+            'mom_pct': growth_rate(mom, prev_values),
+            'yoy': yoy,
+            'yoy_pct': growth_rate(yoy, last_year),
+            'mom_avg3': pd.DataFrame(mom).rolling(3, min_periods=1).mean().to_numpy(),
+        }
+
+        # Nyeste først med månedstekst, klar til visning
+        self.display = chrono.iloc[::-1].reset_index(drop=True)
+        self.display['Month'] = self.display['Month'].dt.strftime('%Y-%m')
+        self.metric_frames = {metric: self._metric_frame(values) for metric, values in self.metrics.items()}
+
+    def _lookup(self, position, month_numbers):
+        rows = position.reindex(month_numbers).to_numpy()
+        found = ~np.isnan(rows)
+        result = np.full(self.values.shape, np.nan)
+        result[found] = self.values[rows[found].astype(int)]
+        return result
+
+    def latest(self, column='Total'):
+        """(nyeste værdi, forrige række) for en kolonne; forrige er None med under to måneder"""
+        if not len(self.months) or column not in self.columns:
+            return 0, None
+        index = self.columns.index(column)
+        current = self.counts[-1, index]
+        previous = self.counts[-2, index] if len(self.months) >= 2 else None
+        return current, previous
+
+    def _metric_frame(self, values):
+        """Måneder (nyeste først) x lande"""
+        frame = pd.DataFrame(values[::-1], columns=self.columns)
+        frame.insert(0, 'Month', self.display['Month'])
+        return frame
+
+
+class SubscriberAnalytics:
+    """Tidsserier for Full og Light, bygget én gang pr. revision"""
+
+    def __init__(self, frames):
+        full_df, light_df = frames
+        self.tiers = {}
+        for name, df in (('Full', full_df), ('Light', light_df)):
+            if not df.empty and 'Month' in df.columns:
+                self.tiers[name] = SubscriberTier(df)
+
+    def latest(self, tier):
+        if tier not in self.tiers:
+            return 0, None
+        return self.tiers[tier].latest()
+
+
+class SourceIndex:
+    """Master Source -> Source -> måned med forudsummerede antal pr. land (Full_Sub_Events)"""
+
+    def __init__(self, events_df):
+        columns = [c for c in SERIES_COLUMNS if c in events_df.columns]
+        if not columns:
+            # Ingen antal pr. land i arket: tomt indeks (med en tom Total til graferne)
+            events_df, columns = events_df.iloc[0:0].assign(Total=0), ['Total']
+        keys = ['Month', 'Master Source', 'Source']
+        summed = events_df.dropna(subset=['Month']).groupby(keys, as_index=False)[columns].sum()
+        summed = summed.sort_values(keys, ascending=[False, True, True], kind='stable').reset_index(drop=True)
+
+        # Rækkepositioner pr. valg i de kaskaderende filtre (None = 'Alle')
+        self.positions = {(None, None): np.arange(len(summed))}
+        for master, rows in summed.groupby('Master Source', sort=False).indices.items():
+            self.positions[(master, None)] = rows
+        for source, rows in summed.groupby('Source', sort=False).indices.items():
+            self.positions[(None, source)] = rows
+        for (master, source), rows in summed.groupby(['Master Source', 'Source'], sort=False).indices.items():
+            self.positions[(master, source)] = rows
+
+        self.masters = sorted(summed['Master Source'].unique().tolist())
+        self.all_sources = sorted(summed['Source'].unique().tolist())
+        self.sources = {
+            master: sorted(summed.loc[self.positions[(master, None)], 'Source'].unique().tolist())
+            for master in self.masters
+        }
+
+        # Nye subscribers (Total) pr. måned og kilde, til grafen
+        total = 'Total' if 'Total' in columns else columns[-1]
+        self.by_master = summed.pivot_table(index='Month', columns='Master Source', values=total, aggfunc='sum', fill_value=0)
+        self.by_source = summed.pivot_table(index='Month', columns=['Master Source', 'Source'], values=total, aggfunc='sum', fill_value=0)
+
+        summed['Month'] = summed['Month'].dt.strftime('%Y-%m')
+        self.table = summed
+
+    def rows(self, master=None, source=None):
+        """Tabelrækker (nyeste måned først) for det valgte Master Source / Source"""
+        positions = self.positions.get((master, source))
+        if positions is None:
+            return self.table.iloc[0:0]
+        return self.table.iloc[positions]
+
+    def sources_for(self, master=None):
+        return self.all_sources if master is None else self.sources.get(master, [])
+
+    def series(self, master=None, source=None):
+        """Månedlige tidsserier (måned x kilde) for grafen: pr. Master Source, eller pr. Source under et Master Source"""
+        if master is None and source is None:
+            return self.by_master
+        frame = self.by_source
+        if master is not None:
+            frame = frame.loc[:, frame.columns.get_level_values(0) == master]
+        if source is not None:
+            frame = frame.loc[:, frame.columns.get_level_values(1) == source]
+        # Samme Source under flere Master Sources bliver til én serie
+        return frame.T.groupby(level='Source', sort=False).sum().T
@@ -4,148 +4,60 @@ Aggregeret på flow niveau (Flow - Trigger)
 """
 import streamlit as st
 import pandas as pd
-import re
+import pyarrow.compute as pc
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from shared import get_gspread_client, show_metric
+import pipeline
+from anomaly import summarize_flags
+from shared import archived_rows, cached_result, get_anomalies, get_flow_index, get_flow_sort_keys, get_gspread_client, get_ingest, get_materialized_aggregate, get_saved_views, get_sql_engine, has_data, load_archived_dataset, precompute_saved_views, show_metric
 
-def col_letter_to_index(col_str):
-    """Konverter kolonnebogstav til 0-baseret indeks (A=0, B=1, ..., Z=25, AA=26, ...)"""
-    result = 0
-    for char in col_str.upper():
-        result = result * 26 + (ord(char) - ord('A') + 1)
-    return result - 1
+VIEW_PLACEHOLDER = "Vælg visning..."
 
 
-@st.cache_data(ttl=300, show_spinner=False)  # Cache i 5 minutter
+@st.cache_resource(ttl=300, show_spinner=False)  # Delt read-only i processen i 5 minutter
 def load_flows_data():
-    """Henter Flows data fra Google Sheet"""
+    """
+    Henter Flows data (delt cache på tværs af server-processer).
+    Frame'en er delt read-only mellem alle sessioner og må ikke ændres
+    in-place; lav en .copy() hvis der skal skrives i den.
+    """
+    # Tjek om flows_spreadsheet er konfigureret
+    if "flows_spreadsheet" not in st.secrets["connections"]["gsheets"]:
+        st.error("⚠️ Mangler 'flows_spreadsheet' i secrets. Tilføj: flows_spreadsheet = 'URL'")
+        return pd.DataFrame()
+
     try:
-        gc = get_gspread_client()
-        
-        # Tjek om flows_spreadsheet er konfigureret
-        if "flows_spreadsheet" not in st.secrets["connections"]["gsheets"]:
-            st.error("⚠️ Mangler 'flows_spreadsheet' i secrets. Tilføj: flows_spreadsheet = 'URL'")
-            return pd.DataFrame()
-        
-        flows_url = st.secrets["connections"]["gsheets"]["flows_spreadsheet"]
-        spreadsheet = gc.open_by_url(flows_url)
-        
-        worksheet = spreadsheet.worksheet("All_Flow")
-        all_values = worksheet.get_all_values()
-        
-        if len(all_values) > 2:
-            # Skip header rows (row 1-2 contains headers)
-            data = all_values[2:]
-            raw_df = pd.DataFrame(data)
-        else:
-            return pd.DataFrame()
-            
+        return load_archived_dataset('flows', fetch_flows_data, fetch_flows_open_data)
     except Exception as e:
         st.error(f"Fejl ved indlæsning fra Google Sheets: {type(e).__name__}: {e}")
         st.info(f"URL brugt: {st.secrets['connections']['gsheets'].get('flows_spreadsheet', 'IKKE SAT')}")
         return pd.DataFrame()
-    
-    # Landekonfiguration med startkolonner (0-indexed)
-    # P=15, W=22, AD=29, AK=36, AR=43, AY=50, BF=57, BM=64, BT=71, CA=78, CH=85
-    country_configs = [
-        ('DK', col_letter_to_index('P')),   # 15
-        ('SE', col_letter_to_index('W')),   # 22
-        ('NO', col_letter_to_index('AD')),  # 29
-        ('FI', col_letter_to_index('AK')),  # 36
-        ('FR', col_letter_to_index('AR')),  # 43
-        ('UK', col_letter_to_index('AY')),  # 50
-        ('DE', col_letter_to_index('BF')),  # 57
-        ('AT', col_letter_to_index('BM')),  # 64
-        ('NL', col_letter_to_index('BT')),  # 71
-        ('BE', col_letter_to_index('CA')),  # 78
-        ('CH', col_letter_to_index('CH')),  # 85
-    ]
-    
-    # Metrics offset fra startkolonne
-    METRIC_OFFSETS = {
-        'Received_Email': 0,
-        'Total_Opens': 1,
-        'Unique_Opens': 2,
-        'Total_Clicks': 3,
-        'Unique_Clicks': 4,
-        'Unsubscribed': 5,
-        'Bounced': 6,
-    }
-    
-    all_country_data = []
-    
-    for country_code, start_col in country_configs:
-        try:
-            country_df = pd.DataFrame()
-            
-            # Info kolonner (A-H, index 0-7)
-            country_df['Send_Date'] = raw_df.iloc[:, 0]      # A: Send Date (2025-12)
-            country_df['Tags'] = raw_df.iloc[:, 1]           # B: Tags
-            country_df['Flow'] = raw_df.iloc[:, 2]           # C: Flow
-            country_df['Trigger'] = raw_df.iloc[:, 3]        # D: Trigger
-            country_df['Group'] = raw_df.iloc[:, 4]          # E: Group
-            country_df['Mail'] = raw_df.iloc[:, 5]           # F: Mail
-            country_df['Message'] = raw_df.iloc[:, 6]        # G: Message
-            country_df['AB'] = raw_df.iloc[:, 7]             # H: A/B
-            
-            # Metrics med offset
-            for metric_name, offset in METRIC_OFFSETS.items():
-                col_idx = start_col + offset
-                if col_idx < len(raw_df.columns):
-                    country_df[metric_name] = raw_df.iloc[:, col_idx]
-                else:
-                    country_df[metric_name] = 0
-            
-            country_df['Country'] = country_code
-            all_country_data.append(country_df)
-            
-        except Exception as e:
-            continue
-    
-    if not all_country_data:
-        return pd.DataFrame()
 
-    df = pd.concat(all_country_data, ignore_index=True)
-    
-    # Parse Send_Date (format: 2025-12 = År-Måned)
-    df['Year_Month'] = df['Send_Date'].astype(str).str.strip()
-    df = df[df['Year_Month'].str.match(r'^\d{4}-\d{1,2}$', na=False)]
-    
-    # Konverter numeriske kolonner
-    numeric_cols = ['Received_Email', 'Total_Opens', 'Unique_Opens', 'Total_Clicks', 'Unique_Clicks', 'Unsubscribed', 'Bounced']
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = df[col].astype(str).str.replace(',', '').str.replace('"', '').str.strip()
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-    
-    # Beregn rater
-    df['Open_Rate'] = df.apply(lambda x: (x['Unique_Opens'] / x['Received_Email'] * 100) if x['Received_Email'] > 0 else 0, axis=1)
-    df['Click_Rate'] = df.apply(lambda x: (x['Unique_Clicks'] / x['Received_Email'] * 100) if x['Received_Email'] > 0 else 0, axis=1)
-    df['CTR'] = df.apply(lambda x: (x['Unique_Clicks'] / x['Unique_Opens'] * 100) if x['Unique_Opens'] > 0 else 0, axis=1)
-    
-    # Opret Flow-Trigger identifier
-    df['Flow_Trigger'] = df['Flow'].astype(str).str.strip() + ' - ' + df['Trigger'].astype(str).str.strip()
-    
-    return df
+
+def fetch_flows_data():
+    """Henter Flows data fra Google Sheet"""
+    flows_url = st.secrets["connections"]["gsheets"]["flows_spreadsheet"]
+    return pipeline.fetch_flows_data(get_gspread_client(), flows_url, get_ingest())
 
 
-def get_available_months(df):
-    """Returner liste af tilgængelige måneder sorteret faldende (nyeste først)"""
-    months = df['Year_Month'].unique()
-    # Sorter som datoer, ikke tekst (2025-12 skal komme før 2025-9)
-    def month_sort_key(m):
-        try:
-            parts = m.split('-')
-            return (int(parts[0]), int(parts[1]))
-        except:
-            return (0, 0)
-    return sorted(months, key=month_sort_key, reverse=True)
+def fetch_flows_open_data(archive):
+    """Synkroniserer arkivet og henter kun de åbne måneder fra Google Sheet"""
+    flows_url = st.secrets["connections"]["gsheets"]["flows_spreadsheet"]
+    return pipeline.sync_flows_archive(get_gspread_client(), flows_url, archive)
 
 
-def aggregate_to_flow_level(df):
-    """Aggreger data til flow niveau (summer alle mails under samme flow)"""
-    agg_df = df.groupby(['Year_Month', 'Flow_Trigger', 'Country'], as_index=False).agg({
+def build_display_frame(flow_df, sel_countries, sel_flows):
+    """Summer pr. måned og flow (over de valgte lande) med genberegnede rater"""
+    current_df = flow_df[
+        (flow_df['Country'].isin(sel_countries)) &
+        (flow_df['Flow_Trigger'].isin(sel_flows))
+    ]
+
+    if current_df.empty:
+        return current_df
+
+    # Aggreger til visning (sum over alle lande og måneder)
+    display_df = current_df.groupby(['Year_Month', 'Flow_Trigger'], as_index=False).agg({
         'Received_Email': 'sum',
         'Total_Opens': 'sum',
         'Unique_Opens': 'sum',
@@ -155,12 +67,114 @@ def aggregate_to_flow_level(df):
         'Bounced': 'sum',
     })
     
-    # Genberegn rater efter aggregering
-    agg_df['Open_Rate'] = agg_df.apply(lambda x: (x['Unique_Opens'] / x['Received_Email'] * 100) if x['Received_Email'] > 0 else 0, axis=1)
-    agg_df['Click_Rate'] = agg_df.apply(lambda x: (x['Unique_Clicks'] / x['Received_Email'] * 100) if x['Received_Email'] > 0 else 0, axis=1)
-    agg_df['CTR'] = agg_df.apply(lambda x: (x['Unique_Clicks'] / x['Unique_Opens'] * 100) if x['Unique_Opens'] > 0 else 0, axis=1)
-    
-    return agg_df
+    # Genberegn rater
+    return pipeline.add_rates(display_df, 'Received_Email')
+
+
+def build_chart_frame(display_df, sort_keys):
+    """Rater pr. flow, sorteret efter flow nummer (Flow 1, Flow 2, ...)"""
+    chart_df = display_df.groupby('Flow_Trigger', as_index=False).agg({
+        'Received_Email': 'sum',
+        'Unique_Opens': 'sum',
+        'Unique_Clicks': 'sum',
+    })
+    chart_df['Open_Rate'] = (chart_df['Unique_Opens'] / chart_df['Received_Email'] * 100).round(1)
+    chart_df['Click_Rate'] = (chart_df['Unique_Clicks'] / chart_df['Received_Email'] * 100).round(2)
+    return chart_df.iloc[chart_df['Flow_Trigger'].map(sort_keys.flow_num).argsort()]
+
+
+def flow_month_frame(df, sel_months):
+    """(summer på flow niveau for de valgte måneder, motor) - i SQL-motoren hvis den er slået til"""
+    engine = get_sql_engine('flows', df)
+    engine_kind = engine.kind if engine is not None else None
+    if engine is not None:
+        flow_df = cached_result('flow_months', df, (sel_months, engine_kind), lambda: engine.flow_level(sel_months))
+    else:
+        flow_level_df = get_materialized_aggregate('flow_level', df)
+        flow_df = cached_result('flow_months', df, (sel_months, engine_kind), lambda: (
+            flow_level_df[flow_level_df['Year_Month'].isin(sel_months)].reset_index(drop=True)
+        ))
+    return flow_df, engine_kind
+
+
+def flow_results(df, flow_df, sel_months, sel_countries, sel_flows, engine_kind):
+    """(filtre, display_df) for filtertilstanden (df er datasættet resultaterne nøgles på)"""
+    # Resultater pr. filterkombination genbruges fra LRU'en (nøgle: revision + filtre)
+    filters = (sel_months, sel_countries, sel_flows, engine_kind)
+    display_df = cached_result('flow_display', df, filters, lambda: build_display_frame(flow_df, sel_countries, sel_flows))
+    return filters, display_df
+
+
+def flow_chart(df, filters, display_df, sort_keys):
+    return cached_result('flow_chart', df, filters, lambda: build_chart_frame(display_df, sort_keys))
+
+
+# --- Gemte visninger ---
+def view_months(view, available_months):
+    """Månederne i en gemt visning der findes i data (None = nyeste måned)"""
+    if view.get('months') is None:
+        return [available_months[0]]
+    return [month for month in available_months if month in view['months']]
+
+
+def precompute_flow_views(df):
+    """Beregner de gemte visningers tabel og graf på forhånd (lægges i LRU'en)"""
+    sort_keys = get_flow_sort_keys(df)
+    if not sort_keys.months:
+        return 0
+    views = get_saved_views().all('flows')
+    for view in views.values():
+        sel_months = view_months(view, sort_keys.months)
+        if not sel_months:
+            continue
+        flow_df, engine_kind = flow_month_frame(df, sel_months)
+        # Samme udvælgelse som i tabben: None = alle, ellers de valgte der findes i månederne
+        all_countries = sorted(flow_df['Country'].unique())
+        all_flows = sort_keys.sort_flows(flow_df['Flow_Trigger'].unique())
+        sel_countries = list(all_countries) if view.get('countries') is None else [c for c in all_countries if c in view['countries']]
+        sel_flows = list(all_flows) if view.get('flows') is None else [f for f in all_flows if f in view['flows']]
+        if not sel_countries or not sel_flows:
+            continue
+        filters, display_df = flow_results(df, flow_df, sel_months, sel_countries, sel_flows, engine_kind)
+        if not display_df.empty:
+            flow_chart(df, filters, display_df, sort_keys)
+    return len(views)
+
+
+def open_flow_view(available_months):
+    """on_change: gendan alle filtre fra den valgte visning i ét skridt"""
+    name = st.session_state.fl_saved_view
+    view = get_saved_views().get('flows', name) if name != VIEW_PLACEHOLDER else None
+    st.session_state.fl_saved_view = VIEW_PLACEHOLDER
+    if view is None:
+        return
+    st.session_state.fl_selected_months = view_months(view, available_months)
+    # None = alle (vælges når tabben tegnes); nye reset-tællere gentegner checkboksene
+    st.session_state.fl_selected_countries = view.get('countries')
+    st.session_state.fl_selected_flows = view.get('flows')
+    for counter in ('fl_cb_reset_month', 'fl_cb_reset_land', 'fl_cb_reset_flow'):
+        st.session_state[counter] = st.session_state.get(counter, 0) + 1
+
+
+def render_saved_views(available_months, sel_months, sel_countries, sel_flows, all_countries, all_flows):
+    views = get_saved_views()
+    with st.popover("Visninger", use_container_width=True):
+        names = views.names('flows')
+        st.selectbox("Åbn visning", [VIEW_PLACEHOLDER] + names, key="fl_saved_view",
+                     on_change=open_flow_view, args=(available_months,), label_visibility="collapsed")
+        name = st.text_input("Navn", key="fl_view_name", placeholder="Navn på visning", label_visibility="collapsed")
+        col_save, col_delete = st.columns(2)
+        if col_save.button("Gem", key="fl_view_save", use_container_width=True) and name.strip():
+            views.save('flows', name.strip(), {
+                # Kun nyeste måned gemmes som None, så visningen følger med til næste måned
+                'months': None if list(sel_months) == [available_months[0]] else sel_months,
+                'countries': None if len(sel_countries) == len(all_countries) else sel_countries,
+                'flows': None if len(sel_flows) == len(all_flows) else sel_flows,
+            })
+            st.rerun()
+        if col_delete.button("Slet", key="fl_view_delete", use_container_width=True, disabled=name.strip() not in names):
+            views.delete('flows', name.strip())
+            st.rerun()
 
 
 def render_flows_tab():
@@ -170,15 +184,19 @@ def render_flows_tab():
     try:
         with st.spinner('Henter flow data...'):
             df = load_flows_data()
-        if df.empty:
+        if not has_data(df):
             st.error("Kunne ikke hente flow data. Tjek Google Sheets konfiguration.")
             return
     except Exception as e:
         st.error(f"Fejl: {e}")
         return
 
-    # Få tilgængelige måneder
-    available_months = get_available_months(df)
+    # Indeks til drill-down og sorteringsnøgler (bygges kun når data er ændret)
+    flow_index = get_flow_index(df)
+    sort_keys = get_flow_sort_keys(df)
+
+    # Tilgængelige måneder, nyeste først
+    available_months = sort_keys.months
     
     if not available_months:
         st.warning("Ingen måneder tilgængelige i data.")
@@ -198,8 +216,11 @@ def render_flows_tab():
     if 'fl_cb_reset_flow' not in st.session_state:
         st.session_state.fl_cb_reset_flow = 0
 
+    # Gemte visninger beregnes på forhånd efter hver opdatering af data
+    precompute_saved_views('flow_saved_views', df, precompute_flow_views)
+
     # Layout - filters
-    col_month, col_land, col_flow, col_spacer = st.columns([1.2, 1, 1.5, 2.3])
+    col_month, col_land, col_flow, col_view, col_spacer = st.columns([1.2, 1, 1.5, 1, 1.3])
 
     # Måned vælger (dropdown med multiselect)
     with col_month:
@@ -233,19 +254,14 @@ def render_flows_tab():
         st.warning("Vælg mindst én måned.")
         return
     
-    df_month_filtered = df[df['Year_Month'].isin(sel_months)]
-
-    # Aggreger til flow niveau
-    flow_df = aggregate_to_flow_level(df_month_filtered)
+    # Aggreger til flow niveau (i SQL-motoren hvis den er slået til)
+    flow_df, engine_kind = flow_month_frame(df, sel_months)
 
     # Filter options
     all_countries = sorted(flow_df['Country'].unique())
     
     # Sorter flows efter flow nummer (Flow 1, Flow 2, ...)
-    def flow_sort_key(f):
-        match = re.search(r'Flow\s*(\d+)', f)
-        return int(match.group(1)) if match else 999
-    all_flows = sorted(flow_df['Flow_Trigger'].unique(), key=flow_sort_key)
+    all_flows = sort_keys.sort_flows(flow_df['Flow_Trigger'].unique())
 
     # Initialize selections
     if st.session_state.fl_selected_countries is None:
@@ -321,35 +337,19 @@ def render_flows_tab():
     sel_countries = st.session_state.fl_selected_countries
     sel_flows = st.session_state.fl_selected_flows
 
+    with col_view:
+        render_saved_views(available_months, sel_months, sel_countries, sel_flows, all_countries, all_flows)
+
     if not sel_countries or not sel_flows:
         st.warning("Vælg mindst ét land og én flow.")
         return
 
-    current_df = flow_df[
-        (flow_df['Country'].isin(sel_countries)) &
-        (flow_df['Flow_Trigger'].isin(sel_flows))
-    ].copy()
+    filters, display_df = flow_results(df, flow_df, sel_months, sel_countries, sel_flows, engine_kind)
 
-    if current_df.empty:
+    if display_df.empty:
         st.warning("Ingen data matcher de valgte filtre.")
         return
 
-    # Aggreger til visning (sum over alle lande og måneder)
-    display_df = current_df.groupby(['Year_Month', 'Flow_Trigger'], as_index=False).agg({
-        'Received_Email': 'sum',
-        'Total_Opens': 'sum',
-        'Unique_Opens': 'sum',
-        'Total_Clicks': 'sum',
-        'Unique_Clicks': 'sum',
-        'Unsubscribed': 'sum',
-        'Bounced': 'sum',
-    })
-    
-    # Genberegn rater
-    display_df['Open_Rate'] = display_df.apply(lambda x: (x['Unique_Opens'] / x['Received_Email'] * 100) if x['Received_Email'] > 0 else 0, axis=1)
-    display_df['Click_Rate'] = display_df.apply(lambda x: (x['Unique_Clicks'] / x['Received_Email'] * 100) if x['Received_Email'] > 0 else 0, axis=1)
-    display_df['CTR'] = display_df.apply(lambda x: (x['Unique_Clicks'] / x['Unique_Opens'] * 100) if x['Unique_Opens'] > 0 else 0, axis=1)
-
     # KPI totaler
     total_received = display_df['Received_Email'].sum()
     total_opens = display_df['Unique_Opens'].sum()
@@ -363,29 +363,26 @@ def render_flows_tab():
 
     # KPI Cards
     col1, col2, col3, col4, col5, col6 = st.columns(6)
+    # Afvigende måneder pr. flow og land (rullende statistik)
+    detector, flagged = get_anomalies('flow_level', df)
+    flagged = flagged[
+        flagged['Year_Month'].isin(sel_months) & flagged['Country'].isin(sel_countries)
+        & flagged['Flow_Trigger'].isin(sel_flows)
+    ] if not flagged.empty else flagged
+
     show_metric(col1, "Emails Sendt", total_received)
     show_metric(col2, "Unikke Opens", total_opens)
     show_metric(col3, "Unikke Clicks", total_clicks)
-    show_metric(col4, "Open Rate", open_rate, is_percent=True)
-    show_metric(col5, "Click Rate", click_rate, is_percent=True)
+    show_metric(col4, "Open Rate", open_rate, is_percent=True,
+                warning=detector.warning(flagged, 'Open_Rate', 'open rate') if not flagged.empty else None)
+    show_metric(col5, "Click Rate", click_rate, is_percent=True,
+                warning=detector.warning(flagged, 'Click_Rate', 'click rate') if not flagged.empty else None)
     show_metric(col6, "Click Through Rate", ctr, is_percent=True)
 
     st.markdown("<div style='height: 15px;'></div>", unsafe_allow_html=True)
 
     # Chart - aggregeret per flow
-    chart_df = display_df.groupby('Flow_Trigger', as_index=False).agg({
-        'Received_Email': 'sum',
-        'Unique_Opens': 'sum',
-        'Unique_Clicks': 'sum',
-    })
-    chart_df['Open_Rate'] = (chart_df['Unique_Opens'] / chart_df['Received_Email'] * 100).round(1)
-    chart_df['Click_Rate'] = (chart_df['Unique_Clicks'] / chart_df['Received_Email'] * 100).round(2)
-    
-    # Sorter efter flow nummer (Flow 1, Flow 2, ...)
-    def chart_flow_sort_key(f):
-        match = re.search(r'Flow\s*(\d+)', f)
-        return int(match.group(1)) if match else 999
-    chart_df = chart_df.iloc[chart_df['Flow_Trigger'].map(chart_flow_sort_key).argsort()]
+    chart_df = flow_chart(df, filters, display_df, sort_keys)
 
     fig = make_subplots(specs=[[{"secondary_y": True}]])
     
@@ -429,17 +426,13 @@ def render_flows_tab():
     st.markdown("<div style='height: 20px;'></div>", unsafe_allow_html=True)
 
     # Tabel
-    table_df = display_df[['Year_Month', 'Flow_Trigger', 'Received_Email', 'Unique_Opens', 'Unique_Clicks', 'Open_Rate', 'Click_Rate', 'CTR', 'Unsubscribed', 'Bounced']].copy()
+    table_df = display_df[['Year_Month', 'Flow_Trigger', 'Received_Email', 'Unique_Opens', 'Unique_Clicks', 'Open_Rate', 'Click_Rate', 'CTR', 'Unsubscribed', 'Bounced']]
+    table_df = table_df.merge(summarize_flags(flagged, ['Year_Month', 'Flow_Trigger']), on=['Year_Month', 'Flow_Trigger'], how='left')
+    table_df['Afvigelse'] = table_df['Afvigelse'].fillna('')
     
     # Sorter: nyeste måned først, derefter laveste flow nummer
-    def month_to_sortable(m):
-        try:
-            parts = m.split('-')
-            return int(parts[0]) * 100 + int(parts[1])  # 2025-12 -> 202512
-        except:
-            return 0
-    table_df['_month_num'] = table_df['Year_Month'].apply(month_to_sortable)
-    table_df['_flow_num'] = table_df['Flow_Trigger'].apply(lambda f: int(re.search(r'Flow\s*(\d+)', f).group(1)) if re.search(r'Flow\s*(\d+)', f) else 999)
+    table_df['_month_num'] = table_df['Year_Month'].map(sort_keys.month_key)
+    table_df['_flow_num'] = table_df['Flow_Trigger'].map(sort_keys.flow_num)
     table_df = table_df.sort_values(['_month_num', '_flow_num'], ascending=[False, True])
     table_df = table_df.drop(columns=['_month_num', '_flow_num'])
     table_height = min((len(table_df) + 1) * 35 + 3, 600)
@@ -457,9 +450,41 @@ def render_flows_tab():
             "CTR": st.column_config.NumberColumn("CTR", format="%.1f%%", width="small"),
             "Unsubscribed": st.column_config.NumberColumn("Unsub", format="localized", width="small"),
             "Bounced": st.column_config.NumberColumn("Bounced", format="localized", width="small"),
+            "Afvigelse": st.column_config.TextColumn("Afvigelse", width="medium"),
         }
     )
 
+    # Drill-down: ét flow foldes ud på Mail/Message/AB (beregnes kun når et flow er valgt)
+    st.markdown("<div style='height: 20px;'></div>", unsafe_allow_html=True)
+    drill_options = ["Vælg flow..."] + [f for f in all_flows if f in sel_flows]
+    drill_flow = st.selectbox("Drill-down", drill_options, key="fl_drill_flow")
+    if drill_flow != drill_options[0]:
+        # Med arkivet læses kun de valgte måneders partitioner, beskåret til flowet i Arrow
+        archived = archived_rows(df, sel_months, (pc.field('Flow_Trigger') == drill_flow) & pc.field('Country').isin(sel_countries))
+        detail_df = pipeline.flow_drilldown(df, flow_index, drill_flow, sel_months, sel_countries, archived)
+        if detail_df.empty:
+            st.info("Ingen mails for det valgte flow.")
+        else:
+            detail_df = detail_df.sort_values('Received_Email', ascending=False)
+            st.dataframe(
+                detail_df[['Group', 'Mail', 'Message', 'AB', 'Received_Email', 'Unique_Opens', 'Unique_Clicks', 'Open_Rate', 'Click_Rate', 'CTR', 'Unsubscribed', 'Bounced']],
+                use_container_width=True, hide_index=True,
+                column_config={
+                    "Group": st.column_config.TextColumn("Gruppe", width="small"),
+                    "Mail": st.column_config.TextColumn("Mail", width="medium"),
+                    "Message": st.column_config.TextColumn("Message", width="large"),
+                    "AB": st.column_config.TextColumn("A/B", width="small"),
+                    "Received_Email": st.column_config.NumberColumn("Sendt", format="localized", width="small"),
+                    "Unique_Opens": st.column_config.NumberColumn("Opens", format="localized", width="small"),
+                    "Unique_Clicks": st.column_config.NumberColumn("Clicks", format="localized", width="small"),
+                    "Open_Rate": st.column_config.NumberColumn("Open Rate", format="%.1f%%", width="small"),
+                    "Click_Rate": st.column_config.NumberColumn("Click Rate", format="%.1f%%", width="small"),
+                    "CTR": st.column_config.NumberColumn("CTR", format="%.1f%%", width="small"),
+                    "Unsubscribed": st.column_config.NumberColumn("Unsub", format="localized", width="small"),
+                    "Bounced": st.column_config.NumberColumn("Bounced", format="localized", width="small"),
+                }
+            )
+
     if st.button('Opdater Data', key="fl_refresh"):
         st.rerun()
 
@@ -3,98 +3,48 @@ Newsletters Tab - CRM Dashboard
 """
 import streamlit as st
 import pandas as pd
+import pyarrow.compute as pc
 import datetime
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from shared import get_gspread_client, show_metric
+import ab_analysis
+from anomaly import summarize_flags
+from history_archive import month_range
+import pipeline
+from pipeline import COUNTRIES, NEWSLETTER_RATE_COLUMNS, add_rates
+from shared import cached_result, get_anomalies, get_gspread_client, get_ingest, get_materialized_aggregate, get_newsletter_rollups, get_saved_views, get_sql_engine, has_data, history, load_archived_dataset, precompute_saved_views, show_metric
 
+PRESET_OPTIONS = [
+    "Sidste 7 dage", "Sidste 30 dage", "Denne maned",
+    "Dette kvartal", "I ar", "Sidste maned", "Sidste kvartal",
+]
+VIEW_PLACEHOLDER = "Vælg visning..."
 
-@st.cache_data(ttl=300, show_spinner=False)  # Cache i 5 minutter
+
+@st.cache_resource(ttl=300, show_spinner=False)  # Delt read-only i processen i 5 minutter
 def load_newsletter_data():
-    """Henter Newsletter data fra Google Sheet"""
+    """
+    Henter Newsletter data (delt cache på tværs af server-processer).
+    Frame'en er delt read-only mellem alle sessioner og må ikke ændres
+    in-place; lav en .copy() hvis der skal skrives i den.
+    """
     try:
-        gc = get_gspread_client()
-        spreadsheet_url = st.secrets["connections"]["gsheets"]["spreadsheet"]
-        spreadsheet = gc.open_by_url(spreadsheet_url)
-        worksheet = spreadsheet.sheet1
-        all_values = worksheet.get_all_values()
-        
-        if len(all_values) > 2:
-            data = all_values[2:]
-            raw_df = pd.DataFrame(data)
-        else:
-            return pd.DataFrame()
-            
+        return load_archived_dataset('newsletter', fetch_newsletter_data, fetch_newsletter_open_data)
     except Exception as e:
         st.error(f"Fejl ved indlæsning fra Google Sheets: {e}")
         return pd.DataFrame()
-    
-    # Landekonfiguration
-    country_configs = [
-        ('DK', 15), ('SE', 21), ('NO', 27), ('FI', 33), ('FR', 39),
-        ('UK', 45), ('DE', 51), ('AT', 57), ('NL', 63), ('BE', 69), ('CH', 75),
-    ]
-    
-    all_country_data = []
-    
-    for country_code, start_col in country_configs:
-        try:
-            country_df = pd.DataFrame()
-            country_df['Send Year'] = raw_df.iloc[:, 0]
-            country_df['Send Month'] = raw_df.iloc[:, 1]
-            country_df['Send Day'] = raw_df.iloc[:, 2]
-            country_df['Send Time'] = raw_df.iloc[:, 3]
-            country_df['Number'] = raw_df.iloc[:, 4]
-            country_df['Campaign Name'] = raw_df.iloc[:, 5]
-            country_df['Email'] = raw_df.iloc[:, 6]
-            country_df['Message'] = raw_df.iloc[:, 7]
-            country_df['Variant'] = raw_df.iloc[:, 8]
-            
-            country_df['Total_Received'] = raw_df.iloc[:, start_col + 0]
-            country_df['Total_Opens_Raw'] = raw_df.iloc[:, start_col + 1]
-            country_df['Unique_Opens'] = raw_df.iloc[:, start_col + 2]
-            country_df['Total_Clicks_Raw'] = raw_df.iloc[:, start_col + 3]
-            country_df['Unique_Clicks'] = raw_df.iloc[:, start_col + 4]
-            country_df['Unsubscribed'] = raw_df.iloc[:, start_col + 5]
-            country_df['Country'] = country_code
-            
-            all_country_data.append(country_df)
-        except Exception:
-            continue
-    
-    if not all_country_data:
-        return pd.DataFrame()
 
-    df = pd.concat(all_country_data, ignore_index=True)
-    
-    df['Date'] = pd.to_datetime(
-        df['Send Year'].astype(str) + '-' + 
-        df['Send Month'].astype(str) + '-' + 
-        df['Send Day'].astype(str), 
-        errors='coerce'
-    )
-    df = df.dropna(subset=['Date'])
 
-    numeric_cols = ['Total_Received', 'Unique_Opens', 'Unique_Clicks', 'Unsubscribed']
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = df[col].astype(str).str.replace(',', '').str.replace('"', '')
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-    
-    df['Open Rate %'] = df.apply(lambda x: (x['Unique_Opens'] / x['Total_Received'] * 100) if x['Total_Received'] > 0 else 0, axis=1)
-    df['Click Rate %'] = df.apply(lambda x: (x['Unique_Clicks'] / x['Total_Received'] * 100) if x['Total_Received'] > 0 else 0, axis=1)
-    df['Click Through Rate %'] = df.apply(lambda x: (x['Unique_Clicks'] / x['Unique_Opens'] * 100) if x['Unique_Opens'] > 0 else 0, axis=1)
-    
-    df['ID_Campaign'] = df['Number'].astype(str) + ' - ' + df['Campaign Name'].astype(str)
-    df['Email_Message_Base'] = df['Email'].astype(str) + ' - ' + df['Message'].astype(str)
-    df['Email_Message_Full'] = df.apply(
-        lambda x: f"{x['Email']} - {x['Message']} - {x['Variant']}" 
-        if pd.notna(x['Variant']) and str(x['Variant']).strip() not in ['', 'nan', 'None'] 
-        else f"{x['Email']} - {x['Message']}", 
-        axis=1
-    )
-    
-    return df
+def fetch_newsletter_data():
+    """Henter Newsletter data fra Google Sheet"""
+    spreadsheet_url = st.secrets["connections"]["gsheets"]["spreadsheet"]
+    return pipeline.fetch_newsletter_data(get_gspread_client(), spreadsheet_url, get_ingest())
+
+
+def fetch_newsletter_open_data(archive):
+    """Synkroniserer arkivet og henter kun de åbne måneder fra Google Sheet"""
+    spreadsheet_url = st.secrets["connections"]["gsheets"]["spreadsheet"]
+    return pipeline.sync_newsletter_archive(get_gspread_client(), spreadsheet_url, archive)
 
 
 def get_quarter_start(date):
@@ -124,33 +74,21 @@ def calculate_date_range(preset, today, yesterday):
     return None
 
 
-def filter_data(dataset, start, end, sel_countries, sel_id_campaigns, sel_email_messages, email_col):
-    mask = (dataset['Date'] >= pd.to_datetime(start)) & (dataset['Date'] <= pd.to_datetime(end))
-    temp_df = dataset.loc[mask].copy()
-    
+def filter_data(dataset, start, end, sel_countries, sel_id_campaigns, sel_email_messages, email_col, engine=None):
     if len(sel_countries) == 0 or len(sel_id_campaigns) == 0 or len(sel_email_messages) == 0:
         return pd.DataFrame(), pd.DataFrame()
     
-    temp_df = temp_df[temp_df['Country'].isin(sel_countries)]
-    temp_df = temp_df[temp_df['ID_Campaign'].astype(str).isin(sel_id_campaigns)]
-    temp_df = temp_df[temp_df[email_col].astype(str).isin(sel_email_messages)]
+    if engine is not None:
+        # Filtre og sum pr. land skubbes ned i SQL-motoren
+        temp_df = engine.newsletter_by_country(start, end, sel_countries, sel_id_campaigns, sel_email_messages, email_col)
+    else:
+        mask = (dataset['Date'] >= pd.to_datetime(start)) & (dataset['Date'] <= pd.to_datetime(end))
+        temp_df = dataset.loc[mask]
+        temp_df = temp_df[temp_df['Country'].isin(sel_countries)]
+        temp_df = temp_df[temp_df['ID_Campaign'].astype(str).isin(sel_id_campaigns)]
+        temp_df = temp_df[temp_df[email_col].astype(str).isin(sel_email_messages)]
     
     if not temp_df.empty:
-        pivot_df = temp_df.pivot_table(
-            index=['Date', 'ID_Campaign', email_col],
-            columns='Country',
-            values='Total_Received',
-            aggfunc='sum',
-            fill_value=0
-        ).reset_index()
-        
-        all_countries = ['DK', 'SE', 'NO', 'FI', 'FR', 'UK', 'DE', 'AT', 'NL', 'BE', 'CH']
-        for country in all_countries:
-            if country not in pivot_df.columns:
-                pivot_df[country] = 0
-        
-        pivot_df['Total'] = sum(pivot_df[c] for c in all_countries)
-        
         agg_df = temp_df.groupby(['Date', 'ID_Campaign', email_col], as_index=False).agg({
             'Total_Received': 'sum',
             'Unique_Opens': 'sum',
@@ -160,21 +98,211 @@ def filter_data(dataset, start, end, sel_countries, sel_id_campaigns, sel_email_
         
         agg_df = agg_df.rename(columns={email_col: 'Email_Message'})
         
-        agg_df['Open Rate %'] = agg_df.apply(
-            lambda x: (x['Unique_Opens'] / x['Total_Received'] * 100) if x['Total_Received'] > 0 else 0, axis=1
-        )
-        agg_df['Click Rate %'] = agg_df.apply(
-            lambda x: (x['Unique_Clicks'] / x['Total_Received'] * 100) if x['Total_Received'] > 0 else 0, axis=1
-        )
-        agg_df['Click Through Rate %'] = agg_df.apply(
-            lambda x: (x['Unique_Clicks'] / x['Unique_Opens'] * 100) if x['Unique_Opens'] > 0 else 0, axis=1
-        )
+        agg_df = add_rates(agg_df, 'Total_Received', names=NEWSLETTER_RATE_COLUMNS)
         
-        return agg_df, pivot_df
+        # temp_df er allerede summeret pr. land og genbruges til landematrixen
+        return agg_df, temp_df
         
     return temp_df, pd.DataFrame()
 
 
+def period_rows(df, start, end):
+    """Rækker der dækker perioden: med arkivet læses kun periodens måneder, beskåret på dato i Arrow"""
+    where = (pc.field('Date') >= pd.Timestamp(start)) & (pc.field('Date') <= pd.Timestamp(end))
+    return history(df, month_range(start, end), where)
+
+
+def filter_options(df, start, end, email_col):
+    """(lande, kampagner, emails) med data i perioden, sorteret til filtrene"""
+    date_mask = (df['Date'] >= pd.to_datetime(start)) & (df['Date'] <= pd.to_datetime(end))
+    df_date_filtered = df[date_mask]
+    return (
+        sorted(df_date_filtered['Country'].unique()),
+        sorted(df_date_filtered['ID_Campaign'].astype(str).unique()),
+        sorted(df_date_filtered[email_col].astype(str).unique()),
+    )
+
+
+def build_chart_frame(current_df, rollups, chart_view, start, end, sel_countries, sel_id_campaigns):
+    """Grafdata pr. email, eller pr. uge/måned direkte fra tidshierarkiet"""
+    if chart_view == "Emails":
+        chart_df = current_df.groupby(['Date', 'Email_Message'], as_index=False).agg({
+            'Total_Received': 'sum', 'Unique_Opens': 'sum', 'Unique_Clicks': 'sum'
+        })
+        chart_df['Open Rate'] = (chart_df['Unique_Opens'] / chart_df['Total_Received'] * 100).round(1)
+        chart_df['Click Rate'] = (chart_df['Unique_Clicks'] / chart_df['Total_Received'] * 100).round(2)
+        chart_df = chart_df.sort_values('Date')
+        chart_df['Email_Short'] = chart_df['Email_Message'].apply(lambda x: x.split(' - ')[-1] if ' - ' in str(x) else str(x))
+        return chart_df
+
+    # Hele uger/måneder der overlapper perioden (email-filteret indgår ikke)
+    level = 'week' if chart_view == "Uge" else 'month'
+    chart_df = rollups.series(level, start, end, sel_countries, sel_id_campaigns)
+    chart_df['Open Rate'] = chart_df['Open_Rate'].round(1)
+    chart_df['Click Rate'] = chart_df['Click_Rate'].round(2)
+    chart_df['Email_Short'] = chart_df['Bucket'].dt.strftime('Uge %V %G' if level == 'week' else '%Y-%m')
+    return chart_df
+
+
+def rate_column(label):
+    """Kolonne til en rate i procent (A/B tabellen)"""
+    return st.column_config.NumberColumn(label, format="%.2f%%", width="small")
+
+
+def diff_column(label):
+    """Kolonne til en forskel i procentpoint (A/B tabellen)"""
+    return st.column_config.NumberColumn(label, format="%+.2f pp", width="small")
+
+
+def build_country_matrix(country_df):
+    """Sendt/opens/clicks pr. land ud fra de allerede aggregerede mål (ingen ny gennemgang af rå rækker)"""
+    matrix = country_df.groupby('Country')[['Total_Received', 'Unique_Opens', 'Unique_Clicks', 'Unsubscribed']].sum()
+    matrix = matrix.reindex([c for c in COUNTRIES if c in matrix.index])
+    matrix.loc['Total'] = matrix.sum()
+    matrix = add_rates(matrix, 'Total_Received')
+    return matrix.reset_index()
+
+
+def newsletter_sources(df):
+    """(SQL-motor eller None, summer til filtrering, tidshierarki) for datasættets revision"""
+    engine = get_sql_engine('newsletter', df)
+    # Summer pr. (dato, kampagne, email, land) vedligeholdes inkrementelt mellem opdateringer
+    nl_df = get_materialized_aggregate('newsletter', df) if engine is None else df
+    return engine, nl_df, get_newsletter_rollups(df)
+
+
+def newsletter_results(df, start_date, end_date, sel_countries, sel_id_campaigns, sel_email_messages, email_col, show_delta):
+    """(filtre, current_df, country_df, prev_df) for filtertilstanden"""
+    engine, nl_df, rollups = newsletter_sources(df)
+    # Resultater pr. filterkombination genbruges fra LRU'en (nøgle: revision + filtre)
+    engine_kind = engine.kind if engine is not None else None
+    filters = (start_date, end_date, sel_countries, sel_id_campaigns, sel_email_messages, email_col, engine_kind)
+    result = cached_result('newsletter_filter', df, filters, lambda: filter_data(
+        nl_df, start_date, end_date, sel_countries, sel_id_campaigns, sel_email_messages, email_col, engine
+    ))
+    if isinstance(result, tuple):
+        current_df, country_df = result
+    else:
+        current_df = result
+        country_df = pd.DataFrame()
+
+    # Previous period
+    period_days = (pd.to_datetime(end_date) - pd.to_datetime(start_date)).days + 1
+    prev_end_date = pd.to_datetime(start_date) - pd.Timedelta(days=1)
+    prev_start_date = prev_end_date - pd.Timedelta(days=period_days - 1)
+
+    prev_df = pd.DataFrame()
+    prev_filters = (prev_start_date, prev_end_date, sel_countries, email_col, engine_kind)
+    if show_delta and len(sel_countries) > 0 and engine is not None:
+        prev_df = cached_result('newsletter_previous', df, prev_filters, lambda: engine.newsletter_totals(
+            prev_start_date, prev_end_date, sel_countries, email_col
+        ))
+    elif show_delta and len(sel_countries) > 0:
+        # Hele kvartaler/måneder fra tidshierarkiet + enkelte dage i kanterne
+        prev_df = cached_result('newsletter_previous', df, prev_filters, lambda: rollups.select(
+            prev_start_date, prev_end_date, countries=sel_countries
+        ))
+    return filters, current_df, country_df, prev_df
+
+
+def newsletter_chart(df, filters, current_df, chart_view, start_date, end_date, sel_countries, sel_id_campaigns):
+    """Grafdata for filtertilstanden og visningen (pr. email/uge/måned)"""
+    rollups = get_newsletter_rollups(df)
+    return cached_result('newsletter_chart', df, filters + (chart_view,), lambda: build_chart_frame(
+        current_df, rollups, chart_view, start_date, end_date, sel_countries, sel_id_campaigns
+    ))
+
+
+# --- Gemte visninger ---
+def view_date_range(view, today):
+    """(start, slut) for en gemt visning: relativ periode (preset) eller faste datoer"""
+    if view.get('preset'):
+        return calculate_date_range(view['preset'], today, today - datetime.timedelta(days=1))
+    return datetime.date.fromisoformat(view['start']), datetime.date.fromisoformat(view['end'])
+
+
+def precompute_newsletter_views(df):
+    """Beregner de gemte visningers resultater og graf på forhånd (lægges i LRU'en)"""
+    today = datetime.date.today()
+    views = get_saved_views().all('newsletters')
+    for view in views.values():
+        start_date, end_date = view_date_range(view, today)
+        email_col = 'Email_Message_Base' if view.get('ignore_ab', True) else 'Email_Message_Full'
+        all_countries, all_id_campaigns, all_email_messages = cached_result(
+            'newsletter_options', df, (start_date, end_date, email_col),
+            lambda: filter_options(period_rows(df, start_date, end_date), start_date, end_date, email_col),
+        )
+        # Samme udvælgelse som i tabben: None = alle, ellers de valgte der findes i perioden
+        sel_countries = list(all_countries) if view.get('countries') is None else [c for c in all_countries if c in view['countries']]
+        sel_id_campaigns = list(all_id_campaigns) if view.get('campaigns') is None else [c for c in all_id_campaigns if c in view['campaigns']]
+        sel_email_messages = list(all_email_messages) if view.get('emails') is None else [e for e in all_email_messages if e in view['emails']]
+        show_delta = len(sel_id_campaigns) == len(all_id_campaigns) and len(sel_email_messages) == len(all_email_messages)
+        filters, current_df, _, _ = newsletter_results(
+            df, start_date, end_date, sel_countries, sel_id_campaigns, sel_email_messages, email_col, show_delta
+        )
+        if not current_df.empty:
+            newsletter_chart(df, filters, current_df, view.get('chart_view', "Emails"), start_date, end_date, sel_countries, sel_id_campaigns)
+    return len(views)
+
+
+def open_newsletter_view():
+    """on_change: gendan alle filtre fra den valgte visning i ét skridt"""
+    name = st.session_state.nl_saved_view
+    view = get_saved_views().get('newsletters', name) if name != VIEW_PLACEHOLDER else None
+    st.session_state.nl_saved_view = VIEW_PLACEHOLDER
+    if view is None:
+        return
+    today = datetime.date.today()
+    start_date, end_date = view_date_range(view, today)
+    if view.get('preset'):
+        # Periode-vælger og datoer tegnes igen ud fra nl_date_preset
+        st.session_state.nl_date_preset = view['preset']
+        st.session_state.pop('nl_preset', None)
+        st.session_state.pop('nl_dates', None)
+    else:
+        st.session_state.nl_dates = (start_date, end_date)
+    st.session_state.nl_date_range_value = (start_date, end_date)
+    st.session_state.nl_last_period_key = f"nl_{start_date}_{end_date}"
+    st.session_state.nl_ignore_ab = view.get('ignore_ab', True)
+    st.session_state.pop('nl_ignore_ab_cb', None)
+    st.session_state.nl_chart_view = view.get('chart_view', "Emails")
+    # None = alle (vælges når tabben tegnes); nye reset-tællere gentegner checkboksene
+    st.session_state.nl_selected_countries = view.get('countries')
+    st.session_state.nl_selected_campaigns = view.get('campaigns')
+    st.session_state.nl_selected_emails = view.get('emails')
+    for counter in ('nl_cb_reset_land', 'nl_cb_reset_kamp', 'nl_cb_reset_email'):
+        st.session_state[counter] = st.session_state.get(counter, 0) + 1
+
+
+def render_saved_views(start_date, end_date, sel_countries, sel_id_campaigns, sel_email_messages,
+                       all_countries, all_id_campaigns, all_email_messages):
+    views = get_saved_views()
+    with st.popover("Visninger", use_container_width=True):
+        names = views.names('newsletters')
+        st.selectbox("Åbn visning", [VIEW_PLACEHOLDER] + names, key="nl_saved_view",
+                     on_change=open_newsletter_view, label_visibility="collapsed")
+        name = st.text_input("Navn", key="nl_view_name", placeholder="Navn på visning", label_visibility="collapsed")
+        col_save, col_delete = st.columns(2)
+        if col_save.button("Gem", key="nl_view_save", use_container_width=True) and name.strip():
+            preset = st.session_state.nl_date_preset
+            relative = calculate_date_range(preset, datetime.date.today(), datetime.date.today() - datetime.timedelta(days=1)) == (start_date, end_date)
+            views.save('newsletters', name.strip(), {
+                'preset': preset if relative else None,
+                'start': None if relative else start_date,
+                'end': None if relative else end_date,
+                # Alle valgt gemmes som None, så nye lande/kampagner/emails kommer med
+                'countries': None if len(sel_countries) == len(all_countries) else sel_countries,
+                'campaigns': None if len(sel_id_campaigns) == len(all_id_campaigns) else sel_id_campaigns,
+                'emails': None if len(sel_email_messages) == len(all_email_messages) else sel_email_messages,
+                'ignore_ab': st.session_state.nl_ignore_ab,
+                'chart_view': st.session_state.get('nl_chart_view', "Emails"),
+            })
+            st.rerun()
+        if col_delete.button("Slet", key="nl_view_delete", use_container_width=True, disabled=name.strip() not in names):
+            views.delete('newsletters', name.strip())
+            st.rerun()
+
+
 def render_newsletters_tab():
     """Render Newsletters tab indhold"""
     
@@ -182,7 +310,7 @@ def render_newsletters_tab():
     try:
         with st.spinner('Henter data...'):
             df = load_newsletter_data()
-        if df.empty:
+        if not has_data(df):
             st.error("Kunne ikke hente data. Tjek Secrets.")
             return
     except Exception as e:
@@ -198,18 +326,16 @@ def render_newsletters_tab():
     if 'nl_date_range_value' not in st.session_state:
         st.session_state.nl_date_range_value = (today - datetime.timedelta(days=30), yesterday)
 
-    preset_options = [
-        "Sidste 7 dage", "Sidste 30 dage", "Denne maned",
-        "Dette kvartal", "I ar", "Sidste maned", "Sidste kvartal",
-    ]
+    # Gemte visninger beregnes på forhånd efter hver opdatering af data
+    precompute_saved_views('newsletter_saved_views', df, precompute_newsletter_views)
 
     # Layout
-    col_preset, col_dato, col_land, col_kamp, col_email, col_ab = st.columns([1.0, 1.4, 1, 1, 1, 1])
+    col_preset, col_dato, col_land, col_kamp, col_email, col_ab, col_view = st.columns([1.0, 1.4, 1, 1, 1, 1, 1])
 
     with col_preset:
-        preset_index = preset_options.index(st.session_state.nl_date_preset) if st.session_state.nl_date_preset in preset_options else 1
+        preset_index = PRESET_OPTIONS.index(st.session_state.nl_date_preset) if st.session_state.nl_date_preset in PRESET_OPTIONS else 1
         selected_preset = st.selectbox(
-            "Periode", options=preset_options, index=preset_index,
+            "Periode", options=PRESET_OPTIONS, index=preset_index,
             label_visibility="collapsed", key="nl_preset"
         )
         if selected_preset != st.session_state.nl_date_preset:
@@ -231,9 +357,6 @@ def render_newsletters_tab():
             start_date = date_range[0] if isinstance(date_range, tuple) else date_range
             end_date = start_date
 
-    # Filter data by date first
-    date_mask = (df['Date'] >= pd.to_datetime(start_date)) & (df['Date'] <= pd.to_datetime(end_date))
-    df_date_filtered = df[date_mask]
 
     # Track period changes
     current_period_key = f"nl_{start_date}_{end_date}"
@@ -263,11 +386,12 @@ def render_newsletters_tab():
         st.session_state.nl_selected_emails = None
         st.session_state.nl_selected_countries = None
 
-    # Filter options
-    all_countries = sorted(df_date_filtered['Country'].unique())
-    all_id_campaigns = sorted(df_date_filtered['ID_Campaign'].astype(str).unique())
+    # Filter options (for perioden)
     email_col = 'Email_Message_Base' if st.session_state.nl_ignore_ab else 'Email_Message_Full'
-    all_email_messages = sorted(df_date_filtered[email_col].astype(str).unique())
+    all_countries, all_id_campaigns, all_email_messages = cached_result(
+        'newsletter_options', df, (start_date, end_date, email_col),
+        lambda: filter_options(period_rows(df, start_date, end_date), start_date, end_date, email_col),
+    )
 
     # Pre-select all
     if st.session_state.nl_selected_countries is None:
@@ -387,31 +511,17 @@ def render_newsletters_tab():
     sel_email_messages = st.session_state.nl_selected_emails
     sel_countries = st.session_state.nl_selected_countries
 
-    # Filter and aggregate
-    result = filter_data(df, start_date, end_date, sel_countries, sel_id_campaigns, sel_email_messages, email_col)
-    if isinstance(result, tuple):
-        current_df, display_pivot_df = result
-    else:
-        current_df = result
-        display_pivot_df = pd.DataFrame()
-
-    # Previous period
-    period_days = (pd.to_datetime(end_date) - pd.to_datetime(start_date)).days + 1
-    prev_end_date = pd.to_datetime(start_date) - pd.Timedelta(days=1)
-    prev_start_date = prev_end_date - pd.Timedelta(days=period_days - 1)
+    with col_view:
+        render_saved_views(start_date, end_date, sel_countries, sel_id_campaigns, sel_email_messages,
+                           all_countries, all_id_campaigns, all_email_messages)
 
+    # Filter and aggregate (nuværende og forrige periode)
     show_delta = (len(sel_id_campaigns) == len(all_id_campaigns)) and (len(sel_email_messages) == len(all_email_messages))
-
-    prev_df = pd.DataFrame()
-    if show_delta and len(sel_countries) > 0:
-        prev_mask = (df['Date'] >= pd.to_datetime(prev_start_date)) & (df['Date'] <= pd.to_datetime(prev_end_date))
-        prev_temp = df.loc[prev_mask].copy()
-        prev_temp = prev_temp[prev_temp['Country'].isin(sel_countries)]
-        
-        if not prev_temp.empty:
-            prev_df = prev_temp.groupby(['Date', 'ID_Campaign', email_col], as_index=False).agg({
-                'Total_Received': 'sum', 'Unique_Opens': 'sum', 'Unique_Clicks': 'sum', 'Unsubscribed': 'sum'
-            })
+    filters, current_df, country_df, prev_df = newsletter_results(
+        df, start_date, end_date, sel_countries, sel_id_campaigns, sel_email_messages, email_col, show_delta
+    )
+    engine, nl_df, _ = newsletter_sources(df)
+    engine_kind = engine.kind if engine is not None else None
 
     # KPI Cards
     col1, col2, col3, col4, col5, col6 = st.columns(6)
@@ -430,27 +540,33 @@ def render_newsletters_tab():
     prev_cr = (prev_clicks / prev_sent * 100) if prev_sent and prev_sent > 0 and show_delta else None
     prev_ctr = (prev_clicks / prev_opens * 100) if prev_opens and prev_opens > 0 and show_delta else None
 
+    # Afvigende udsendelser i perioden (rullende statistik pr. land)
+    detector, flagged = get_anomalies('newsletter', df)
+    flagged = flagged[
+        (flagged['Date'] >= pd.to_datetime(start_date)) & (flagged['Date'] <= pd.to_datetime(end_date))
+        & flagged['Country'].isin(sel_countries) & flagged['ID_Campaign'].isin(sel_id_campaigns)
+    ] if not flagged.empty else flagged
+
     show_metric(col1, "Emails Sendt", cur_sent, prev_sent)
     show_metric(col2, "Unikke Opens", cur_opens, prev_opens)
     show_metric(col3, "Unikke Clicks", cur_clicks, prev_clicks)
-    show_metric(col4, "Open Rate", cur_or, prev_or, is_percent=True)
-    show_metric(col5, "Click Rate", cur_cr, prev_cr, is_percent=True)
+    show_metric(col4, "Open Rate", cur_or, prev_or, is_percent=True,
+                warning=detector.warning(flagged, 'Open_Rate', 'open rate') if not flagged.empty else None)
+    show_metric(col5, "Click Rate", cur_cr, prev_cr, is_percent=True,
+                warning=detector.warning(flagged, 'Click_Rate', 'click rate') if not flagged.empty else None)
     show_metric(col6, "Click Through Rate", cur_ctr, prev_ctr, is_percent=True)
 
     if not current_df.empty:
-        display_df = current_df.copy()
+        flags = summarize_flags(flagged, ['Date', 'ID_Campaign', email_col]).rename(columns={email_col: 'Email_Message'})
+        display_df = current_df.merge(flags, on=['Date', 'ID_Campaign', 'Email_Message'], how='left')
+        display_df['Afvigelse'] = display_df['Afvigelse'].fillna('')
         display_df['Date'] = pd.to_datetime(display_df['Date']).dt.date
         
         st.markdown("<div style='height: 15px;'></div>", unsafe_allow_html=True)
         
-        # Chart
-        chart_df = current_df.groupby(['Date', 'Email_Message'], as_index=False).agg({
-            'Total_Received': 'sum', 'Unique_Opens': 'sum', 'Unique_Clicks': 'sum'
-        })
-        chart_df['Open Rate'] = (chart_df['Unique_Opens'] / chart_df['Total_Received'] * 100).round(1)
-        chart_df['Click Rate'] = (chart_df['Unique_Clicks'] / chart_df['Total_Received'] * 100).round(2)
-        chart_df = chart_df.sort_values('Date')
-        chart_df['Email_Short'] = chart_df['Email_Message'].apply(lambda x: x.split(' - ')[-1] if ' - ' in str(x) else str(x))
+        # Chart - pr. email, eller pr. uge/måned direkte fra tidshierarkiet
+        chart_view = st.radio("Visning", ["Emails", "Uge", "Måned"], horizontal=True, key="nl_chart_view", label_visibility="collapsed")
+        chart_df = newsletter_chart(df, filters, current_df, chart_view, start_date, end_date, sel_countries, sel_id_campaigns)
         
         fig = make_subplots(specs=[[{"secondary_y": True}]])
         
@@ -494,7 +610,7 @@ def render_newsletters_tab():
         st.markdown("<div style='height: 20px;'></div>", unsafe_allow_html=True)
         
         # Table
-        cols_to_show = ['Date', 'ID_Campaign', 'Email_Message', 'Total_Received', 'Unique_Opens', 'Unique_Clicks', 'Open Rate %', 'Click Rate %', 'Click Through Rate %']
+        cols_to_show = ['Date', 'ID_Campaign', 'Email_Message', 'Total_Received', 'Unique_Opens', 'Unique_Clicks', 'Open Rate %', 'Click Rate %', 'Click Through Rate %', 'Afvigelse']
         sorted_df = display_df[cols_to_show].sort_values(by='Date', ascending=False)
         table_height = (len(sorted_df) + 1) * 35 + 3
         
@@ -510,8 +626,68 @@ def render_newsletters_tab():
                 "Open Rate %": st.column_config.NumberColumn("Open Rate", format="%.1f%%", width="small"),
                 "Click Rate %": st.column_config.NumberColumn("Click Rate", format="%.1f%%", width="small"),
                 "Click Through Rate %": st.column_config.NumberColumn("CTR", format="%.1f%%", width="small"),
+                "Afvigelse": st.column_config.TextColumn("Afvigelse", width="medium"),
             }
         )
+
+        # Landematrix (beregnes kun når den vises)
+        if st.checkbox("Vis pr. land", key="nl_show_country_matrix") and not country_df.empty:
+            st.dataframe(
+                build_country_matrix(country_df), use_container_width=True, hide_index=True,
+                column_config={
+                    "Country": st.column_config.TextColumn("Land", width="small"),
+                    "Total_Received": st.column_config.NumberColumn("Sendt", format="localized", width="small"),
+                    "Unique_Opens": st.column_config.NumberColumn("Opens", format="localized", width="small"),
+                    "Unique_Clicks": st.column_config.NumberColumn("Clicks", format="localized", width="small"),
+                    "Unsubscribed": st.column_config.NumberColumn("Afmeldt", format="localized", width="small"),
+                    "Open_Rate": st.column_config.NumberColumn("Open Rate", format="%.1f%%", width="small"),
+                    "Click_Rate": st.column_config.NumberColumn("Click Rate", format="%.1f%%", width="small"),
+                    "CTR": st.column_config.NumberColumn("CTR", format="%.1f%%", width="small"),
+                }
+            )
+
+        # A/B analyse af alle variantpar i perioden (beregnes kun når den vises)
+        if st.checkbox("Vis A/B analyse", key="nl_show_ab"):
+            def compute_pairs():
+                ab_source = nl_df if engine is None else period_rows(df, start_date, end_date)
+                ab_mask = (
+                    (ab_source['Date'] >= pd.to_datetime(start_date)) & (ab_source['Date'] <= pd.to_datetime(end_date))
+                    & ab_source['Country'].isin(sel_countries) & ab_source['ID_Campaign'].isin(sel_id_campaigns)
+                )
+                return ab_analysis.variant_pairs(ab_source[ab_mask])
+
+            pairs_df = cached_result(
+                'newsletter_ab', df, (start_date, end_date, sel_countries, sel_id_campaigns, engine_kind), compute_pairs
+            )
+            if pairs_df.empty:
+                st.info("Ingen A/B varianter i den valgte periode.")
+            else:
+                pairs_df = pairs_df.assign(Signifikant=(pairs_df['Open_P'] < 0.05) | (pairs_df['Click_P'] < 0.05))
+                st.dataframe(
+                    pairs_df[[
+                        'ID_Campaign', 'Email_Message_Base', 'Variant_A', 'Variant_B',
+                        'Total_Received_A', 'Total_Received_B',
+                        'Open_Rate_A', 'Open_Rate_B', 'Open_Diff', 'Open_CI_Low', 'Open_CI_High', 'Open_P',
+                        'Click_Rate_A', 'Click_Rate_B', 'Click_Diff', 'Click_CI_Low', 'Click_CI_High', 'Click_P',
+                        'Signifikant',
+                    ]],
+                    use_container_width=True, hide_index=True,
+                    column_config={
+                        "ID_Campaign": st.column_config.TextColumn("Kampagne", width="medium"),
+                        "Email_Message_Base": st.column_config.TextColumn("Email", width="medium"),
+                        "Variant_A": st.column_config.TextColumn("A", width="small"),
+                        "Variant_B": st.column_config.TextColumn("B", width="small"),
+                        "Total_Received_A": st.column_config.NumberColumn("Sendt A", format="localized", width="small"),
+                        "Total_Received_B": st.column_config.NumberColumn("Sendt B", format="localized", width="small"),
+                        "Open_Rate_A": rate_column("Open A"), "Open_Rate_B": rate_column("Open B"),
+                        "Open_Diff": diff_column("Open B-A"), "Open_CI_Low": diff_column("CI lav"), "Open_CI_High": diff_column("CI høj"),
+                        "Open_P": st.column_config.NumberColumn("p (open)", format="%.4f", width="small"),
+                        "Click_Rate_A": rate_column("Click A"), "Click_Rate_B": rate_column("Click B"),
+                        "Click_Diff": diff_column("Click B-A"), "Click_CI_Low": diff_column("CI lav"), "Click_CI_High": diff_column("CI høj"),
+                        "Click_P": st.column_config.NumberColumn("p (click)", format="%.4f", width="small"),
+                        "Signifikant": st.column_config.CheckboxColumn("p < 0,05", width="small"),
+                    }
+                )
     else:
         st.warning("Ingen data at vise.")
 
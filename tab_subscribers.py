@@ -5,59 +5,36 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from shared import get_gspread_client, show_metric, format_number
+import pipeline
+from shared import get_gspread_client, get_source_index, get_subscriber_analytics, load_dataset, show_metric, format_number
+from subscriber_analytics import METRICS
 
 
-@st.cache_data(ttl=300, show_spinner=False)  # Cache i 5 minutter
+@st.cache_resource(ttl=300, show_spinner=False)  # Delt read-only i processen i 5 minutter
 def load_subscribers_data():
-    """Henter Subscribers data fra Google Sheet"""
+    """
+    Henter Subscribers data (delt cache på tværs af server-processer).
+    Frame'en er delt read-only mellem alle sessioner og må ikke ændres
+    in-place; lav en .copy() hvis der skal skrives i den.
+    """
+    # Tjek om subscribers_spreadsheet er konfigureret
+    if "subscribers_spreadsheet" not in st.secrets["connections"]["gsheets"]:
+        st.error("⚠️ Mangler 'subscribers_spreadsheet' i secrets. Tilføj: subscribers_spreadsheet = 'URL'")
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+
     try:
-        gc = get_gspread_client()
-        
-        # Tjek om subscribers_spreadsheet er konfigureret
-        if "subscribers_spreadsheet" not in st.secrets["connections"]["gsheets"]:
-            st.error("⚠️ Mangler 'subscribers_spreadsheet' i secrets. Tilføj: subscribers_spreadsheet = 'URL'")
-            return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
-        
-        subscribers_url = st.secrets["connections"]["gsheets"]["subscribers_spreadsheet"]
-        spreadsheet = gc.open_by_url(subscribers_url)
-        
-        # Hent worksheets
-        full_subs = spreadsheet.worksheet("Full_Subscribers").get_all_values()
-        light_subs = spreadsheet.worksheet("Light_Subscribers").get_all_values()
-        sub_events = spreadsheet.worksheet("Full_Sub_Events").get_all_values()
-        
-        # Konverter til DataFrames
-        full_df = pd.DataFrame(full_subs[1:], columns=full_subs[0]) if len(full_subs) > 1 else pd.DataFrame()
-        light_df = pd.DataFrame(light_subs[1:], columns=light_subs[0]) if len(light_subs) > 1 else pd.DataFrame()
-        events_df = pd.DataFrame(sub_events[1:], columns=sub_events[0]) if len(sub_events) > 1 else pd.DataFrame()
-        
-        # Konverter numeriske kolonner
-        country_cols = ['DK', 'SE', 'NO', 'FI', 'FR', 'UK', 'DE', 'AT', 'NL', 'BE', 'CH', 'Total']
-        
-        for df in [full_df, light_df]:
-            if not df.empty:
-                for col in country_cols:
-                    if col in df.columns:
-                        df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', '').str.replace('"', ''), errors='coerce').fillna(0).astype(int)
-                if 'Month' in df.columns:
-                    df['Month'] = pd.to_datetime(df['Month'], format='%Y-%m', errors='coerce')
-        
-        # Events har flere kolonner
-        if not events_df.empty:
-            for col in country_cols:
-                if col in events_df.columns:
-                    events_df[col] = pd.to_numeric(events_df[col].astype(str).str.replace(',', '').str.replace('"', ''), errors='coerce').fillna(0).astype(int)
-            if 'Month' in events_df.columns:
-                events_df['Month'] = pd.to_datetime(events_df['Month'], format='%Y-%m', errors='coerce')
-        
-        return full_df, light_df, events_df
-        
+        return load_dataset('subscribers', fetch_subscribers_data)
     except Exception as e:
         st.error(f"Fejl ved indlæsning af Subscribers data: {e}")
         return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
 
+def fetch_subscribers_data():
+    """Henter Subscribers data fra Google Sheet"""
+    subscribers_url = st.secrets["connections"]["gsheets"]["subscribers_spreadsheet"]
+    return pipeline.fetch_subscribers_data(get_gspread_client(), subscribers_url)
+
+
 def render_subscribers_tab():
     """Render Subscribers tab indhold"""
     
@@ -73,37 +50,18 @@ def render_subscribers_tab():
         st.error(f"Fejl: {e}")
         return
 
-    # Sorter efter dato
-    if not full_df.empty:
-        full_df = full_df.sort_values('Month', ascending=False)
-    if not light_df.empty:
-        light_df = light_df.sort_values('Month', ascending=False)
+    # Tidsserier og vækst (beregnet én gang pr. opdatering)
+    analytics = get_subscriber_analytics(full_df, light_df)
 
     # --- KPI CARDS ---
     col1, col2, col3, col4, col5, col6 = st.columns(6)
     
     # Seneste data
-    if not full_df.empty and len(full_df) >= 2:
-        current_full = full_df.iloc[0]['Total']
-        prev_full = full_df.iloc[1]['Total']
-        full_growth = current_full - prev_full
-        full_growth_pct = ((current_full - prev_full) / prev_full * 100) if prev_full > 0 else 0
-    else:
-        current_full = full_df.iloc[0]['Total'] if not full_df.empty else 0
-        prev_full = None
-        full_growth = 0
-        full_growth_pct = 0
-
-    if not light_df.empty and len(light_df) >= 2:
-        current_light = light_df.iloc[0]['Total']
-        prev_light = light_df.iloc[1]['Total']
-        light_growth = current_light - prev_light
-        light_growth_pct = ((current_light - prev_light) / prev_light * 100) if prev_light > 0 else 0
-    else:
-        current_light = light_df.iloc[0]['Total'] if not light_df.empty else 0
-        prev_light = None
-        light_growth = 0
-        light_growth_pct = 0
+    current_full, prev_full = analytics.latest('Full')
+    full_growth = current_full - prev_full if prev_full is not None else 0
+
+    current_light, prev_light = analytics.latest('Light')
+    light_growth = current_light - prev_light if prev_light is not None else 0
 
     total_subscribers = current_full + current_light
     total_growth = full_growth + light_growth
@@ -123,23 +81,23 @@ def render_subscribers_tab():
     if not full_df.empty or not light_df.empty:
         fig = make_subplots(specs=[[{"secondary_y": False}]])
         
-        # Sorter kronologisk for graf
-        if not full_df.empty:
-            full_chart = full_df.sort_values('Month')
+        # Tidsserierne er allerede kronologiske
+        if 'Full' in analytics.tiers:
+            full_series = analytics.tiers['Full']
             fig.add_trace(
                 go.Scatter(
-                    x=full_chart['Month'], y=full_chart['Total'],
+                    x=full_series.months, y=full_series.counts[:, full_series.columns.index('Total')],
                     name='Full Subscribers', mode='lines+markers',
                     line=dict(color='#9B7EBD', width=3),
                     marker=dict(size=8)
                 )
             )
         
-        if not light_df.empty:
-            light_chart = light_df.sort_values('Month')
+        if 'Light' in analytics.tiers:
+            light_series = analytics.tiers['Light']
             fig.add_trace(
                 go.Scatter(
-                    x=light_chart['Month'], y=light_chart['Total'],
+                    x=light_series.months, y=light_series.counts[:, light_series.columns.index('Total')],
                     name='Light Subscribers', mode='lines+markers',
                     line=dict(color='#E8B4CB', width=3),
                     marker=dict(size=8)
@@ -162,14 +120,13 @@ def render_subscribers_tab():
     st.markdown("<div style='height: 20px;'></div>", unsafe_allow_html=True)
 
     # --- TABS FOR DETALJERET DATA ---
-    detail_tab1, detail_tab2, detail_tab3 = st.tabs(["Full Subscribers", "Light Subscribers", "Nye Subscribers per Kilde"])
+    detail_tab1, detail_tab2, detail_tab3, detail_tab4 = st.tabs(["Full Subscribers", "Light Subscribers", "Nye Subscribers per Kilde", "Vækst per Land"])
     
     country_cols = ['DK', 'SE', 'NO', 'FI', 'FR', 'UK', 'DE', 'AT', 'NL', 'BE', 'CH', 'Total']
     
     with detail_tab1:
-        if not full_df.empty:
-            display_full = full_df.copy()
-            display_full['Month'] = display_full['Month'].dt.strftime('%Y-%m')
+        if 'Full' in analytics.tiers:
+            display_full = analytics.tiers['Full'].display
             cols_to_show = ['Month'] + [c for c in country_cols if c in display_full.columns]
             
             st.dataframe(
@@ -185,9 +142,8 @@ def render_subscribers_tab():
             st.info("Ingen Full Subscribers data.")
     
     with detail_tab2:
-        if not light_df.empty:
-            display_light = light_df.copy()
-            display_light['Month'] = display_light['Month'].dt.strftime('%Y-%m')
+        if 'Light' in analytics.tiers:
+            display_light = analytics.tiers['Light'].display
             cols_to_show = ['Month'] + [c for c in country_cols if c in display_light.columns]
             
             st.dataframe(
@@ -204,34 +160,52 @@ def render_subscribers_tab():
     
     with detail_tab3:
         if not events_df.empty:
-            display_events = events_df.copy()
-            display_events['Month'] = display_events['Month'].dt.strftime('%Y-%m')
+            source_index = get_source_index(events_df)
             
             # Filter muligheder
             col_filter1, col_filter2 = st.columns(2)
             
             with col_filter1:
-                master_sources = ['Alle'] + sorted(display_events['Master Source'].unique().tolist())
+                master_sources = ['Alle'] + source_index.masters
                 selected_master = st.selectbox("Master Source", master_sources, key="sub_master_source")
             
+            master = selected_master if selected_master != 'Alle' else None
             with col_filter2:
-                if selected_master != 'Alle':
-                    sources = ['Alle'] + sorted(display_events[display_events['Master Source'] == selected_master]['Source'].unique().tolist())
-                else:
-                    sources = ['Alle'] + sorted(display_events['Source'].unique().tolist())
+                sources = ['Alle'] + source_index.sources_for(master)
                 selected_source = st.selectbox("Source", sources, key="sub_source")
+            source = selected_source if selected_source != 'Alle' else None
             
-            # Filtrer data
-            filtered_events = display_events.copy()
-            if selected_master != 'Alle':
-                filtered_events = filtered_events[filtered_events['Master Source'] == selected_master]
-            if selected_source != 'Alle':
-                filtered_events = filtered_events[filtered_events['Source'] == selected_source]
+            # Nye subscribers pr. kilde over tid
+            series_df = source_index.series(master, source)
+            if not series_df.empty:
+                fig = go.Figure()
+                colors = ['#9B7EBD', '#E8B4CB', '#7EB8BD', '#BDA77E', '#BD7E8A', '#8A9BBD']
+                for i, name in enumerate(series_df.columns):
+                    fig.add_trace(
+                        go.Scatter(
+                            x=series_df.index, y=series_df[name],
+                            name=str(name), mode='lines+markers',
+                            line=dict(color=colors[i % len(colors)], width=3),
+                            marker=dict(size=6)
+                        )
+                    )
+                fig.update_layout(
+                    title="", showlegend=True, height=350,
+                    margin=dict(l=50, r=50, t=30, b=50),
+                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+                    plot_bgcolor='rgba(250,245,255,0.5)', paper_bgcolor='rgba(0,0,0,0)',
+                    hovermode='x unified'
+                )
+                fig.update_xaxes(gridcolor='rgba(212,191,255,0.2)', tickformat='%Y-%m')
+                fig.update_yaxes(gridcolor='rgba(212,191,255,0.3)', tickformat=',')
+                st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
             
+            # Tabel direkte fra indekset (nyeste måned først)
+            filtered_events = source_index.rows(master, source)
             cols_to_show = ['Month', 'Master Source', 'Source'] + [c for c in country_cols if c in filtered_events.columns]
             
             st.dataframe(
-                filtered_events[cols_to_show].sort_values('Month', ascending=False),
+                filtered_events[cols_to_show],
                 use_container_width=True,
                 hide_index=True,
                 column_config={
@@ -244,6 +218,28 @@ def render_subscribers_tab():
         else:
             st.info("Ingen subscriber events data.")
 
+    with detail_tab4:
+        if analytics.tiers:
+            col_tier, col_metric = st.columns(2)
+            with col_tier:
+                tier = st.radio("Type", list(analytics.tiers), horizontal=True, key="sub_growth_tier")
+            with col_metric:
+                metric = st.selectbox("Mål", list(METRICS), format_func=lambda m: METRICS[m][0], key="sub_growth_metric")
+            
+            growth_df = analytics.tiers[tier].metric_frames[metric]
+            value_format = "%.1f%%" if METRICS[metric][1] else "localized"
+            st.dataframe(
+                growth_df,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Month": st.column_config.TextColumn("Maned", width="small"),
+                    **{col: st.column_config.NumberColumn(col, format=value_format, width="small") for col in country_cols if col in growth_df.columns}
+                }
+            )
+        else:
+            st.info("Ingen subscriber data.")
+
     if st.button('Opdater Data', key="sub_refresh"):
         st.rerun()
 
@@ -0,0 +1,5 @@
+"""Modulerne ligger i roden af repoet"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,61 @@
+"""Tests af A/B sammenligningen (ab_analysis.py)"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from ab_analysis import Z_95, compare_proportions, erfc, variant_pairs
+
+
+def test_p_vaerdi_for_kendte_z_vaerdier():
+    # To-sidet p for |z| = 1,96 og 2,576
+    assert erfc(np.array([Z_95, 2.5758293035489]) / np.sqrt(2)) == pytest.approx([0.05, 0.01])
+
+
+def test_compare_proportions_mod_haandregnede_vaerdier():
+    diff, low, high, p_value = compare_proportions(
+        np.array([100.0, 50.0, 0.0]), np.array([1000.0, 400.0, 10.0]),
+        np.array([130.0, 50.0, 0.0]), np.array([1000.0, 400.0, 10.0]),
+    )
+    # 10% mod 13%: fælles andel 11,5% giver z = 2,1027 og p = 0,0355
+    assert diff == pytest.approx([3.0, 0.0, 0.0])
+    assert p_value == pytest.approx([0.0354885, 1.0, 1.0], rel=1e-5)
+    half_width = Z_95 * np.sqrt(0.1 * 0.9 / 1000 + 0.13 * 0.87 / 1000) * 100
+    assert (low[0], high[0]) == pytest.approx((3.0 - half_width, 3.0 + half_width))
+    # Ingen varians: intervallet er et punkt og testen afviser ikke
+    assert (low[2], high[2]) == (0.0, 0.0)
+
+
+def test_variant_pairs_parrer_varianter_af_samme_email():
+    rows = [
+        # (kampagne, email, variant eller None, modtaget, opens, clicks)
+        ('C1', 'Mail - Msg', 'A', 1000, 100, 10),
+        ('C1', 'Mail - Msg', 'A', 500, 50, 5),
+        ('C1', 'Mail - Msg', 'B', 1000, 130, 20),
+        ('C1', 'Mail - Msg', 'C', 800, 80, 8),
+        ('C1', 'Mail - Msg', None, 5000, 900, 90),
+        ('C1', 'Other - Msg', 'A', 300, 30, 3),
+        ('C2', 'Mail - Msg', 'A', 400, 40, 4),
+        ('C2', 'Mail - Msg', 'B', 0, 0, 0),
+    ]
+    df = pd.DataFrame({
+        'ID_Campaign': [r[0] for r in rows],
+        'Email_Message_Base': [r[1] for r in rows],
+        'Email_Message_Full': [r[1] if r[2] is None else f"{r[1]} - {r[2]}" for r in rows],
+        'Total_Received': [r[3] for r in rows],
+        'Unique_Opens': [r[4] for r in rows],
+        'Unique_Clicks': [r[5] for r in rows],
+    })
+
+    pairs = variant_pairs(df)
+
+    # Kun C1 / Mail har flere varianter med modtagere; hvert par én gang (A < B)
+    assert pairs[['ID_Campaign', 'Variant_A', 'Variant_B']].values.tolist() == [
+        ['C1', 'A', 'B'], ['C1', 'A', 'C'], ['C1', 'B', 'C'],
+    ]
+    assert pairs['Total_Received_A'].tolist() == [1500, 1500, 1000]
+    assert pairs['Open_Rate_A'].tolist() == pytest.approx([10.0, 10.0, 13.0])
+    expected = compare_proportions(np.array([150.0]), np.array([1500.0]), np.array([130.0]), np.array([1000.0]))
+    assert pairs.loc[0, ['Open_Diff', 'Open_CI_Low', 'Open_CI_High', 'Open_P']].tolist() == pytest.approx(
+        [value[0] for value in expected]
+    )
+    assert variant_pairs(df[df['Email_Message_Full'] == df['Email_Message_Base']]).empty
@@ -0,0 +1,79 @@
+"""Tests af afvigelsesdetektoren (anomaly.py) over et inkrementelt aggregat"""
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from anomaly import FLOW_RATES, RollingAnomalies, month_order
+from incremental import MaterializedAggregate
+
+KEYS = ['Year_Month', 'Flow_Trigger', 'Country']
+MEASURES = ['Received_Email', 'Unique_Opens', 'Unique_Clicks', 'Unsubscribed', 'Bounced']
+MONTHS = [f"{2024 + i // 12}-{i % 12 + 1}" for i in range(18)]
+
+
+def detector():
+    return RollingAnomalies(
+        KEYS, ['Flow_Trigger', 'Country'], lambda f: month_order(f['Year_Month']), FLOW_RATES,
+        window=4, min_periods=2, z=1.5,
+    )
+
+
+def flows(rng, rows):
+    received = rng.integers(100, 1000, rows)
+    return pd.DataFrame({
+        'Year_Month': rng.choice(MONTHS, rows),
+        'Flow_Trigger': rng.choice(['Flow 1 - Welcome', 'Flow 2 - Cart'], rows),
+        'Country': rng.choice(['DK', 'SE'], rows),
+        'Received_Email': received,
+        'Unique_Opens': received * rng.integers(10, 60, rows) // 100,
+        'Unique_Clicks': received * rng.integers(1, 10, rows) // 100,
+        'Unsubscribed': rng.integers(0, 10, rows),
+        'Bounced': rng.integers(0, 10, rows),
+    })
+
+
+def sorted_result(result):
+    return result.sort_values(KEYS).reset_index(drop=True)
+
+
+def test_inkrementel_update_svarer_til_fuld_beregning():
+    rng = np.random.default_rng(11)
+    aggregate = MaterializedAggregate(KEYS, MEASURES)
+    incremental = detector()
+    df = flows(rng, 300)
+
+    for step in range(25):
+        if step:
+            edit = step % 3
+            if edit == 0:
+                df = pd.concat([df, flows(rng, 4)], ignore_index=True)
+            elif edit == 1:
+                df = df.copy()
+                rows = rng.choice(len(df), 3, replace=False)
+                df.loc[rows, 'Unique_Opens'] = rng.integers(0, 100, 3)
+            else:
+                df = df.drop(rng.choice(len(df), 4, replace=False)).reset_index(drop=True)
+        state = aggregate.refresh(f"r{step}", df)
+        result = incremental.update(state.generation, state.frame, state.changes, state.generation - 1)
+
+        full = detector().update(state.generation, state.frame)
+        assert_frame_equal(sorted_result(result), sorted_result(full))
+
+
+def test_flagged_markerer_retning_pr_rate():
+    result = pd.DataFrame({
+        'Year_Month': ['2025-1', '2025-2', '2025-3', '2025-4'],
+        'Flow_Trigger': ['Flow 1 - Welcome'] * 4,
+        'Country': ['DK'] * 4,
+        'Open_Rate': [-2.0, 0.5, np.nan, 1.6],
+        'Click_Rate': [0.0, 0.1, 9.0, -3.0],
+        'Unsub_Rate': [np.nan, -1.5, 0.0, 0.0],
+        'Bounce_Rate': [2.5, 1.5, np.nan, 0.0],
+    })
+
+    flagged = detector().flagged(result)
+
+    # |z| skal være større end z (1,5 er ikke nok), og NaN tæller ikke
+    assert flagged['Year_Month'].tolist() == ['2025-1', '2025-3', '2025-4']
+    assert flagged['Afvigelse'].tolist() == ['open↓ bounce↑', 'click↑', 'open↑ click↓']
+    assert detector().flagged(result.iloc[1:2])['Afvigelse'].tolist() == []
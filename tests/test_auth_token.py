@@ -0,0 +1,43 @@
+"""Tests af de signerede login-tokens (auth_token.py)"""
+import pytest
+
+from auth_token import derive_key, issue_token, verify_token
+
+KEY = derive_key({}, 'pw')
+NOW = 1_700_000_000
+TTL = 3600
+
+
+def test_token_verificeres_til_udloebstiden():
+    token = issue_token(KEY, TTL, now=NOW)
+    assert verify_token(KEY, token, now=NOW) == NOW + TTL
+    assert verify_token(KEY, token, now=NOW + TTL - 1) == NOW + TTL
+
+
+def test_udloebet_token_afvises():
+    token = issue_token(KEY, TTL, now=NOW)
+    assert verify_token(KEY, token, now=NOW + TTL) is None
+
+
+def test_aendret_signatur_eller_payload_afvises():
+    version, expires, nonce, signature = issue_token(KEY, TTL, now=NOW).split('.')
+    flipped = ('0' if signature[0] != '0' else '1') + signature[1:]
+    assert verify_token(KEY, f"{version}.{expires}.{nonce}.{flipped}", now=NOW) is None
+    # Længere udløb med den gamle signatur
+    assert verify_token(KEY, f"{version}.{int(expires) + TTL}.{nonce}.{signature}", now=NOW) is None
+    assert verify_token(KEY, f"{version}.{expires}.{nonce}0.{signature}", now=NOW) is None
+
+
+def test_forkert_noegle_afvises():
+    token = issue_token(KEY, TTL, now=NOW)
+    assert verify_token(derive_key({}, 'nyt kodeord'), token, now=NOW) is None
+    assert verify_token(derive_key({'secret': 's'}, 'pw'), token, now=NOW) is None
+    # [auth] secret går forud for kodeordet
+    assert derive_key({'secret': 's'}, 'pw') == derive_key({'secret': 's'}, 'andet')
+
+
+@pytest.mark.parametrize('token', [
+    None, '', 'abc', 'v1.1.2', 'v1.1.2.3.4', 'v2.1.2.3', 'v1.1.a.æøå', 'v1...',
+])
+def test_misdannet_token_afvises(token):
+    assert verify_token(KEY, token, now=NOW) is None
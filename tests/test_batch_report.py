@@ -0,0 +1,25 @@
+"""Tests af batch-rapportens klient (batch_report.py)"""
+from argparse import Namespace
+
+from batch_report import report_client
+
+URL = "https://docs.google.com/spreadsheets/d/abc123/edit"
+
+
+def test_uden_source_laeses_secrets_toml(tmp_path):
+    (tmp_path / 'flows').mkdir()
+    (tmp_path / 'flows' / 'All_Flow.csv').write_text("Year_Month,Flow\n2025-1,Flow 1\n", encoding='utf-8')
+    secrets = tmp_path / 'secrets.toml'
+    secrets.write_text(
+        "[connections.gsheets]\n"
+        f"local_source = {str(tmp_path)!r}\n"
+        f"flows_spreadsheet = {URL!r}\n"
+        "[sheets]\n"
+        "reads_per_minute = 30\n",
+        encoding='utf-8',
+    )
+
+    gc, urls = report_client(Namespace(source=None, secrets=str(secrets)))
+
+    assert urls['flows_spreadsheet'] == URL
+    assert gc.open_by_url(URL).worksheet('All_Flow').get_all_values() == [['Year_Month', 'Flow'], ['2025-1', 'Flow 1']]
@@ -0,0 +1,311 @@
+"""
+Tests af den delte datasæt-cache (data_cache.py)
+
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from data_cache import FileCacheBackend, MemoryCacheBackend, SharedDatasetCache, SingleFlight
+from incremental import MaterializedAggregate
+from sheets_governor import DeadlineExceeded
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CALLERS = 20
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def frame(*values):
+    return pd.DataFrame({'Country': ['DK'] * len(values), 'Total_Received': list(values)})
+
+
+class CountingLoader:
+    """Loader der returnerer næste frame og tæller kald (fail=True kaster DeadlineExceeded)"""
+
+    def __init__(self, *frames):
+        self.frames = list(frames)
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self):
+        self.calls += 1
+        if self.fail:
+            raise DeadlineExceeded("Ingen kvote")
+        return self.frames[min(self.calls, len(self.frames)) - 1]
+
+
+def run_concurrently(n, target):
+    """Start n tråde samtidig (via en barriere) og returner deres resultater"""
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def worker(i):
+        barrier.wait()
+        results[i] = target()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=30)
+    return results
+
+
+def test_single_flight_samtidige_kald_deler_et_kald():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return object()
+
+    # Slip lederen først når de andre kaldere har nået at vente på den
+    threading.Timer(0.2, release.set).start()
+    results = run_concurrently(CALLERS, lambda: flight.do('newsletter', fn))
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_single_flight_fejl_gives_til_alle_ventende():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise RuntimeError("kvote")
+
+    def call():
+        try:
+            flight.do('flows', fn)
+        except RuntimeError as e:
+            return str(e)
+
+    threading.Timer(0.2, release.set).start()
+    assert run_concurrently(5, call) == ["kvote"] * 5
+
+
+def test_samtidige_sessioner_henter_datasaet_en_gang():
+    cache = SharedDatasetCache(MemoryCacheBackend())
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)  # Som en rundtur til Google Sheets
+        return pd.DataFrame({'Country': ['DK', 'SE'], 'Total_Received': [10, 20]})
+
+    results = run_concurrently(CALLERS, lambda: cache.fetch('newsletter', loader))
+
+    assert len(calls) == 1
+    assert all(result[1]['Total_Received'].sum() == 30 for result in results)
+    assert len({revision for revision, _ in results}) == 1
+
+
+# --- Epoch, revision og fallback ---
+def test_samme_ttl_vindue_henter_kun_en_gang():
+    clock = FakeClock()
+    cache = SharedDatasetCache(MemoryCacheBackend(), ttl=300, clock=clock)
+    loader = CountingLoader(frame(1, 2))
+
+    first = cache.fetch('newsletter', loader)
+    clock.now += 299 - clock.now % 300  # Sidste sekund i vinduet
+    second = cache.fetch('newsletter', loader)
+
+    assert loader.calls == 1
+    assert second[0] == first[0]
+    assert second[1] is first[1]
+
+
+def test_nyt_vindue_henter_igen_og_uaendrede_data_beholder_revision():
+    clock = FakeClock()
+    backend = MemoryCacheBackend()
+    cache = SharedDatasetCache(backend, ttl=300, clock=clock)
+    loader = CountingLoader(frame(1, 2), frame(1, 2), frame(1, 99))
+
+    revision, _ = cache.fetch('newsletter', loader)
+    clock.now += 300
+    assert cache.fetch('newsletter', loader)[0] == revision
+    assert loader.calls == 2
+
+    clock.now += 300
+    new_revision, df = cache.fetch('newsletter', loader)
+    assert df['Total_Received'].tolist() == [1, 99]
+    assert new_revision != revision
+    assert cache.revision('newsletter') == new_revision
+    # Den forrige revisions data er ryddet op
+    assert backend.get(f"data:newsletter:{revision}") is None
+
+
+def test_replikaer_deler_hentningen():
+    clock = FakeClock()
+    backend = MemoryCacheBackend()
+    loader = CountingLoader(frame(5))
+
+    SharedDatasetCache(backend, clock=clock).fetch('flows', loader)
+    _, other = SharedDatasetCache(backend, clock=clock).fetch('flows', loader)
+
+    assert loader.calls == 1
+    assert other['Total_Received'].tolist() == [5]
+
+
+def test_revision_foelger_vaerdien_og_ikke_meta():
+    """En anden replika flytter meta til en ny revision, mens vi stadig har den gamle frame"""
+    clock = FakeClock()
+    backend = MemoryCacheBackend()
+    ours, other = SharedDatasetCache(backend, clock=clock), SharedDatasetCache(backend, clock=clock)
+    aggregate = MaterializedAggregate(['Country'], ['Total_Received'])
+
+    revision, df = ours.fetch('newsletter', CountingLoader(frame(10)))
+    clock.now += 300
+    other.fetch('newsletter', CountingLoader(frame(99)))
+    assert backend.get('meta:newsletter') is not None and ours.revision('newsletter') != revision
+
+    # Aggregatet bygges af den frame vi har, under dens egen revision
+    aggregate.refresh(revision, df)
+    assert aggregate.frame['Total_Received'].tolist() == [10]
+    # Næste kørsel får den nye frame og revision, og aggregatet følger med
+    aggregate.refresh(*ours.fetch('newsletter', CountingLoader(frame(1))))
+    assert aggregate.frame['Total_Received'].tolist() == [99]
+
+
+def test_tuple_af_frames_og_pickle_vaerdier():
+    cache = SharedDatasetCache(MemoryCacheBackend(), clock=FakeClock())
+    _, (full, light) = cache.fetch('subscribers', lambda: (frame(1), frame(2, 3)))
+    assert (full['Total_Received'].tolist(), light['Total_Received'].tolist()) == ([1], [2, 3])
+    assert cache.fetch('settings', lambda: {'countries': ['DK']})[1] == {'countries': ['DK']}
+
+
+def test_fil_cache_deler_frames_read_only(tmp_path):
+    cache = SharedDatasetCache(FileCacheBackend(str(tmp_path)), clock=FakeClock())
+    _, shared = cache.fetch('newsletter', lambda: frame(1, 2))
+    with pytest.raises(ValueError):
+        shared.loc[0, 'Total_Received'] = 5
+    # Udsnit og kopier er sessionens egne og kan ændres
+    own = shared[shared['Total_Received'] > 1]
+    own['Total_Received'] = 0
+    copied = shared.copy()
+    copied.loc[0, 'Total_Received'] = 5
+    assert cache.fetch('newsletter', lambda: frame(9))[1]['Total_Received'].tolist() == [1, 2]
+
+
+def test_fallback_til_seneste_gode_data_ved_deadline():
+    clock = FakeClock()
+    cache = SharedDatasetCache(MemoryCacheBackend(), clock=clock, fallback_errors=(DeadlineExceeded,))
+    loader = CountingLoader(frame(7))
+    revision, _ = cache.fetch('newsletter', loader)
+
+    clock.now += 300
+    loader.fail = True
+    fallback_revision, df = cache.fetch('newsletter', loader)
+    assert df['Total_Received'].tolist() == [7]
+    assert fallback_revision == revision
+    # Vinduet er forlænget med de gamle data, så der ikke prøves igen med det samme
+    cache.fetch('newsletter', loader)
+    assert loader.calls == 2
+
+
+def test_fallback_uden_tidligere_data_kaster_fejlen():
+    cache = SharedDatasetCache(MemoryCacheBackend(), clock=FakeClock(), fallback_errors=(DeadlineExceeded,))
+    loader = CountingLoader()
+    loader.fail = True
+    with pytest.raises(DeadlineExceeded):
+        cache.fetch('newsletter', loader)
+
+
+def test_andre_fejl_giver_ikke_fallback():
+    cache = SharedDatasetCache(MemoryCacheBackend(), clock=FakeClock(), fallback_errors=(DeadlineExceeded,))
+
+    def loader():
+        raise KeyError('All_Flow')
+
+    with pytest.raises(KeyError):
+        cache.fetch('flows', loader)
+
+
+# --- Låsning ---
+def test_kold_cache_venter_paa_laasen_i_stedet_for_at_hente_selv():
+    clock = FakeClock()
+    backend = MemoryCacheBackend()
+    cache = SharedDatasetCache(backend, lock_timeout=0.05, clock=clock)
+    loader = CountingLoader(frame(1))
+
+    # En anden replika henter datasættet og holder låsen imens
+    assert backend.acquire('flows', 1)
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(cache.fetch('flows', loader)))
+    waiter.start()
+    time.sleep(0.3)
+    assert waiter.is_alive()
+    SharedDatasetCache(backend, clock=clock)._store('flows', cache.epoch(), frame(42))
+    backend.release('flows')
+    waiter.join(timeout=5)
+
+    assert loader.calls == 0
+    assert result[0][1]['Total_Received'].tolist() == [42]
+
+
+def test_laast_med_gamle_data_serverer_dem_uden_at_hente():
+    clock = FakeClock()
+    backend = MemoryCacheBackend()
+    cache = SharedDatasetCache(backend, lock_timeout=0.05, clock=clock)
+    loader = CountingLoader(frame(1), frame(2))
+    cache.fetch('flows', loader)
+
+    clock.now += 300
+    assert backend.acquire('flows', 1)
+    try:
+        assert cache.fetch('flows', loader)[1]['Total_Received'].tolist() == [1]
+    finally:
+        backend.release('flows')
+    assert loader.calls == 1
+
+
+def test_fil_laas_er_eksklusiv_og_kun_ejeren_slipper_den(tmp_path):
+    backend = FileCacheBackend(str(tmp_path), poll_interval=0.01)
+    assert backend.acquire('newsletter', 1)
+
+    other = []
+    thread = threading.Thread(target=lambda: (other.append(backend.acquire('newsletter', 0.1)), backend.release('newsletter')))
+    thread.start()
+    thread.join()
+    # Den anden tråd fik ikke låsen, og dens release slap ikke vores
+    assert other == [False]
+    assert not FileCacheBackend(str(tmp_path)).acquire('newsletter', 0.1)
+
+    backend.release('newsletter')
+    assert backend.acquire('newsletter', 1)
+    backend.release('newsletter')
+
+
+def test_fil_laas_holdes_under_lang_hentning_og_slippes_naar_processen_doer(tmp_path):
+    holder = subprocess.Popen([sys.executable, '-c', (
+        "import sys, time; sys.path[:0] = sys.argv[1:2]\n"
+        "from data_cache import FileCacheBackend\n"
+        f"assert FileCacheBackend({str(tmp_path)!r}).acquire('flows', 5)\n"
+        "print('locked', flush=True); time.sleep(1.0)\n"
+    ), ROOT], stdout=subprocess.PIPE, text=True)
+    assert holder.stdout.readline().strip() == 'locked'
+
+    backend = FileCacheBackend(str(tmp_path), poll_interval=0.01)
+    # Ingen forældelse af låsen mens den anden proces henter
+    assert not backend.acquire('flows', 0.3)
+    # Processen slutter uden release: kernen slipper låsen
+    assert backend.acquire('flows', 5)
+    backend.release('flows')
+    holder.wait()
@@ -0,0 +1,89 @@
+"""Tests af månedsarkivet (history_archive.py) mod den falske gspread backend"""
+import datetime
+
+import os
+
+import pandas as pd
+import pyarrow.compute as pc
+
+from fake_sheets import FakeSheetsClient
+from history_archive import MonthArchive, month_range, normalize_month
+
+HEADER = [['Year_Month', 'Total']]
+
+
+class Clock:
+    def __init__(self, day):
+        self.now = datetime.datetime.combine(day, datetime.time(12)).timestamp()
+
+    def __call__(self):
+        return self.now
+
+
+def parse(all_values):
+    return pd.DataFrame(all_values[1:], columns=['Year_Month', 'Total']).astype({'Total': int})
+
+
+def sync(archive, rows):
+    worksheet = FakeSheetsClient({'flows': {'All_Flow': HEADER + rows}}).open_by_url('flows').worksheet('All_Flow')
+    return archive.sync('flows', worksheet, 1, lambda row: row[0], parse, lambda df: df['Year_Month'].map(normalize_month))
+
+
+def make_archive(tmp_path, clock):
+    return MonthArchive(str(tmp_path), open_months=1, full_resync_hours=24, clock=clock)
+
+
+def test_uaendret_arkiv_beholder_revision_og_ny_lukket_maaned_skifter_den(tmp_path):
+    clock = Clock(datetime.date(2025, 3, 15))
+    archive = make_archive(tmp_path, clock)
+    rows = [['2025-1', '10'], ['2025-2', '20'], ['2025-3', '30']]
+
+    open_df = sync(archive, rows)
+    revision = archive.revision('flows')
+    assert open_df['Total'].tolist() == [30]
+    assert archive.read('flows')['Total'].tolist() == [10, 20]
+
+    clock.now += 3600
+    sync(archive, rows + [['2025-3', '31']])
+    assert archive.revision('flows') == revision
+
+    # Marts lukker: arkivet får en ny partition og en ny revision
+    clock.now = Clock(datetime.date(2025, 4, 2)).now
+    sync(archive, rows + [['2025-3', '31'], ['2025-4', '40']])
+    assert archive.months('flows') == ['2025-01', '2025-02', '2025-03']
+    assert archive.revision('flows') != revision
+
+
+def test_fuld_gensynkronisering_der_skriver_lukket_maaned_om_skifter_revision(tmp_path):
+    clock = Clock(datetime.date(2025, 3, 15))
+    archive = make_archive(tmp_path, clock)
+    sync(archive, [['2025-1', '10'], ['2025-2', '20'], ['2025-3', '30']])
+    revision = archive.revision('flows')
+
+    # Samme indhold ved fuld gen-synkronisering: samme revision
+    clock.now += 25 * 3600
+    sync(archive, [['2025-1', '10'], ['2025-2', '20'], ['2025-3', '30']])
+    assert archive.revision('flows') == revision
+
+    # Januar er rettet i arket; de åbne rækker er uændrede
+    clock.now += 25 * 3600
+    open_df = sync(archive, [['2025-1', '99'], ['2025-2', '20'], ['2025-3', '30']])
+    assert open_df['Total'].tolist() == [30]
+    assert archive.revision('flows') != revision
+    assert archive.read('flows', months=['2025-01'])['Total'].tolist() == [99]
+
+
+def test_read_aabner_kun_de_valgte_maaneder_og_beskaerer_i_arrow(tmp_path):
+    archive = make_archive(tmp_path, Clock(datetime.date(2025, 4, 15)))
+    sync(archive, [['2025-1', '10'], ['2025-2', '20'], ['2025-2', '21'], ['2025-3', '30'], ['2025-4', '40']])
+
+    # Januar åbnes ikke, når den ikke er valgt
+    os.remove(os.path.join(str(tmp_path), 'flows', '2025-01.arrow'))
+    assert archive.read('flows', months=['2025-2', '2025-3'])['Total'].tolist() == [20, 21, 30]
+    assert archive.read('flows', months=month_range('2025-02-10', '2025-03-01'), where=pc.field('Total') > 20)['Total'].tolist() == [21, 30]
+    assert archive.read('flows', months=[]).empty
+
+
+def test_month_range():
+    assert month_range(datetime.date(2024, 11, 20), datetime.date(2025, 2, 1)) == ['2024-11', '2024-12', '2025-01', '2025-02']
+    assert month_range(datetime.date(2025, 2, 1), datetime.date(2025, 1, 1)) == []
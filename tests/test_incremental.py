@@ -0,0 +1,69 @@
+"""Tests af de inkrementelle aggregater (incremental.py) mod fuld genberegning"""
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from incremental import ChangeSet, MaterializedAggregate
+
+KEYS = ['Year_Month', 'Country']
+MEASURES = ['Received', 'Opens']
+
+
+def data(rng, rows):
+    return pd.DataFrame({
+        'Year_Month': rng.choice(['2025-1', '2025-2', '2025-3'], rows),
+        'Country': rng.choice(['DK', 'SE', 'NO', 'FI'], rows),
+        'Received': rng.integers(0, 1000, rows),
+        'Opens': rng.integers(0, 300, rows),
+    })
+
+
+def groups(df):
+    return set(df.groupby(KEYS).groups)
+
+
+def test_inkrementel_opdatering_svarer_til_rebuild():
+    rng = np.random.default_rng(7)
+    aggregate = MaterializedAggregate(KEYS, MEASURES)
+    df = data(rng, 200)
+    aggregate.refresh('r0', df)
+
+    for step in range(1, 30):
+        before = df
+        edit = step % 3
+        if edit == 0:
+            # Nye rækker - også i grupper der ikke fandtes
+            added = data(rng, 5).assign(Country=rng.choice(['DK', 'UK'], 5))
+            df = pd.concat([df, added], ignore_index=True)
+        elif edit == 1:
+            df = df.copy()
+            rows = rng.choice(len(df), 5, replace=False)
+            df.loc[rows, 'Received'] = rng.integers(0, 1000, 5)
+        else:
+            # Sletninger - hver gang med mindst én hel gruppe
+            group = tuple(df.iloc[rng.integers(len(df))][KEYS])
+            keep = ~(df[KEYS].apply(tuple, axis=1) == group)
+            keep[rng.choice(len(df), 5, replace=False)] = False
+            df = df[keep].reset_index(drop=True)
+
+        changes = aggregate.refresh(f"r{step}", df).changes
+
+        assert_frame_equal(aggregate.frame, aggregate.rebuild(df).reset_index(drop=True))
+        assert changes.inserted == groups(df) - groups(before)
+        assert changes.deleted == groups(before) - groups(df)
+        assert changes.updated <= groups(df) & groups(before)
+
+
+def test_verify_afvigelse_giver_fuld_genberegning_uden_change_set():
+    rng = np.random.default_rng(1)
+    aggregate = MaterializedAggregate(KEYS, MEASURES, verify=True)
+    df = data(rng, 50)
+    assert aggregate.refresh('r1', df).changes == ChangeSet(groups(df), set(), set())
+
+    # Et forkert tal i en gruppe som næste opdatering ikke rører
+    aggregate._frame.iloc[0, aggregate._frame.columns.get_loc('Received')] += 1
+    changed = df.copy()
+    changed.loc[changed[KEYS].apply(tuple, axis=1) != tuple(aggregate._frame.iloc[0][KEYS]), 'Opens'] += 1
+
+    assert aggregate.refresh('r2', changed).changes is None
+    assert_frame_equal(aggregate.frame, aggregate.rebuild(changed).reset_index(drop=True))
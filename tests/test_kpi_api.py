@@ -0,0 +1,60 @@
+"""Tests af KPI API'ets fejlsvar (kpi_api.py) mod den falske gspread backend"""
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from data_cache import MemoryCacheBackend, SharedDatasetCache
+from fake_sheets import FakeSheetsClient
+from kpi_api import KpiRequestHandler, KpiStore
+
+URLS = {'spreadsheet': 'newsletter', 'flows_spreadsheet': 'flows', 'subscribers_spreadsheet': 'subscribers'}
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(client):
+        store = KpiStore(SharedDatasetCache(MemoryCacheBackend()), client, URLS)
+        handler = type('Handler', (KpiRequestHandler,), {'store': store})
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_fejl_fra_sheets_giver_500_med_json(serve):
+    base = serve(FakeSheetsClient({}, failures=[403]))
+    status, body = get(f"{base}/flows?month=2025-11")
+    assert status == 500
+    assert body == {'error': "Intern fejl: FakeAPIError"}
+
+
+def test_fejl_i_data_giver_500_med_json(serve):
+    # Arket findes ikke i den falske backend (KeyError i hentningen)
+    status, body = get(f"{serve(FakeSheetsClient({'flows': {}}))}/flows")
+    assert status == 500
+    assert 'error' in body
+
+
+def test_health_og_ukendt_endpoint(serve):
+    base = serve(FakeSheetsClient({}))
+    assert get(f"{base}/health") == (200, {'status': 'ok'})
+    assert get(f"{base}/ukendt")[0] == 404
@@ -0,0 +1,64 @@
+"""Tests af registret og Prometheus-eksporten (metrics.py)"""
+from metrics import ActiveSessions, Registry, render_text
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_render_text_i_prometheus_format():
+    registry = Registry()
+    checks = registry.counter('auth_checks_total', "Login-tjek\nfordelt på udfald", ['result'])
+    checks.inc(result='session')
+    checks.inc(2, result='session')
+    checks.inc(result='de"n\\ied\n')
+    tabs = registry.histogram('tab_seconds', "Tid pr. tab", ['tab'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        tabs.observe(value, tab='Flows')
+    registry.gauge('cache_bytes', "Bytes i cachen", ['cache'], function=lambda: [({'cache': 'results'}, 2048)])
+
+    assert render_text(registry) == (
+        '# HELP auth_checks_total Login-tjek\\nfordelt på udfald\n'
+        '# TYPE auth_checks_total counter\n'
+        'auth_checks_total{result="session"} 3.0\n'
+        'auth_checks_total{result="de\\"n\\\\ied\\n"} 1.0\n'
+        '# HELP tab_seconds Tid pr. tab\n'
+        '# TYPE tab_seconds histogram\n'
+        'tab_seconds_bucket{tab="Flows",le="0.1"} 1\n'
+        'tab_seconds_bucket{tab="Flows",le="1.0"} 3\n'
+        'tab_seconds_bucket{tab="Flows",le="+Inf"} 4\n'
+        'tab_seconds_sum{tab="Flows"} 4.25\n'
+        'tab_seconds_count{tab="Flows"} 4\n'
+        '# HELP cache_bytes Bytes i cachen\n'
+        '# TYPE cache_bytes gauge\n'
+        'cache_bytes{cache="results"} 2048\n'
+    )
+
+
+def test_ny_funktion_erstatter_den_gamle_for_samme_navn():
+    registry = Registry()
+    registry.gauge('entries', "Antal", function=lambda: [({}, 1)])
+    registry.gauge('entries', "Antal", function=lambda: [({}, 2)])
+    assert render_text(registry).splitlines()[-1] == 'entries 2'
+
+
+def test_aktive_sessioner_inden_for_vinduet():
+    clock = FakeClock()
+    sessions = ActiveSessions(window=300, clock=clock)
+    sessions.touch('a')
+    clock.now += 200
+    sessions.touch('b')
+    assert sessions.count() == 2
+
+    # a blev sidst set for 350 s siden, b for 150 s siden
+    clock.now += 150
+    assert sessions.count() == 1
+    sessions.touch('a')
+    clock.now += 200
+    assert sessions.count() == 1
+    clock.now += 101
+    assert sessions.count() == 0
@@ -0,0 +1,56 @@
+"""Tests af indlæsning i bidder og sider (parallel_ingest.py) mod seriel parse"""
+import pytest
+from pandas.testing import assert_frame_equal
+
+from fake_sheets import FakeSheetsClient, synthetic_flow_values
+from parallel_ingest import ParallelIngest, StreamingIngest
+from pipeline import parse_flows_values
+
+URL = 'flows'
+ROWS = 300
+CHUNK_ROWS = 70
+# Arkets gitter er større end dataene - de sidste rækker er tomme
+EXTRA_ROWS = 45
+
+
+def ragged_values():
+    values = synthetic_flow_values(ROWS, seed=3)
+    # Korte rækker: Sheets udelader tomme celler sidst i rækken. Hele den sidste
+    # bid/side er kort og skal fyldes op til arkets bredde.
+    last_chunk = 2 + ROWS // CHUNK_ROWS * CHUNK_ROWS
+    for i in [2, 2 + 5, 2 + CHUNK_ROWS] + list(range(last_chunk, len(values))):
+        values[i] = values[i][:40]
+    return values
+
+
+@pytest.fixture
+def worksheet(monkeypatch):
+    values = ragged_values()
+    sheet = FakeSheetsClient({URL: {'All_Flow': values}}).open_by_url(URL).sheet1
+    monkeypatch.setattr(type(sheet), 'row_count', property(lambda self: len(values) + EXTRA_ROWS))
+    return sheet
+
+
+@pytest.fixture(scope='module')
+def pool():
+    ingest = ParallelIngest(2, chunk_rows=CHUNK_ROWS, min_rows=1)
+    yield ingest
+    ingest.shutdown()
+
+
+def serial(worksheet):
+    return parse_flows_values(worksheet.get_all_values())
+
+
+def test_pool_giver_samme_frame_som_seriel_parse(worksheet, pool):
+    assert_frame_equal(pool.load(worksheet, parse_flows_values), serial(worksheet))
+
+
+def test_sidevis_hentning_giver_samme_frame_som_seriel_parse(worksheet):
+    ingest = StreamingIngest(page_rows=CHUNK_ROWS)
+    assert_frame_equal(ingest.load(worksheet, parse_flows_values), serial(worksheet))
+
+
+def test_sidevis_hentning_med_pool_giver_samme_frame_som_seriel_parse(worksheet, pool):
+    ingest = StreamingIngest(page_rows=CHUNK_ROWS, parallel=pool)
+    assert_frame_equal(ingest.load(worksheet, parse_flows_values), serial(worksheet))
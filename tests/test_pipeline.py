@@ -0,0 +1,102 @@
+"""Tests af datalaget uden Streamlit (pipeline.py)"""
+import re
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from pipeline import (
+    FLOW_LEVEL_MEASURES, FlowSortKeys, add_rates, build_flow_index, flow_drilldown, flow_number, month_key, open_client,
+)
+
+URL = "https://docs.google.com/spreadsheets/d/abc123/edit"
+
+
+def test_local_source_laeser_mappen_for_spreadsheet_url(tmp_path):
+    (tmp_path / 'flows').mkdir()
+    (tmp_path / 'flows' / 'All_Flow.csv').write_text("Year_Month,Flow\n2025-1,Flow 1\n", encoding='utf-8')
+
+    gc = open_client({'local_source': str(tmp_path), 'flows_spreadsheet': URL})
+
+    assert gc.open_by_url(URL).worksheet('All_Flow').get_all_values() == [['Year_Month', 'Flow'], ['2025-1', 'Flow 1']]
+    # Mappenavnet virker stadig direkte som "URL"
+    assert gc.open_by_url('flows').sheet1.title == 'All_Flow'
+
+
+def flow_rows(rows):
+    """(Year_Month, Flow_Trigger, Country, Mail, Received_Email) -> rækker som i den parsede Flows frame"""
+    df = pd.DataFrame(rows, columns=['Year_Month', 'Flow_Trigger', 'Country', 'Mail', 'Received_Email'])
+    return df.assign(
+        Group='G', Message='Msg', AB='', Total_Opens=df['Received_Email'] // 2, Unique_Opens=df['Received_Email'] // 4,
+        Total_Clicks=df['Received_Email'] // 10, Unique_Clicks=df['Received_Email'] // 20, Unsubscribed=1, Bounced=0,
+    )
+
+
+def test_drilldown_samler_aabne_og_arkiverede_maaneder_og_filtrerer():
+    welcome, cart = 'Flow 1 - Welcome', 'Flow 2 - Cart'
+    open_df = flow_rows([
+        ('2025-12', welcome, 'DK', 'Mail 1', 100),
+        ('2025-12', welcome, 'SE', 'Mail 2', 200),
+        ('2025-12', cart, 'DK', 'Mail 1', 400),
+        ('2025-11', welcome, 'DK', 'Mail 1', 800),
+        ('2025-11', welcome, 'NO', 'Mail 1', 1600),
+    ])
+    archived = flow_rows([
+        ('2025-9', welcome, 'DK', 'Mail 1', 10),
+        ('2025-9', welcome, 'DK', 'Mail 3', 20),
+        ('2025-8', welcome, 'DK', 'Mail 1', 40),
+    ])
+    months, countries = ['2025-12', '2025-11', '2025-9'], ['DK', 'SE']
+
+    detail = flow_drilldown(open_df, build_flow_index(open_df), welcome, months, countries, archived)
+
+    everything = pd.concat([archived, open_df], ignore_index=True)
+    rows = everything[
+        (everything['Flow_Trigger'] == welcome) & everything['Year_Month'].isin(months) & everything['Country'].isin(countries)
+    ]
+    expected = add_rates(
+        rows.groupby(['Group', 'Mail', 'Message', 'AB'], as_index=False, sort=False)[FLOW_LEVEL_MEASURES].sum(),
+        'Received_Email',
+    )
+    assert_frame_equal(detail, expected)
+    assert dict(zip(detail['Mail'], detail['Received_Email'])) == {'Mail 1': 10 + 100 + 800, 'Mail 3': 20, 'Mail 2': 200}
+
+
+def test_drilldown_for_flow_kun_i_arkivet_eller_ukendt_flow():
+    open_df = flow_rows([('2025-12', 'Flow 2 - Cart', 'DK', 'Mail 1', 400)])
+    archived = flow_rows([('2025-9', 'Flow 1 - Welcome', 'DK', 'Mail 1', 10)])
+    index = build_flow_index(open_df)
+
+    detail = flow_drilldown(open_df, index, 'Flow 1 - Welcome', ['2025-9'], ['DK'], archived)
+    assert detail['Received_Email'].tolist() == [10]
+    assert flow_drilldown(open_df, index, 'Flow 9 - Ukendt', ['2025-12'], ['DK']).empty
+
+
+# Sorteringen som tabben tidligere lavede ved hver visning
+def old_month_key(m):
+    parts = m.split('-')
+    return int(parts[0]) * 100 + int(parts[1])
+
+
+def old_flow_key(f):
+    match = re.search(r'Flow\s*(\d+)', f)
+    return int(match.group(1)) if match else 999
+
+
+MONTHS = ['2025-9', '2025-10', '2024-12', '2025-1', '2025-10', '2025-11', '2024-2']
+FLOWS = ['Flow 10 - Cart', 'Flow 2 - Welcome', 'Winback - Mail', 'Flow 1 - Welcome', 'Flow12 - Birthday', 'Flow 2 - Welcome', 'Other']
+
+
+def test_sorteringsnoegler_svarer_til_den_gamle_sortering():
+    years_months = pd.Series(MONTHS)
+    flows = pd.Series(FLOWS)
+    assert month_key(years_months).tolist() == [old_month_key(m) for m in MONTHS]
+    assert flow_number(flows).tolist() == [old_flow_key(f) for f in FLOWS]
+
+    df = pd.DataFrame({'Year_Month': MONTHS, 'Flow_Trigger': FLOWS})
+    for frame in (df.assign(Flow_Num=flow_number(flows), Month_Key=month_key(years_months)), df):
+        keys = FlowSortKeys(frame)
+        # 2025-9 før 2025-10 (nyeste først: 2025-11, 2025-10, 2025-9, ...)
+        assert keys.months == sorted(set(MONTHS), key=old_month_key, reverse=True)
+        assert keys.months[:3] == ['2025-11', '2025-10', '2025-9']
+        unique_flows = list(dict.fromkeys(FLOWS))
+        assert keys.sort_flows(unique_flows) == sorted(unique_flows, key=old_flow_key)
@@ -0,0 +1,73 @@
+"""Tests af LRU'en til filterresultater (result_cache.py)"""
+import datetime
+import sys
+
+import numpy as np
+import pandas as pd
+
+from result_cache import ResultCache, measure, normalize
+
+
+def frame(value):
+    return pd.DataFrame({'Country': ['DK', 'SE'], 'Total_Received': [value, value]})
+
+
+def test_lru_smider_den_mindst_brugte_ud_inden_for_budgettet():
+    size = measure(frame(0))
+    cache = ResultCache(max_bytes=3 * size)
+    for key in 'abc':
+        cache.put(key, frame(1))
+    assert cache.get('a')[0]        # a er nu senest brugt
+    cache.put('d', frame(1))
+
+    assert [key for key in 'abcd' if cache.get(key)[0]] == ['a', 'c', 'd']
+    assert cache.stats() == {
+        'entries': 3, 'bytes': 3 * size, 'max_bytes': 3 * size, 'hits': 4, 'misses': 1, 'evictions': 1,
+    }
+
+
+def test_for_stor_vaerdi_gemmes_ikke_og_ny_vaerdi_erstatter_gammel():
+    size = measure(frame(0))
+    cache = ResultCache(max_bytes=2 * size)
+    cache.put('a', frame(1))
+    cache.put('a', frame(2))
+    assert cache.stats()['bytes'] == size
+    assert cache.get('a')[1]['Total_Received'].tolist() == [2, 2]
+
+    cache.put('big', pd.concat([frame(1)] * 10))
+    assert cache.get('big') == (False, None)
+    assert cache.stats()['evictions'] == 0
+
+
+def test_get_or_compute_taeller_hits_og_misses():
+    cache = ResultCache()
+    calls = []
+    for _ in range(3):
+        cache.get_or_compute('k', lambda: calls.append(1) or frame(1))
+    assert len(calls) == 1
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (2, 1)
+
+
+def test_normalize_er_uafhaengig_af_raekkefoelge_og_typer():
+    assert normalize(['SE', 'DK']) == normalize(['DK', 'SE']) == normalize({'SE', 'DK'}) == ('DK', 'SE')
+    assert normalize({'b': [2, 1], 'a': None}) == (('a', None), ('b', (1, 2)))
+    # Tupler er positionelle (fx start- og slutdato) og sorteres ikke
+    assert normalize((datetime.date(2025, 2, 1), datetime.date(2025, 1, 1))) == ('2025-02-01T00:00:00', '2025-01-01T00:00:00')
+    assert normalize(pd.Timestamp('2025-01-01')) == normalize(datetime.date(2025, 1, 1))
+    assert normalize(np.int64(3)) == 3 and type(normalize(np.int64(3))) is int
+    assert hash(normalize((['DK'], {'months': ['2025-1']}, None)))
+
+
+def test_measure_taeller_indholdet_af_beholdere():
+    options = [f"Kampagne {i:04d} med et langt navn" for i in range(500)]
+    strings = sum(sys.getsizeof(option) for option in options)
+
+    assert measure(options) > strings
+    pair = (options, options[:10])
+    assert measure(pair) == sys.getsizeof(pair) + measure(options) + measure(options[:10])
+    assert measure({'countries': options}) > strings
+    assert measure(set(options)) > strings
+    assert measure(np.array(options, dtype=object)) > strings
+    # Et view ejer ikke sine data, men fylder dem stadig i resultatet
+    values = np.zeros(1000)
+    assert measure(values[:500]) > values[:500].nbytes
@@ -0,0 +1,80 @@
+"""Tests af tidshierarkiet (rollups.py) mod et direkte datofilter"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import NEWSLETTER_MEASURES
+from rollups import NewsletterRollups, decompose
+
+FIRST, LAST = pd.Timestamp('2024-11-01'), pd.Timestamp('2026-02-28')
+
+
+@pytest.fixture(scope='module')
+def newsletters():
+    rng = np.random.default_rng(3)
+    rows = 4000
+    df = pd.DataFrame({
+        'Date': FIRST + pd.to_timedelta(rng.integers(0, (LAST - FIRST).days + 1, rows), unit='D'),
+        'Country': rng.choice(['DK', 'SE', 'NO'], rows),
+        'ID_Campaign': rng.choice(['C1', 'C2', 'C3', 'C4'], rows),
+    })
+    for measure in NEWSLETTER_MEASURES:
+        df[measure] = rng.integers(0, 1000, rows)
+    return df
+
+
+def edge_dates():
+    """Første og sidste dag i hver måned/kvartal samt dagene lige ved siden af"""
+    starts = pd.date_range(FIRST, LAST, freq='MS')
+    ends = starts + pd.offsets.MonthEnd(0)
+    return sorted({d for edge in list(starts) + list(ends) for d in (edge - pd.Timedelta(days=1), edge, edge + pd.Timedelta(days=1))})
+
+
+def date_ranges():
+    rng = np.random.default_rng(9)
+    edges = edge_dates()
+    ranges = [
+        ('2025-01-01', '2025-12-31'),   # helt år = fire kvartaler
+        ('2025-04-01', '2025-06-30'),   # ét kvartal
+        ('2025-02-01', '2025-02-28'),   # én måned
+        ('2025-03-31', '2025-07-01'),   # en dag på hver side af et kvartal
+        ('2024-12-15', '2025-01-15'),   # over et årsskifte
+        ('2025-05-10', '2025-05-10'),   # én dag
+        ('2025-05-10', '2025-05-09'),   # tomt interval
+    ]
+    for _ in range(150):
+        start, end = sorted(rng.choice(len(edges), 2))
+        ranges.append((edges[start], edges[end]))
+    for _ in range(50):
+        start = FIRST + pd.Timedelta(days=int(rng.integers(0, 400)))
+        ranges.append((start, start + pd.Timedelta(days=int(rng.integers(0, 200)))))
+    return ranges
+
+
+def test_decompose_daekker_hver_dag_praecis_en_gang():
+    for start, end in date_ranges():
+        buckets, days = decompose(start, end)
+        covered = []
+        for level, bucket in buckets:
+            period = pd.Period(bucket, 'Q' if level == 'quarter' else 'M')
+            assert bucket == period.start_time
+            covered += list(pd.date_range(period.start_time, period.end_time.normalize()))
+        for first, last in days:
+            covered += list(pd.date_range(first, last))
+        assert sorted(covered) == list(pd.date_range(start, end))
+
+
+def test_select_svarer_til_direkte_datofilter(newsletters):
+    rollups = NewsletterRollups(newsletters)
+    for i, (start, end) in enumerate(date_ranges()):
+        countries = None if i % 2 else ['DK', 'NO']
+        campaigns = None if i % 3 else ['C2']
+        direct = newsletters[newsletters['Date'].between(pd.Timestamp(start), pd.Timestamp(end))]
+        if countries is not None:
+            direct = direct[direct['Country'].isin(countries)]
+        if campaigns is not None:
+            direct = direct[direct['ID_Campaign'].isin(campaigns)]
+
+        totals = rollups.totals(start, end, countries, campaigns)
+
+        assert totals.tolist() == direct[NEWSLETTER_MEASURES].sum().tolist(), (start, end)
@@ -0,0 +1,38 @@
+"""Tests af de gemte visninger (saved_views.py)"""
+import os
+import subprocess
+import sys
+
+from saved_views import APP_DIR, SavedViews, saved_views_from_config
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PROCESSES = 4
+VIEWS = 25
+
+
+def test_gem_normaliserer_og_slet_fjerner(tmp_path):
+    views = SavedViews(str(tmp_path / 'views.json'))
+    views.save('flows', 'Nordic', {'countries': ['SE', 'DK', 'DK'], 'months': None})
+    assert views.get('flows', 'Nordic') == {'countries': ['DK', 'SE'], 'months': None}
+    views.delete('flows', 'Nordic')
+    assert views.names('flows') == []
+
+
+def test_samtidige_replikaer_mister_ikke_hinandens_visninger(tmp_path):
+    path = str(tmp_path / 'views.json')
+    script = (
+        "import sys\n"
+        f"sys.path.insert(0, {ROOT!r})\n"
+        "from saved_views import SavedViews\n"
+        f"views = SavedViews({path!r})\n"
+        f"for i in range({VIEWS}):\n"
+        "    views.save('newsletters', f'{sys.argv[1]}-{i}', {'countries': None})\n"
+    )
+    writers = [subprocess.Popen([sys.executable, '-c', script, str(p)]) for p in range(PROCESSES)]
+    assert [writer.wait(timeout=60) for writer in writers] == [0] * PROCESSES
+    assert len(SavedViews(path).names('newsletters')) == PROCESSES * VIEWS
+
+
+def test_standardsti_ligger_i_app_mappen():
+    assert saved_views_from_config({}).path == os.path.join(APP_DIR, 'data', 'saved_views.json')
+    assert saved_views_from_config({'path': '/srv/views.json'}).path == '/srv/views.json'
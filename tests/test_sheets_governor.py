@@ -0,0 +1,128 @@
+"""
+Tests af kvote-styringen (sheets_governor.py) mod den falske gspread backend
+(fake_sheets.py), med falsk ur og sleep - ingen rigtige ventetider
+"""
+import pandas as pd
+import pytest
+
+from data_cache import MemoryCacheBackend, SharedDatasetCache
+from fake_sheets import FakeAPIError, FakeSheetsClient
+from sheets_governor import DeadlineExceeded, GovernedClient, SheetsGovernor, TokenBucket
+
+SPREADSHEETS = {'flows': {'All_Flow': [['Header'], ['Header'], ['2025-1', 'Flow 1']]}}
+
+
+class FakeTime:
+    """Ur og sleep: sleep flytter uret frem og husker ventetiderne"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_governor(fake_time, rate_per_minute=600, **kwargs):
+    bucket = TokenBucket(rate_per_minute, clock=fake_time.clock, sleep=fake_time.sleep)
+    # rng=1.0: ventetiden bliver den fulde eksponentielle grænse
+    return SheetsGovernor(bucket, clock=fake_time.clock, sleep=fake_time.sleep, rng=lambda: 1.0, **kwargs)
+
+
+# --- Token bucket ---
+def test_token_bucket_venter_naar_kvoten_er_brugt():
+    fake_time = FakeTime()
+    bucket = TokenBucket(60, capacity=2, clock=fake_time.clock, sleep=fake_time.sleep)
+    assert bucket.acquire() and bucket.acquire()
+    assert fake_time.sleeps == []
+
+    assert bucket.acquire()
+    # 60 pr. minut = ét token i sekundet
+    assert fake_time.sleeps == [pytest.approx(1.0)]
+
+
+def test_token_bucket_giver_op_hvis_deadline_ville_overskrides():
+    fake_time = FakeTime()
+    bucket = TokenBucket(60, capacity=1, clock=fake_time.clock, sleep=fake_time.sleep)
+    assert bucket.acquire(deadline=10)
+    assert not bucket.acquire(deadline=0.5)
+    assert fake_time.sleeps == []
+
+
+# --- Retry og deadline ---
+def test_genforsoeg_med_eksponentiel_backoff_ved_429_og_5xx():
+    fake_time = FakeTime()
+    client = FakeSheetsClient(SPREADSHEETS, failures=[429, 503, 429])
+    governed = GovernedClient(client, make_governor(fake_time, base_delay=1.0, max_delay=32.0))
+
+    rows = governed.open_by_url('flows').worksheet('All_Flow').get_all_values()
+
+    assert rows[2] == ['2025-1', 'Flow 1']
+    assert fake_time.sleeps == [1.0, 2.0, 4.0]
+    assert client.call_count('open_by_url') == 4
+
+
+def test_backoff_er_begraenset_af_max_delay():
+    fake_time = FakeTime()
+    client = FakeSheetsClient(SPREADSHEETS, failures=[500] * 5)
+    governed = GovernedClient(client, make_governor(fake_time, base_delay=1.0, max_delay=4.0, deadline=600))
+    governed.open_by_url('flows')
+    assert fake_time.sleeps == [1.0, 2.0, 4.0, 4.0, 4.0]
+
+
+def test_andre_fejl_genforsoeges_ikke():
+    fake_time = FakeTime()
+    client = FakeSheetsClient(SPREADSHEETS, failures=[404])
+    governed = GovernedClient(client, make_governor(fake_time))
+    with pytest.raises(FakeAPIError) as raised:
+        governed.open_by_url('flows')
+    assert raised.value.code == 404
+    assert client.call_count() == 1
+
+
+def test_for_mange_genforsoeg_giver_den_oprindelige_fejl():
+    fake_time = FakeTime()
+    client = FakeSheetsClient(SPREADSHEETS, failures=[429] * 10)
+    governed = GovernedClient(client, make_governor(fake_time, max_retries=2, deadline=600))
+    with pytest.raises(FakeAPIError):
+        governed.open_by_url('flows')
+    assert client.call_count() == 3
+
+
+def test_deadline_overskrides_under_backoff():
+    fake_time = FakeTime()
+    client = FakeSheetsClient(SPREADSHEETS, failures=[429] * 10)
+    governed = GovernedClient(client, make_governor(fake_time, base_delay=4.0, deadline=10))
+    with pytest.raises(DeadlineExceeded):
+        governed.open_by_url('flows')
+    # 4 + 8 sekunder ville passere deadline på 10: der ventes kun én gang
+    assert fake_time.sleeps == [4.0]
+
+
+def test_deadline_overskrides_naar_kvoten_er_brugt():
+    fake_time = FakeTime()
+    governor = make_governor(fake_time, rate_per_minute=1, deadline=30)
+    governed = GovernedClient(FakeSheetsClient(SPREADSHEETS), governor)
+    governed.open_by_url('flows')
+    with pytest.raises(DeadlineExceeded):
+        governed.open_by_url('flows')
+
+
+def test_deadline_giver_seneste_gode_data_fra_den_delte_cache():
+    fake_time = FakeTime()
+    client = FakeSheetsClient(SPREADSHEETS)
+    governed = GovernedClient(client, make_governor(fake_time, base_delay=8.0, deadline=10))
+    cache = SharedDatasetCache(MemoryCacheBackend(), ttl=300, clock=fake_time.clock, fallback_errors=(DeadlineExceeded,))
+
+    def loader():
+        rows = governed.open_by_url('flows').worksheet('All_Flow').get_all_values()
+        return pd.DataFrame(rows[2:], columns=['Year_Month', 'Flow'])
+
+    _, first = cache.fetch('flows', loader)
+    fake_time.now += 300
+    client.inject_failures(*[429] * 10)
+    assert cache.fetch('flows', loader)[1].equals(first)
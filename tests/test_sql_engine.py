@@ -0,0 +1,54 @@
+"""Tests af den indlejrede SQL-motor (sql_engine.py) mod pandas"""
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from sql_engine import SqlEngine
+
+# Flere værdier end SQLites grænse for parametre (32766)
+MANY = 40_000
+
+
+def flows():
+    return pd.DataFrame({
+        'Year_Month': ['2025-1', '2025-1', '2025-2', '2025-3'],
+        'Flow_Trigger': ['Flow 1 - Welcome'] * 4,
+        'Country': ['DK', 'DK', 'SE', 'DK'],
+        'Received_Email': [100, 50, 80, 0],
+        'Total_Opens': [60, 30, 40, 0],
+        'Unique_Opens': [50, 20, 30, 0],
+        'Total_Clicks': [12, 6, 8, 0],
+        'Unique_Clicks': [10, 5, 4, 0],
+        'Unsubscribed': [1, 0, 2, 0],
+        'Bounced': [0, 1, 0, 0],
+    })
+
+
+@pytest.mark.parametrize('kind', ['sqlite', 'duckdb'])
+def test_flow_level_med_store_lister_som_en_parameter(kind):
+    engine = SqlEngine(kind)
+    engine.ensure('flows', 'r1', lambda: pa.Table.from_pandas(flows()))
+    months = ['2025-1', '2025-2'] + [f"1999-{i}" for i in range(MANY)]
+    result = engine.flow_level(months).sort_values(['Year_Month', 'Country']).reset_index(drop=True)
+    assert result[['Year_Month', 'Country', 'Received_Email', 'Unique_Clicks']].values.tolist() == [
+        ['2025-1', 'DK', 150, 15], ['2025-2', 'SE', 80, 4],
+    ]
+    assert result['Open_Rate'].tolist() == pytest.approx([70 / 150 * 100, 30 / 80 * 100])
+
+
+@pytest.mark.parametrize('kind', ['sqlite', 'duckdb'])
+def test_ny_revision_indlaeses_og_samme_revision_genbruges(kind):
+    engine = SqlEngine(kind)
+    loads = []
+
+    def load(df):
+        loads.append(len(df))
+        return pa.Table.from_pandas(df)
+
+    engine.ensure('flows', 'r1', lambda: load(flows()))
+    engine.ensure('flows', 'r1', lambda: load(flows()))
+    assert engine.flow_level(['2025-3'])['Received_Email'].tolist() == [0]
+
+    engine.ensure('flows', 'r2', lambda: load(flows().assign(Received_Email=7)))
+    assert loads == [4, 4]
+    assert engine.flow_level(['2025-3'])['Received_Email'].tolist() == [7]
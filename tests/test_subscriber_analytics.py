@@ -0,0 +1,80 @@
+"""Tests af subscriber tidsserierne (subscriber_analytics.py)"""
+import numpy as np
+import pandas as pd
+
+from subscriber_analytics import SourceIndex, SubscriberTier
+
+
+def tier(months, totals):
+    return SubscriberTier(pd.DataFrame({'Month': pd.to_datetime(months), 'Total': totals}))
+
+
+def test_vaekst_slaas_op_paa_kalendermaaned_med_huller():
+    series = tier(['2024-01-01', '2024-02-01', '2024-04-01', '2025-02-01'], [100, 110, 130, 150])
+    mom = series.metrics['mom'][:, 0]
+    yoy = series.metrics['yoy'][:, 0]
+    assert mom[1] == 10
+    assert np.isnan(mom[2])  # Marts mangler
+    assert yoy[3] == 40
+
+
+def test_maaned_der_staar_to_gange_bruger_den_nederste_raekke():
+    series = tier(['2025-01-01', '2025-02-01', '2025-02-01', '2025-03-01'], [100, 105, 110, 120])
+    assert series.metrics['mom'][:, 0].tolist()[1:] == [5, 10, 10]
+
+
+def events():
+    rows = [
+        # (måned, master source, source, DK, SE)
+        ('2025-01-01', 'Web', 'Popup', 5, 1),
+        ('2025-01-01', 'Web', 'Popup', 2, 0),
+        ('2025-01-01', 'Web', 'Footer', 3, 3),
+        ('2025-02-01', 'Web', 'Popup', 4, 4),
+        ('2025-02-01', 'Shop', 'Checkout', 10, 0),
+        ('2025-02-01', 'Shop', 'Popup', 1, 1),
+        (None, 'Web', 'Popup', 100, 100),
+    ]
+    df = pd.DataFrame(rows, columns=['Month', 'Master Source', 'Source', 'DK', 'SE'])
+    df['Month'] = pd.to_datetime(df['Month'])
+    return df.assign(Total=df['DK'] + df['SE'])
+
+
+def test_kildeindeks_positioner_svarer_til_filtrering():
+    df = events()
+    index = SourceIndex(df)
+
+    assert index.masters == ['Shop', 'Web']
+    assert index.sources_for('Shop') == ['Checkout', 'Popup']
+    assert index.sources_for() == ['Checkout', 'Footer', 'Popup']
+    # Nyeste måned først, og samme (måned, kilde) er summeret
+    assert index.rows()[['Month', 'Source', 'DK']].values.tolist() == [
+        ['2025-02', 'Checkout', 10], ['2025-02', 'Popup', 1], ['2025-02', 'Popup', 4],
+        ['2025-01', 'Footer', 3], ['2025-01', 'Popup', 7],
+    ]
+    dated = df.dropna(subset=['Month'])
+    for master in [None, 'Web', 'Shop']:
+        for source in [None, 'Popup', 'Checkout', 'Footer']:
+            mask = pd.Series(True, index=dated.index)
+            if master is not None:
+                mask &= dated['Master Source'] == master
+            if source is not None:
+                mask &= dated['Source'] == source
+            assert index.rows(master, source)['Total'].sum() == dated.loc[mask, 'Total'].sum()
+    assert index.rows('Shop', 'Footer').empty
+
+
+def test_kildeindeks_grafserier_er_pivots_af_total():
+    index = SourceIndex(events())
+
+    assert index.series().to_dict('list') == {'Shop': [0, 12], 'Web': [14, 8]}
+    assert index.series('Web').to_dict('list') == {'Footer': [6, 0], 'Popup': [8, 8]}
+    assert index.series('Shop', 'Popup').to_dict('list') == {'Popup': [0, 2]}
+    # Samme Source under flere Master Sources lægges sammen til én serie
+    assert index.series(source='Popup').to_dict('list') == {'Popup': [8, 10]}
+    assert index.series().index.strftime('%Y-%m').tolist() == ['2025-01', '2025-02']
+
+
+def test_kildeindeks_uden_antal_er_tomt():
+    index = SourceIndex(events()[['Month', 'Master Source', 'Source']])
+    assert index.masters == [] and index.rows().empty
+    assert index.series().empty and index.series('Web').empty
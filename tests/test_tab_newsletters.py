@@ -0,0 +1,48 @@
+"""Tests af landematricen i Newsletters-tabben (tab_newsletters.py)"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import COUNTRIES
+from tab_newsletters import build_country_matrix
+
+MEASURES = ['Total_Received', 'Unique_Opens', 'Unique_Clicks', 'Unsubscribed']
+
+
+def country_rows():
+    rng = np.random.default_rng(5)
+    countries = ['SE', 'DK', 'CH', 'DK', 'FR', 'SE', 'DK', 'FR']
+    received = rng.integers(0, 1000, len(countries))
+    # FR har ingen modtagere
+    received[[i for i, country in enumerate(countries) if country == 'FR']] = 0
+    return pd.DataFrame({
+        'Country': countries,
+        'Total_Received': received,
+        'Unique_Opens': received * rng.integers(10, 60, len(countries)) // 100,
+        'Unique_Clicks': received * rng.integers(1, 10, len(countries)) // 100,
+        'Unsubscribed': rng.integers(0, 5, len(countries)),
+    })
+
+
+def test_landematrix_summerer_pr_land_med_total_og_rater():
+    country_df = country_rows()
+
+    matrix = build_country_matrix(country_df)
+
+    # Lande i COUNTRIES' rækkefølge (kun dem med rækker) og til sidst Total
+    assert matrix['Country'].tolist() == [c for c in COUNTRIES if c in set(country_df['Country'])] + ['Total']
+    expected = country_df.groupby('Country')[MEASURES].sum()
+    body = matrix.set_index('Country').drop(index='Total')
+    assert body[MEASURES].to_dict('index') == expected.to_dict('index')
+
+    total = matrix.set_index('Country').loc['Total']
+    assert total[MEASURES].tolist() == country_df[MEASURES].sum().tolist()
+
+    for country, row in matrix.set_index('Country').iterrows():
+        rows = country_df if country == 'Total' else country_df[country_df['Country'] == country]
+        received, opens, clicks = rows['Total_Received'].sum(), rows['Unique_Opens'].sum(), rows['Unique_Clicks'].sum()
+        assert row['Open_Rate'] == pytest.approx(opens / received * 100 if received else 0.0)
+        assert row['Click_Rate'] == pytest.approx(clicks / received * 100 if received else 0.0)
+        assert row['CTR'] == pytest.approx(clicks / opens * 100 if opens else 0.0)
+    # Et land uden modtagere giver 0 og ikke NaN
+    assert matrix.set_index('Country').loc['FR', ['Open_Rate', 'Click_Rate', 'CTR']].tolist() == [0.0, 0.0, 0.0]